@@ -1,5 +1,64 @@
 import os
-from django.core.asgi import get_asgi_application
+
+import django
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIHandler as DjangoASGIHandler
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "fileUpload.settings")
-application = get_asgi_application()
+
+
+class ASGIHandler(DjangoASGIHandler):
+    """
+    ASGIHandler that reads streaming responses off the event loop.
+
+    Django 4.1 iterates StreamingHttpResponse content in the event loop,
+    so a database-backed iterator such as /v1/users/export/ raises
+    SynchronousOnlyOperation, and any slow iterator stalls every other
+    request on the worker. Each part is fetched in the request's sync
+    thread instead, the thread its view ran in, so a server-side cursor
+    keeps using the connection that opened it.
+    """
+
+    async def send_response(self, response, send):
+        if not response.streaming:
+            return await super().send_response(response, send)
+
+        response_headers = []
+        for header, value in response.items():
+            if isinstance(header, str):
+                header = header.encode("ascii")
+            if isinstance(value, str):
+                value = value.encode("latin1")
+            response_headers.append((bytes(header), bytes(value)))
+        for c in response.cookies.values():
+            response_headers.append(
+                (b"Set-Cookie", c.output(header="").encode("ascii").strip())
+            )
+        await send(
+            {
+                "type": "http.response.start",
+                "status": response.status_code,
+                "headers": response_headers,
+            }
+        )
+
+        parts = iter(response)
+        next_part = sync_to_async(next, thread_sensitive=True)
+        while True:
+            part = await next_part(parts, None)
+            if part is None:
+                break
+            for chunk, _ in self.chunk_bytes(part):
+                await send(
+                    {
+                        "type": "http.response.body",
+                        "body": chunk,
+                        "more_body": True,
+                    }
+                )
+        await send({"type": "http.response.body"})
+        await sync_to_async(response.close, thread_sensitive=True)()
+
+
+django.setup(set_prefix=False)
+application = ASGIHandler()
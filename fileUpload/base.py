@@ -24,6 +24,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "user.middleware.RequestMetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -92,7 +93,42 @@ CELERY_ACCEPT_CONTENT = ["application/json"]
 CELERY_TASK_SERIALIZER = "json"
 CELERY_RESULT_SERIALIZER = "json"
 CELERYD_MAX_TASKS_PER_CHILD = 1000
+# Acknowledge tasks only once they finish, so an ingestion interrupted by
+# a worker crash is redelivered and resumes from its checkpoint
+CELERY_TASK_ACKS_LATE = True
+CELERY_TASK_REJECT_ON_WORKER_LOST = True
 CELERY_TASK_RESULT_EXPIRES = 60 * 60 * 24
+# process_uploaded_file is routed per upload by user.tasks.dispatch_upload:
+# files of INGESTION_LARGE_FILE_SIZE bytes or more go to ingest_large,
+# the rest to ingest_small, each served by its own workers. Other tasks
+# use the default celery queue.
+INGESTION_LARGE_FILE_SIZE = config(
+    "INGESTION_LARGE_FILE_SIZE", default=10 * 1024 * 1024, cast=int
+)
+CELERY_TASK_DEFAULT_QUEUE = "celery"
+# Reserve one task at a time, so a worker busy with a long file does not
+# hold others back, and upload priorities apply to every task it takes
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+# Priorities order the tasks within each queue. The queues a worker
+# consumes are still polled in turn, so the celery queue that
+# sweep_stale_uploads runs from is not starved by a busy ingest_small
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    "priority_steps": [0, 3, 6],
+    "queue_order_strategy": "round_robin",
+}
+# Uploads still pending, or processing without progress, this many
+# seconds after their last dispatch are dispatched again by the
+# sweep_stale_uploads task, which beat runs every UPLOAD_SWEEP_INTERVAL
+UPLOAD_STALE_AFTER = config("UPLOAD_STALE_AFTER", default=15 * 60, cast=int)
+UPLOAD_SWEEP_INTERVAL = config(
+    "UPLOAD_SWEEP_INTERVAL", default=5 * 60, cast=int
+)
+CELERY_BEAT_SCHEDULE = {
+    "sweep-stale-uploads": {
+        "task": "user.tasks.sweep_stale_uploads",
+        "schedule": UPLOAD_SWEEP_INTERVAL,
+    },
+}
 
 # Django FSM settings
 FSM_STATE_FIELD = "status"
@@ -111,3 +147,56 @@ SPECTACULAR_SETTINGS = {
     "SWAGGER_UI_FAVICON_HREF": "SIDECAR",
     "REDOC_DIST": "SIDECAR",
 }
+
+# Ingestion settings
+USER_DATA_BATCH_SIZE = config("USER_DATA_BATCH_SIZE", default=1000, cast=int)
+# "orm" inserts with bulk_create, "copy" streams rows through COPY FROM STDIN
+USER_DATA_LOADER = config("USER_DATA_LOADER", default="orm")
+# "icontains" searches each field with ILIKE, "fulltext" uses the GIN
+# indexed search vector on UserData
+USER_DATA_SEARCH_BACKEND = config(
+    "USER_DATA_SEARCH_BACKEND", default="icontains"
+)
+# CSV files above this size (in bytes) are split into byte ranges of
+# PARALLEL_INGESTION_CHUNK_SIZE and processed by a group of workers
+PARALLEL_INGESTION_THRESHOLD = config(
+    "PARALLEL_INGESTION_THRESHOLD", default=64 * 1024 * 1024, cast=int
+)
+PARALLEL_INGESTION_CHUNK_SIZE = config(
+    "PARALLEL_INGESTION_CHUNK_SIZE", default=16 * 1024 * 1024, cast=int
+)
+# Rows fetched per round trip by the server-side cursor behind
+# /v1/users/export/
+USER_DATA_EXPORT_CHUNK_SIZE = config(
+    "USER_DATA_EXPORT_CHUNK_SIZE", default=2000, cast=int
+)
+
+# Cache for /v1/users/ list responses. Set USER_DATA_CACHE_URL to a Redis
+# URL to share it between processes (ingestion runs in the Celery workers,
+# so only a shared cache sees their invalidations immediately); without
+# it each process keeps a local-memory cache of at most
+# USER_DATA_CACHE_MAX_ENTRIES responses. A timeout of 0 disables caching.
+USER_DATA_CACHE_URL = config("USER_DATA_CACHE_URL", default="")
+USER_DATA_CACHE_TIMEOUT = config(
+    "USER_DATA_CACHE_TIMEOUT", default=60, cast=int
+)
+USER_DATA_CACHE_MAX_ENTRIES = config(
+    "USER_DATA_CACHE_MAX_ENTRIES", default=1000, cast=int
+)
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "user_data": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": USER_DATA_CACHE_URL,
+        "KEY_PREFIX": "fileupload",
+    }
+    if USER_DATA_CACHE_URL
+    else {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "user-data",
+        "OPTIONS": {"MAX_ENTRIES": USER_DATA_CACHE_MAX_ENTRIES},
+    },
+}
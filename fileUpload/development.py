@@ -16,6 +16,14 @@ DATABASES = {
         "PASSWORD": config("DB_PASSWORD"),
         "HOST": config("DB_HOST"),
         "PORT": config("DB_PORT"),
+        # Open a connection per request unless DB_CONN_MAX_AGE opts in to
+        # keeping it for the next request or task of the same process.
+        # Only sync gunicorn and Celery workers should: under ASGI every
+        # executor thread would hold a connection of its own
+        "CONN_MAX_AGE": config("DB_CONN_MAX_AGE", default=0, cast=int),
+        "CONN_HEALTH_CHECKS": config(
+            "DB_CONN_HEALTH_CHECKS", default=True, cast=bool
+        ),
         "TEST": {
             "NAME": "fileuploadtestdb",
         },
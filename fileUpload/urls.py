@@ -10,9 +10,12 @@ from drf_spectacular.views import (
     SpectacularSwaggerView,
 )
 
+from user.views import metrics
+
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("v1/", include("user.urls")),
+    path("metrics", metrics, name="metrics"),
     path("v1/api/schema/", SpectacularAPIView.as_view(), name="schema"),
     path(
         "v1/api/schema/swagger-ui/",
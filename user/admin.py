@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import UserData, FileUpload
+from .models import UserData, FileUpload, ChunkedUpload
 
 
 @admin.register(UserData)
@@ -31,3 +31,10 @@ class FileUploadAdmin(admin.ModelAdmin):
     list_display = ("id", "filename", "status", "time_added")
     list_filter = ("status", "time_added")
     search_fields = ("file__name",)
+
+
+@admin.register(ChunkedUpload)
+class ChunkedUploadAdmin(admin.ModelAdmin):
+    list_display = ("id", "filename", "offset", "status", "time_added")
+    list_filter = ("status", "time_added")
+    search_fields = ("filename",)
@@ -0,0 +1,492 @@
+import csv
+import datetime
+import gzip
+import hashlib
+import io
+import os
+import random
+import statistics
+import subprocess
+import time
+import uuid
+
+import openpyxl
+import zstandard
+from django.conf import settings
+from django.test.utils import override_settings
+
+from .helpers import FileReader
+from .models import FileUpload, UserData
+from .tasks import USER_DATA_FIELDS, get_inserter, process_uploaded_file
+from .utils import FileHeaderValidator, RowDataValidator
+
+FIRST_NAMES = (
+    "John", "Jane", "Amina", "Wanjiru", "Otieno", "Grace", "Peter",
+    "Fatuma", "Brian", "Akinyi", "Samuel", "Mary", "Kevin", "Njeri",
+)
+LAST_NAMES = (
+    "Doe", "Kamau", "Otieno", "Mwangi", "Ochieng", "Wanjiku", "Hassan",
+    "Kiptoo", "Mutua", "Achieng", "Njoroge", "Omondi",
+)
+COUNTRIES = ("Kenya", "Uganda", "Tanzania", "Rwanda", "Ethiopia")
+STREETS = ("Moi Avenue", "Kenyatta Road", "Ngong Road", "Main Street")
+USERS_PATH = "/v1/users/"
+UPLOADS_PATH = "/v1/file-upload/"
+
+
+def current_commit():
+    """Returns the checked out commit, or None outside a git checkout."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=settings.BASE_DIR,
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def multipart_file(content, filename):
+    """
+    Builds a multipart/form-data body holding a single ``file`` field.
+
+    Args:
+        content (bytes): The file content.
+        filename (str): The file name to send.
+
+    Returns:
+        tuple: The body and its Content-Type header value.
+    """
+    boundary = uuid.uuid4().hex
+    body = (
+        (
+            f"--{boundary}\r\n"
+            'Content-Disposition: form-data; name="file"; '
+            f'filename="{filename}"\r\n'
+            "Content-Type: text/csv\r\n\r\n"
+        ).encode()
+        + content
+        + f"\r\n--{boundary}--\r\n".encode()
+    )
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+class UserDataGenerator:
+    """
+    Generates UserData-shaped rows from a seed, so the same options always
+    give the same rows. CSV files, compressed or not, are identical byte
+    for byte; an xlsx file records when it was saved.
+
+    A share of the rows is made invalid, with one field broken so the row
+    is rejected for a known reason, and a share repeats the finger print
+    signature of an earlier valid row. Every signature starts with
+    ``prefix``, so the rows a benchmark inserted can be found again.
+    """
+
+    # Rejection reasons, as reported by RowDataValidator.validate_chunk
+    INVALID_KINDS = (
+        "missing_email",
+        "invalid_national_id",
+        "invalid_birth_date",
+        "invalid_email",
+    )
+    WRITABLE_EXTENSIONS = (".csv", ".csv.gz", ".csv.zst", ".xlsx")
+
+    def __init__(self, rows, invalid_ratio=0.0, duplicate_ratio=0.0,
+                 seed=0, prefix="synthetic-"):
+        if invalid_ratio < 0 or duplicate_ratio < 0:
+            raise ValueError("Ratios cannot be negative.")
+        if invalid_ratio + duplicate_ratio > 1:
+            raise ValueError("Ratios cannot add up to more than 1.")
+        self.rows = rows
+        self.invalid_ratio = invalid_ratio
+        self.duplicate_ratio = duplicate_ratio
+        self.seed = seed
+        self.prefix = prefix
+        self.counts = {}
+
+    def iter_rows(self):
+        """
+        Yields the rows, counting them in ``counts`` by what they are:
+        "valid", "duplicate" or one of INVALID_KINDS.
+
+        Yields:
+            dict: The next row, keyed by USER_DATA_FIELDS.
+        """
+        rng = random.Random(self.seed)
+        self.counts = {"valid": 0, "duplicate": 0}
+        signatures = []
+        for index in range(self.rows):
+            draw = rng.random()
+            row = self.valid_row(rng, index)
+            if draw < self.invalid_ratio:
+                kind = rng.choice(self.INVALID_KINDS)
+                self.break_row(row, kind)
+            elif draw < self.invalid_ratio + self.duplicate_ratio and (
+                signatures
+            ):
+                kind = "duplicate"
+                row["finger_print_signature"] = rng.choice(signatures)
+            else:
+                kind = "valid"
+                signatures.append(row["finger_print_signature"])
+            self.counts[kind] = self.counts.get(kind, 0) + 1
+            yield row
+
+    def valid_row(self, rng, index):
+        first_name = rng.choice(FIRST_NAMES)
+        last_name = rng.choice(LAST_NAMES)
+        birth_date = datetime.date(1940, 1, 1) + datetime.timedelta(
+            days=rng.randrange(365 * 65)
+        )
+        signature = hashlib.sha256(
+            f"{self.seed}-{index}".encode()
+        ).hexdigest()
+        return {
+            "first_name": first_name,
+            "last_name": last_name,
+            "national_id": str(rng.randrange(10**7, 10**8)),
+            "birth_date": birth_date.isoformat(),
+            "address": f"{rng.randrange(1, 999)} {rng.choice(STREETS)}",
+            "country": rng.choice(COUNTRIES),
+            "phone_number": f"2547{rng.randrange(10**8):08d}",
+            "email": f"{first_name}.{last_name}{index}@example.com".lower(),
+            "finger_print_signature": f"{self.prefix}{signature}",
+        }
+
+    @staticmethod
+    def break_row(row, kind):
+        if kind == "missing_email":
+            row["email"] = ""
+        elif kind == "invalid_national_id":
+            row["national_id"] = f"ID{row['national_id']}"
+        elif kind == "invalid_birth_date":
+            row["birth_date"] = row["birth_date"][:5] + "13-45"
+        elif kind == "invalid_email":
+            row["email"] = row["email"].replace("@", " at ")
+
+    def write(self, file_path):
+        """
+        Writes the rows to a file, in the format its extension names.
+        A gzip file carries no timestamp, so it is reproducible too.
+
+        Args:
+            file_path (str): A path ending in one of WRITABLE_EXTENSIONS.
+
+        Returns:
+            dict: The row counts, as in ``counts``.
+        """
+        extension, compression = FileReader.split_extension(file_path)
+        if extension == ".csv" and compression == ".gz":
+            with open(file_path, "wb") as raw, gzip.GzipFile(
+                fileobj=raw, mode="wb", mtime=0
+            ) as f:
+                self.write_csv(f)
+        elif extension == ".csv" and compression == ".zst":
+            with zstandard.open(file_path, mode="wb") as f:
+                self.write_csv(f)
+        elif extension == ".csv":
+            with open(file_path, "wb") as f:
+                self.write_csv(f)
+        elif extension == ".xlsx":
+            self.write_xlsx(file_path)
+        else:
+            raise ValueError(
+                f"Cannot write {extension}{compression} files. Use one of: "
+                f"{', '.join(self.WRITABLE_EXTENSIONS)}."
+            )
+        return dict(self.counts)
+
+    def write_csv(self, binary_file):
+        f = io.TextIOWrapper(binary_file, encoding="utf-8", newline="")
+        writer = csv.DictWriter(f, fieldnames=USER_DATA_FIELDS)
+        writer.writeheader()
+        writer.writerows(self.iter_rows())
+        # Leave closing the binary file to the caller
+        f.flush()
+        f.detach()
+
+    def write_xlsx(self, file_path):
+        book = openpyxl.Workbook(write_only=True)
+        sheet = book.create_sheet()
+        sheet.append(USER_DATA_FIELDS)
+        for row in self.iter_rows():
+            sheet.append([row[field] for field in USER_DATA_FIELDS])
+        book.save(file_path)
+
+
+class IngestionBenchmark:
+    """
+    Times each stage of ingesting a file: reading its rows, checking its
+    header, validating its rows, and processing it end to end with
+    ``process_uploaded_file``, which inserts the rows into UserData.
+
+    Files are written to, and uploads processed from, a directory of
+    their own. The inserted rows and the FileUpload are deleted after
+    every end-to-end run, so runs do not see each other's rows as
+    duplicates.
+    """
+
+    STAGES = ("read", "header", "validate", "end_to_end")
+
+    def __init__(self, generator, directory, stages=STAGES, repeat=3,
+                 loader=None):
+        self.generator = generator
+        self.directory = directory
+        self.stages = stages
+        self.repeat = repeat
+        self.loader = loader or settings.USER_DATA_LOADER
+
+    def run(self, extension):
+        """
+        Generates a file and times each stage on it.
+
+        Args:
+            extension (str): The file format, e.g. ".csv" or ".xlsx".
+
+        Returns:
+            dict: The file's size in "bytes", its row "counts", and by
+            stage the median "seconds" over the runs, the "rows_per_second"
+            at that median and every run's time in "runs". The header
+            check reads a single row, so it has no rows per second.
+        """
+        name = f"benchmark-{self.generator.seed}{extension}"
+        file_path = os.path.join(self.directory, name)
+        counts = self.generator.write(file_path)
+        rows = list(FileReader.read_file(file_path, stream=True))
+
+        # Each timer returns the seconds its stage took
+        timers = {
+            "read": lambda: self.time(
+                lambda: list(FileReader.read_file(file_path, stream=True))
+            ),
+            "header": lambda: self.time(
+                lambda: FileHeaderValidator.is_valid(file_path)
+            ),
+            "validate": lambda: self.time(lambda: self.validate(rows)),
+            "end_to_end": lambda: self.process(name, counts),
+        }
+        stages = {}
+        for stage in self.stages:
+            runs = [timers[stage]() for _ in range(self.repeat)]
+            seconds = statistics.median(runs)
+            stages[stage] = {
+                "seconds": seconds,
+                "rows_per_second": (
+                    len(rows) / seconds
+                    if seconds and stage != "header" else None
+                ),
+                "runs": runs,
+            }
+        return {
+            "bytes": os.path.getsize(file_path),
+            "counts": counts,
+            "stages": stages,
+        }
+
+    @staticmethod
+    def time(function):
+        start = time.perf_counter()
+        function()
+        return time.perf_counter() - start
+
+    @staticmethod
+    def validate(rows):
+        for chunk in FileReader.iter_chunks(
+            iter(rows), settings.USER_DATA_BATCH_SIZE
+        ):
+            RowDataValidator.validate_chunk(chunk)
+
+    def process(self, name, counts):
+        """
+        Processes a file as a worker would and checks that every valid row
+        was inserted.
+
+        Returns:
+            float: The seconds ``process_uploaded_file`` took.
+        """
+        self.delete_rows()
+        # bulk_create skips the post_save signal, so no task is sent to
+        # the broker, and the file is never split into a chord either
+        upload = FileUpload.objects.bulk_create([FileUpload(file=name)])[0]
+        try:
+            with override_settings(
+                MEDIA_ROOT=self.directory,
+                PARALLEL_INGESTION_THRESHOLD=float("inf"),
+            ):
+                seconds = self.time(
+                    lambda: process_uploaded_file(upload.id, self.loader)
+                )
+            upload.refresh_from_db()
+            if upload.rows_inserted != counts["valid"]:
+                raise RuntimeError(
+                    f"Upload {upload.id} inserted {upload.rows_inserted} "
+                    f"rows instead of {counts['valid']}."
+                )
+        finally:
+            self.delete_rows()
+            upload.delete()
+        return seconds
+
+    def delete_rows(self):
+        UserData.objects.filter(
+            finger_print_signature__startswith=self.generator.prefix
+        ).delete()
+
+
+def seed_user_data(generator, loader=None):
+    """
+    Inserts the rows of a generator into UserData, skipping rows that are
+    already there.
+
+    Args:
+        generator (UserDataGenerator): The rows to insert.
+        loader (str): "orm" or "copy". Defaults to
+        ``settings.USER_DATA_LOADER``.
+    """
+    inserter, convert = get_inserter(loader or settings.USER_DATA_LOADER)
+    for row in generator.iter_rows():
+        inserter.add(convert(row))
+    inserter.flush()
+
+
+class LatencySummary:
+    """Summarizes the latencies and failures of a load test."""
+
+    @staticmethod
+    def percentile(values, percent):
+        """
+        Returns the nearest-rank percentile of some values.
+
+        Args:
+            values (list of float): The values, in any order.
+            percent (float): The percentile, from 0 to 100.
+
+        Returns:
+            float: The value at that percentile, or None without values.
+        """
+        if not values:
+            return None
+        ordered = sorted(values)
+        rank = max(1, -(-len(ordered) * percent // 100))
+        return ordered[int(rank) - 1]
+
+    @staticmethod
+    def summarize(latencies, errors, seconds):
+        """
+        Args:
+            latencies (list of float): Seconds taken by each request that
+            succeeded.
+            errors (int): The number of requests that failed.
+            seconds (float): How long the test ran.
+
+        Returns:
+            dict: The number of "requests" and "errors", the "error_rate"
+            from 0 to 1, the "throughput" of successful requests per
+            second and the "p50", "p95", "p99" and "max" latencies in
+            milliseconds.
+        """
+        requests = len(latencies) + errors
+        summary = {
+            "requests": requests,
+            "errors": errors,
+            "error_rate": errors / requests if requests else 0.0,
+            "throughput": len(latencies) / seconds if seconds else 0.0,
+        }
+        for name, percent in (("p50", 50), ("p95", 95), ("p99", 99)):
+            value = LatencySummary.percentile(latencies, percent)
+            summary[name] = value * 1000 if value is not None else None
+        summary["max"] = max(latencies) * 1000 if latencies else None
+        return summary
+
+
+class LoadTestMix:
+    """
+    Builds the requests a load test sends, drawn from a seed so that every
+    server configuration compared is sent the same sequence.
+
+    User list requests filter, search and order the rows that
+    ``seed_user_data`` inserted and ask for pages deep into the list.
+    Uploads are CSV files of varying sizes, each with signatures of its
+    own, so none is taken for a re-upload of another.
+    """
+
+    SCENARIOS = {
+        "users": ("filter", "search", "ordering", "deep_page"),
+        "uploads": ("upload",),
+        "mixed": ("filter", "search", "ordering", "deep_page", "upload"),
+    }
+    # Statuses counted as successes; a repeated upload is answered with 200
+    EXPECTED_STATUSES = {"upload": (200, 201)}
+
+    def __init__(self, scenario, rows, seed=0, page_size=100,
+                 upload_rows=(100, 1000, 10000), prefix="loadtest-"):
+        self.kinds = self.SCENARIOS[scenario]
+        self.pages = max(1, rows // page_size)
+        self.seed = seed
+        self.page_size = page_size
+        self.upload_rows = upload_rows
+        self.prefix = prefix
+
+    def requests(self, stream):
+        """
+        Yields requests without end.
+
+        Args:
+            stream (int): Which of the independent request sequences to
+            draw from, e.g. one per client thread.
+
+        Yields:
+            tuple: The request kind, method, path, body and headers.
+        """
+        rng = random.Random(f"{self.seed}-{stream}")
+        while True:
+            kind = rng.choice(self.kinds)
+            if kind == "upload":
+                body, content_type = self.upload(rng)
+                yield kind, "POST", UPLOADS_PATH, body, {
+                    "Content-Type": content_type
+                }
+            else:
+                params = getattr(self, kind)(rng)
+                params["page_size"] = self.page_size
+                query = "&".join(f"{k}={v}" for k, v in params.items())
+                yield kind, "GET", f"{USERS_PATH}?{query}", None, {}
+
+    @staticmethod
+    def filter(rng):
+        field, names = rng.choice(
+            (("first_name", FIRST_NAMES), ("last_name", LAST_NAMES))
+        )
+        return {field: rng.choice(names)}
+
+    @staticmethod
+    def search(rng):
+        terms = rng.choice((
+            rng.choice(FIRST_NAMES),
+            f"{rng.choice(FIRST_NAMES)}+{rng.choice(LAST_NAMES)}",
+            f"2547{rng.randrange(100):02d}",
+        ))
+        return {"search": terms.lower()}
+
+    @staticmethod
+    def ordering(rng):
+        field = rng.choice(("first_name", "last_name", "birth_date"))
+        return {"ordering": rng.choice((field, f"-{field}"))}
+
+    def deep_page(self, rng):
+        return {"page": rng.randint(max(1, self.pages * 3 // 4), self.pages)}
+
+    def upload(self, rng):
+        generator = UserDataGenerator(
+            rng.choice(self.upload_rows),
+            invalid_ratio=0.05,
+            duplicate_ratio=0.05,
+            seed=rng.randrange(2**32),
+            prefix=f"{self.prefix}{uuid.uuid4().hex[:12]}-",
+        )
+        content = io.BytesIO()
+        generator.write_csv(content)
+        return multipart_file(content.getvalue(), "loadtest.csv")
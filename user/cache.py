@@ -0,0 +1,129 @@
+import hashlib
+import time
+from operator import itemgetter
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+
+USER_DATA_CACHE_ALIAS = "user_data"
+
+
+class UserDataCache:
+    """
+    Caches rendered /v1/users/ list responses.
+
+    Entries are stored under the current generation, passed to the cache
+    as the key version. Ingestion bumps the generation when it commits
+    new rows, which orphans every earlier entry at once instead of
+    deleting them; they then expire through the TTL or eviction.
+
+    Caching is disabled when ``settings.USER_DATA_CACHE_TIMEOUT`` is 0.
+    """
+
+    GENERATION_KEY = "user-data:generation"
+
+    @staticmethod
+    def get_cache():
+        return caches[USER_DATA_CACHE_ALIAS]
+
+    @staticmethod
+    def enabled():
+        return settings.USER_DATA_CACHE_TIMEOUT > 0
+
+    @staticmethod
+    def generation():
+        """
+        Returns the current generation, starting a new one if the key was
+        evicted or never set. New generations start from the clock so
+        they cannot collide with one used before the key was lost.
+        """
+        cache = UserDataCache.get_cache()
+        generation = cache.get(UserDataCache.GENERATION_KEY)
+        if generation is None:
+            cache.add(UserDataCache.GENERATION_KEY, time.time_ns(), None)
+            generation = cache.get(UserDataCache.GENERATION_KEY)
+        return generation
+
+    @staticmethod
+    def bump_generation():
+        """Invalidates every cached response."""
+        cache = UserDataCache.get_cache()
+        try:
+            cache.incr(UserDataCache.GENERATION_KEY)
+        except ValueError:
+            # The key is missing; any new value starts a fresh generation
+            cache.set(UserDataCache.GENERATION_KEY, time.time_ns(), None)
+
+    @staticmethod
+    def make_key(request):
+        """
+        Builds the cache key for a request from its host and path, the
+        accepted media type and its query params. Params are sorted by
+        name, keeping the order of repeated values, and blank values are
+        dropped, so equivalent query strings share an entry.
+
+        Args:
+            request (Request): The DRF request.
+
+        Returns:
+            str: The cache key.
+        """
+        params = sorted(
+            (
+                (name, value)
+                for name, values in request.query_params.lists()
+                for value in values
+                if value != ""
+            ),
+            key=itemgetter(0),
+        )
+        identity = "\n".join([
+            request.get_host(),
+            request.path,
+            request.accepted_media_type or "",
+            urlencode(params),
+        ])
+        digest = hashlib.sha256(identity.encode()).hexdigest()
+        return f"user-data:list:{digest}"
+
+    @staticmethod
+    def get(request, generation):
+        """
+        Returns the cached response for the request, or None.
+
+        Args:
+            request (Request): The DRF request.
+            generation (int): The current generation.
+
+        Returns:
+            HttpResponse: The cached response, or None on a miss.
+        """
+        entry = UserDataCache.get_cache().get(
+            UserDataCache.make_key(request), version=generation
+        )
+        if entry is None:
+            return None
+        content, content_type = entry
+        return HttpResponse(content, content_type=content_type)
+
+    @staticmethod
+    def set(request, response, generation):
+        """
+        Stores a rendered response under the generation it was read in,
+        so rows committed while it was built are not hidden by it.
+
+        Args:
+            request (Request): The DRF request.
+            response (HttpResponse): The rendered response.
+            generation (int): The generation before the query ran.
+        """
+        if response.status_code != 200:
+            return
+        UserDataCache.get_cache().set(
+            UserDataCache.make_key(request),
+            (response.content, response["Content-Type"]),
+            settings.USER_DATA_CACHE_TIMEOUT,
+            version=generation,
+        )
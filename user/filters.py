@@ -0,0 +1,55 @@
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery
+from django.db import connection
+from rest_framework import filters
+
+from .models import user_data_search_vector
+
+SEARCH_BACKEND_ICONTAINS = "icontains"
+SEARCH_BACKEND_FULLTEXT = "fulltext"
+
+
+class UserDataSearchFilter(filters.SearchFilter):
+    """
+    SearchFilter that can use the GIN-indexed full-text search vector on
+    UserData instead of one ``icontains`` scan per search field.
+
+    The backend is chosen with ``settings.USER_DATA_SEARCH_BACKEND``. In
+    full-text mode every search term must match the start of a word in
+    first_name, last_name, phone_number or email, so "jo" finds "John"
+    but "ohn" does not.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        if (
+            settings.USER_DATA_SEARCH_BACKEND != SEARCH_BACKEND_FULLTEXT
+            or connection.vendor != "postgresql"
+        ):
+            return super().filter_queryset(request, queryset, view)
+
+        search_terms = self.get_search_terms(request)
+        if not search_terms:
+            return queryset
+
+        return queryset.annotate(
+            search_vector=user_data_search_vector()
+        ).filter(search_vector=self.build_query(search_terms))
+
+    @staticmethod
+    def build_query(search_terms):
+        """
+        Builds a prefix-matching tsquery that requires every term.
+
+        Args:
+            search_terms (list of str): The terms from the search param.
+
+        Returns:
+            SearchQuery: The query to match against the search vector.
+        """
+        quoted_terms = (
+            "'{}':*".format(term.replace("\\", "\\\\").replace("'", "''"))
+            for term in search_terms
+        )
+        return SearchQuery(
+            " & ".join(quoted_terms), search_type="raw", config="simple"
+        )
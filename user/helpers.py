@@ -1,35 +1,754 @@
 import csv
+import datetime
+import gzip
+import hashlib
+import io
+import logging
+import os
+import shutil
+import time
+import uuid
+import zlib
+
+import openpyxl
 import xlrd
+import zstandard
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.db.models import Q
+
+logger = logging.getLogger()
+
+# Compression suffixes a CSV may be uploaded with
+COMPRESSED_EXTENSIONS = (".gz", ".zst")
 
 
 class FileReader:
     @staticmethod
-    def read_file(file_path):
-        extension = file_path.split(".")[-1]
-        if extension == "csv":
-            return FileReader.read_csv_file(file_path)
-        elif extension in ["xls", "xlsx"]:
-            return FileReader.read_excel_file(file_path)
+    def read_file(file_path, stream=False, chunk_size=None):
+        """
+        Reads the rows of a CSV or Excel file as dictionaries.
+
+        Args:
+            file_path (str): Path of the file to read.
+            stream (bool): Yield rows lazily instead of returning a list.
+            chunk_size (int): When streaming, yield lists of up to this
+            many rows instead of single rows.
+
+        Returns:
+            list or generator: The rows of the file.
+        """
+        extension, compression = FileReader.split_extension(file_path)
+        if extension == ".csv":
+            if not stream:
+                return FileReader.read_csv_file(file_path)
+            rows = FileReader.stream_csv_file(file_path)
+        elif extension in [".xls", ".xlsx"] and not compression:
+            if not stream:
+                return FileReader.read_excel_file(file_path)
+            rows = FileReader.stream_excel_file(file_path)
         else:
-            raise ValueError(f"Invalid file extension: {extension}")
+            raise ValueError(
+                f"Invalid file extension: {extension}{compression}"
+            )
+
+        if chunk_size:
+            return FileReader.iter_chunks(rows, chunk_size)
+        return rows
+
+    @staticmethod
+    def split_extension(file_name):
+        """
+        Splits the extension of a file name into its format and the
+        compression it was uploaded with, if any.
+
+        Args:
+            file_name (str): The file name or path.
+
+        Returns:
+            tuple: The lowercase format and compression extensions, e.g.
+            (".csv", ".gz") for "rows.csv.gz" and (".csv", "") for
+            "rows.csv".
+        """
+        root, extension = os.path.splitext(file_name.lower())
+        if extension in COMPRESSED_EXTENSIONS:
+            return os.path.splitext(root)[1], extension
+        return extension, ""
+
+    @staticmethod
+    def open_binary(file_path):
+        """
+        Opens a file for reading bytes. ``.gz`` and ``.zst`` files are
+        decompressed as they are read, without a copy on disk.
+
+        Args:
+            file_path (str): Path of the file.
+
+        Returns:
+            file object: The binary stream. A ``.zst`` stream can only
+            seek by reading forward and reports itself as not seekable.
+        """
+        compression = FileReader.split_extension(file_path)[1]
+        if compression == ".gz":
+            return gzip.open(file_path, mode="rb")
+        if compression == ".zst":
+            return io.BufferedReader(zstandard.open(file_path, mode="rb"))
+        return open(file_path, mode="rb")
+
+    @staticmethod
+    def decompressor(file_name):
+        """
+        Builds an incremental decompressor for a file's compression, for
+        reading the start of an upload while it arrives.
+
+        Args:
+            file_name (str): The file name.
+
+        Returns:
+            object: An object whose ``decompress(data)`` returns the
+            bytes decompressed so far, or None if the file is not
+            compressed.
+        """
+        compression = FileReader.split_extension(file_name)[1]
+        if compression == ".gz":
+            return zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+        if compression == ".zst":
+            return zstandard.ZstdDecompressor().decompressobj()
+        return None
 
     @staticmethod
     def read_csv_file(file_path):
-        with open(file_path, mode="r") as f:
+        with io.TextIOWrapper(
+            FileReader.open_binary(file_path), encoding="utf-8", newline=""
+        ) as f:
             reader = csv.DictReader(f)
             rows = [row for row in reader]
             return rows
 
+    @staticmethod
+    def stream_csv_file(file_path, start=None, end=None):
+        """
+        Yields the rows of a CSV file one at a time.
+
+        Args:
+            file_path (str): Path of the CSV file.
+            start (int): Byte offset of the first line to read.
+            end (int): Byte offset at which to stop reading.
+
+        Yields:
+            dict: The next row, keyed by the file headers.
+        """
+        yield from CsvRowStream(file_path, start, end)
+
+    @staticmethod
+    def split_csv_file(file_path, chunk_bytes, scan_bytes=1024 * 1024):
+        """
+        Splits the body of an uncompressed CSV file into byte ranges of
+        roughly chunk_bytes, each beginning at the start of a record.
+
+        The file is scanned once, counting quote characters, so a
+        newline inside a quoted field, e.g. a multi-line address, is
+        never taken for the end of a record. Escaped quotes come in pairs
+        and leave the count even.
+
+        Args:
+            file_path (str): Path of the CSV file.
+            chunk_bytes (int): Target size of each range in bytes.
+            scan_bytes (int): Bytes read at a time while scanning.
+
+        Returns:
+            list of tuple: (start, end) byte offsets for each range.
+        """
+        ranges = []
+        with open(file_path, mode="rb") as f:
+            f.readline()
+            start = f.tell()
+            size = os.fstat(f.fileno()).st_size
+            target = start + chunk_bytes
+            block_start = start
+            quoted = False
+            while block_start < size:
+                block = f.read(scan_bytes)
+                if not block:
+                    break
+                # Quotes up to index counted is already counted
+                counted = 0
+                while True:
+                    newline = -1
+                    search_from = max(counted, target - block_start)
+                    if search_from < len(block):
+                        newline = block.find(b"\n", search_from)
+                    if newline == -1:
+                        quoted ^= block.count(b'"', counted) % 2 == 1
+                        break
+                    quoted ^= block.count(b'"', counted, newline) % 2 == 1
+                    counted = newline + 1
+                    if not quoted:
+                        end = block_start + counted
+                        ranges.append((start, end))
+                        start = end
+                        target = end + chunk_bytes
+                block_start += len(block)
+            if start < size:
+                ranges.append((start, size))
+        return ranges
+
+    @staticmethod
+    def iter_chunks(rows, chunk_size):
+        """
+        Groups an iterable of rows into lists of at most chunk_size rows.
+
+        Args:
+            rows (iterable): The rows to group.
+            chunk_size (int): The maximum number of rows per chunk.
+
+        Yields:
+            list: The next chunk of rows.
+        """
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
     @staticmethod
     def read_excel_file(file_path):
-        book = xlrd.open_workbook(file_path)
-        sheet = book.sheet_by_index(0)
-        rows = []
-        for row_idx in range(1, sheet.nrows):
-            row = {}
-            for col_idx in range(sheet.ncols):
-                key = sheet.cell_value(0, col_idx)
-                val = sheet.cell_value(row_idx, col_idx)
-                row[key] = val
-            rows.append(row)
-        return rows
+        return list(FileReader.stream_excel_file(file_path))
+
+    @staticmethod
+    def stream_excel_file(file_path):
+        """
+        Yields the rows of the first sheet of an Excel file one at a time.
+
+        The header row is read once. ``.xlsx`` files are parsed with
+        openpyxl in read-only mode, which streams the sheet XML instead of
+        loading the workbook. Cell values are converted to the strings a
+        CSV file would hold, with dates as YYYY-MM-DD.
+
+        Args:
+            file_path (str): Path of the ``.xls`` or ``.xlsx`` file.
+
+        Yields:
+            dict: The next row, keyed by the header row.
+        """
+        rows = FileReader._iter_excel_rows(file_path)
+        header = [FileReader._cell_to_str(value) for value in next(rows, [])]
+        for values in rows:
+            yield {
+                key: FileReader._cell_to_str(value)
+                for key, value in zip(header, values)
+            }
+
+    @staticmethod
+    def read_header(file_path):
+        """
+        Reads the header row of a CSV or Excel file.
+
+        Args:
+            file_path (str): Path of the file.
+
+        Returns:
+            list of str: The column names.
+        """
+        if file_path.endswith((".xls", ".xlsx")):
+            rows = FileReader._iter_excel_rows(file_path)
+            try:
+                return [
+                    FileReader._cell_to_str(value)
+                    for value in next(rows, [])
+                ]
+            finally:
+                rows.close()
+
+        with io.TextIOWrapper(
+            FileReader.open_binary(file_path), encoding="utf-8", newline=""
+        ) as f:
+            return next(csv.reader(f), [])
+
+    @staticmethod
+    def checksum(file_path, chunk_size=1024 * 1024, size=None):
+        """
+        Computes the SHA-256 of a file's content.
+
+        Args:
+            file_path (str): Path of the file.
+            chunk_size (int): Bytes read at a time.
+            size (int): Only hash this many bytes from the start.
+
+        Returns:
+            str: The hex digest.
+        """
+        digest = hashlib.sha256()
+        remaining = size
+        with open(file_path, mode="rb") as f:
+            while remaining is None or remaining > 0:
+                block = f.read(
+                    chunk_size if remaining is None
+                    else min(chunk_size, remaining)
+                )
+                if not block:
+                    break
+                digest.update(block)
+                if remaining is not None:
+                    remaining -= len(block)
+        return digest.hexdigest()
+
+    @staticmethod
+    def _iter_excel_rows(file_path):
+        if file_path.endswith(".xlsx"):
+            return FileReader._iter_xlsx_rows(file_path)
+        return FileReader._iter_xls_rows(file_path)
+
+    @staticmethod
+    def _iter_xlsx_rows(file_path):
+        book = openpyxl.load_workbook(
+            file_path, read_only=True, data_only=True
+        )
+        try:
+            yield from book.worksheets[0].iter_rows(values_only=True)
+        finally:
+            book.close()
+
+    @staticmethod
+    def _iter_xls_rows(file_path):
+        book = xlrd.open_workbook(file_path, on_demand=True)
+        try:
+            sheet = book.sheet_by_index(0)
+            for row_idx in range(sheet.nrows):
+                yield [
+                    xlrd.xldate_as_datetime(cell.value, book.datemode)
+                    if cell.ctype == xlrd.XL_CELL_DATE else cell.value
+                    for cell in sheet.row(row_idx)
+                ]
+        finally:
+            book.release_resources()
+
+    @staticmethod
+    def _cell_to_str(value):
+        if value is None:
+            return ""
+        if isinstance(value, datetime.datetime):
+            return value.date().isoformat()
+        if isinstance(value, datetime.date):
+            return value.isoformat()
+        if isinstance(value, float) and value.is_integer():
+            return str(int(value))
+        return str(value)
+
+
+class CsvRowStream:
+    """Iterates over the rows of a CSV file, tracking the byte offset."""
+
+    def __init__(self, file_path, start=None, end=None):
+        """
+        Initializes a CsvRowStream.
+
+        When a byte range is given only the records that begin inside it
+        are read; the header is always taken from the first line of the
+        file. Offsets must fall on the start of a record, as those from
+        ``FileReader.split_csv_file`` do, so a quoted newline is not
+        mistaken for the end of one. Offsets of a compressed file count
+        decompressed bytes.
+
+        Args:
+            file_path (str): Path of the CSV file.
+            start (int): Byte offset of the first line to read.
+            end (int): Byte offset at which to stop reading.
+        """
+        self.file_path = file_path
+        self.start = start
+        self.end = end
+        self.offset = start or 0
+
+    def __iter__(self):
+        with FileReader.open_binary(self.file_path) as f:
+            header = next(csv.reader([f.readline().decode("utf-8")]))
+            if self.start is not None and self.start > f.tell():
+                self._skip_to(f, self.start)
+            self.offset = f.tell()
+            yield from csv.DictReader(self._iter_lines(f), fieldnames=header)
+
+    @staticmethod
+    def _skip_to(f, offset):
+        if f.seekable():
+            f.seek(offset)
+            return
+        # A zstd stream is skipped by decompressing up to the offset
+        while f.tell() < offset:
+            if not f.read(min(offset - f.tell(), 1024 * 1024)):
+                break
+
+    def _iter_lines(self, f):
+        # csv.reader pulls lines only as it needs them, so after each row
+        # is yielded self.offset is the byte offset just past that row
+        while self.end is None or self.offset < self.end:
+            line = f.readline()
+            if not line:
+                break
+            self.offset += len(line)
+            yield line.decode("utf-8")
+
+
+class BatchInserter:
+    """Collects model instances and writes them in fixed-size batches."""
+
+    def __init__(self, model, batch_size=None, ignore_conflicts=False):
+        """
+        Initializes a BatchInserter for the given model.
+
+        Args:
+            model (django.db.models.Model): The model class to insert into.
+            batch_size (int): Number of instances per ``bulk_create`` call.
+            Defaults to ``settings.USER_DATA_BATCH_SIZE``.
+            ignore_conflicts (bool): Skip rows that violate a unique
+            constraint (``ON CONFLICT DO NOTHING``) instead of failing.
+            Skipped rows are left out of the ``inserted`` counter.
+        """
+        self.model = model
+        self.batch_size = batch_size or settings.USER_DATA_BATCH_SIZE
+        self.ignore_conflicts = ignore_conflicts
+        self.unique_fields = [
+            field for field in model._meta.concrete_fields
+            if field.unique and not field.primary_key
+        ]
+        self.pending = []
+        self.inserted = 0
+        self.timings = []
+
+    def add(self, instance):
+        """
+        Queues an instance, flushing once a full batch is collected.
+
+        Args:
+            instance (django.db.models.Model): The unsaved instance.
+        """
+        self.pending.append(instance)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes all queued instances with a single ``bulk_create``.
+
+        Returns:
+            int: The number of instances written.
+        """
+        if not self.pending:
+            return 0
+
+        start = time.perf_counter()
+        count = self.write(self.pending)
+        elapsed = time.perf_counter() - start
+
+        self.inserted += count
+        self.timings.append(elapsed)
+        self.pending = []
+
+        logger.info(
+            f"Inserted batch {len(self.timings)} of {count} "
+            f"{self.model.__name__} rows in {elapsed:.3f}s"
+        )
+        return count
+
+    def write(self, instances):
+        """
+        Writes one batch to the database.
+
+        Args:
+            instances (list): The queued instances.
+
+        Returns:
+            int: The number of rows written.
+        """
+        if not self.ignore_conflicts or not self.unique_fields:
+            self.model.objects.bulk_create(instances)
+            return len(instances)
+
+        # bulk_create does not report the rows skipped on conflict, so the
+        # rows holding the batch's unique values are counted around it
+        lookup = Q()
+        for field in self.unique_fields:
+            lookup |= Q(**{
+                f"{field.attname}__in": {
+                    getattr(instance, field.attname) for instance in instances
+                }
+            })
+        matching = self.model.objects.filter(lookup)
+        with transaction.atomic():
+            before = matching.count()
+            self.model.objects.bulk_create(instances, ignore_conflicts=True)
+            return matching.count() - before
+
+
+class CopyInserter(BatchInserter):
+    """
+    Writes batches of row dictionaries with PostgreSQL ``COPY``.
+
+    Each batch is copied into a temporary staging table and then merged
+    into the model's table with ``INSERT ... ON CONFLICT DO NOTHING`` on
+    the given conflict field, so no model instances are created and
+    rows that already exist are skipped.
+    """
+
+    def __init__(self, model, fields, conflict_field, batch_size=None):
+        """
+        Initializes a CopyInserter for the given model.
+
+        Args:
+            model (django.db.models.Model): The model class to insert into.
+            fields (list of str): The model fields present in each row.
+            conflict_field (str): The unique field used to skip rows that
+            already exist.
+            batch_size (int): Number of rows per ``COPY``. Defaults to
+            ``settings.USER_DATA_BATCH_SIZE``.
+
+        Raises:
+            ValueError: If the database is not PostgreSQL.
+        """
+        if connection.vendor != "postgresql":
+            raise ValueError("The copy loader requires PostgreSQL.")
+        super().__init__(model, batch_size, ignore_conflicts=True)
+        self.fields = fields
+        self.conflict_field = conflict_field
+
+    def write(self, rows):
+        meta = self.model._meta
+        quote = connection.ops.quote_name
+        table = quote(meta.db_table)
+        staging = quote(f"{meta.db_table}_staging")
+        columns = ", ".join(
+            quote(meta.get_field(field).column) for field in self.fields
+        )
+        conflict_column = quote(meta.get_field(self.conflict_field).column)
+        # Columns filled in by the database rather than the file
+        defaults = [
+            field for field in meta.concrete_fields
+            if getattr(field, "auto_now_add", False)
+        ]
+        default_columns = "".join(
+            f", {quote(field.column)}" for field in defaults
+        )
+        default_values = ", now()" * len(defaults)
+        # COPY reads an unquoted empty field as NULL, so empty strings in
+        # text columns that do not allow NULL are kept as empty strings
+        text_columns = ", ".join(
+            quote(field.column)
+            for field in map(meta.get_field, self.fields)
+            if not field.null
+            and field.get_internal_type() in ("CharField", "TextField")
+        )
+        copy_options = "FORMAT csv"
+        if text_columns:
+            copy_options += f", FORCE_NOT_NULL ({text_columns})"
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow([row[field] for field in self.fields])
+        buffer.seek(0)
+
+        # The staging table lives for the connection; it is emptied after
+        # every merge and rolled back with the batch on failure
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE TEMP TABLE IF NOT EXISTS {staging} AS "
+                f"SELECT {columns} FROM {table} WITH NO DATA"
+            )
+            cursor.copy_expert(
+                f"COPY {staging} ({columns}) FROM STDIN "
+                f"WITH ({copy_options})",
+                buffer,
+            )
+            cursor.execute(
+                f"INSERT INTO {table} ({columns}{default_columns}) "
+                f"SELECT DISTINCT ON ({conflict_column}) "
+                f"{columns}{default_values} FROM {staging} "
+                f"ON CONFLICT ({conflict_column}) DO NOTHING"
+            )
+            inserted = cursor.rowcount
+            cursor.execute(f"TRUNCATE {staging}")
+        return inserted
+
+
+class RejectedRowsWriter:
+    """Streams rejected rows and the reason for each to a CSV file."""
+
+    def __init__(self, name, append=False, size=None):
+        """
+        Initializes a RejectedRowsWriter. The file is only created once
+        the first row is written.
+
+        Args:
+            name (str): Storage name of the CSV file to write.
+            append (bool): Add to an existing file, e.g. when resuming
+            an interrupted ingestion, instead of replacing it.
+            size (int): When appending, cut the existing file back to this
+            many bytes first, dropping rows written after the checkpoint
+            it was saved with.
+        """
+        self.name = name
+        self.append = append
+        self.count = 0
+        self._file = None
+        self._writer = None
+        if append and size is not None and default_storage.exists(name):
+            os.truncate(default_storage.path(name), size)
+
+    def write(self, row, reason):
+        """
+        Appends a rejected row to the file.
+
+        Args:
+            row (dict): The rejected row as read from the upload.
+            reason (str): Why the row was rejected.
+        """
+        if self._writer is None:
+            path = default_storage.path(self.name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            append = self.append and self._has_rows()
+            self._file = open(path, mode="a" if append else "w", newline="")
+            self._writer = csv.DictWriter(
+                self._file,
+                fieldnames=["reason", *row.keys()],
+                extrasaction="ignore",
+            )
+            if not append:
+                self._writer.writeheader()
+        self._writer.writerow({"reason": reason, **row})
+        self.count += 1
+
+    def flush(self):
+        """Flushes buffered rows to disk."""
+        if self._file is not None:
+            self._file.flush()
+
+    def tell(self):
+        """
+        Flushes buffered rows and returns the size of the file, to save
+        with a checkpoint.
+
+        Returns:
+            int: The size in bytes, 0 if the file does not exist.
+        """
+        if self._file is not None:
+            self._file.flush()
+            return os.fstat(self._file.fileno()).st_size
+        if default_storage.exists(self.name):
+            return default_storage.size(self.name)
+        return 0
+
+    def close(self):
+        """
+        Closes the file.
+
+        Returns:
+            str: The storage name of the file, or None if it holds no
+            rows.
+        """
+        if self._file is not None:
+            self._file.close()
+        elif not (self.append and self._has_rows()):
+            return None
+        return self.name
+
+    def _has_rows(self):
+        return (
+            default_storage.exists(self.name)
+            and default_storage.size(self.name) > 0
+        )
+
+    @staticmethod
+    def merge(name, part_names):
+        """
+        Concatenates several rejected-row files into one, keeping the
+        header of the first, and deletes the parts.
+
+        Args:
+            name (str): Storage name of the merged file.
+            part_names (list of str): Storage names of the parts.
+
+        Returns:
+            str: The storage name of the merged file, or None if there
+            were no parts.
+        """
+        if not part_names:
+            return None
+
+        path = default_storage.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, mode="wb") as merged:
+            for index, part_name in enumerate(part_names):
+                with default_storage.open(part_name, mode="rb") as part:
+                    header = part.readline()
+                    if index == 0:
+                        merged.write(header)
+                    shutil.copyfileobj(part, merged)
+                default_storage.delete(part_name)
+        return name
+
+
+class UploadStore:
+    """
+    Content-addressed storage for uploaded files.
+
+    Uploads are written under a partial name first, then moved to a name
+    derived from the SHA-256 of their content, so identical files share
+    one copy on disk.
+    """
+
+    PARTIAL_DIRECTORY = "media/uploads/partial/"
+    CONTENT_DIRECTORY = "media/uploads/"
+
+    @staticmethod
+    def partial_name():
+        """Returns a new, unique storage name to write an upload to."""
+        return f"{UploadStore.PARTIAL_DIRECTORY}{uuid.uuid4().hex}.part"
+
+    @staticmethod
+    def content_name(sha256, file_name):
+        """
+        Returns the storage name of a file's content.
+
+        Args:
+            sha256 (str): Hex SHA-256 of the content.
+            file_name (str): The uploaded file's name, whose extension is
+            kept so readers can tell CSV from Excel and compressed from
+            plain files.
+
+        Returns:
+            str: e.g. "media/uploads/9f/9f86d0...15b0.csv".
+        """
+        extension = "".join(FileReader.split_extension(file_name))
+        directory = f"{UploadStore.CONTENT_DIRECTORY}{sha256[:2]}/"
+        return f"{directory}{sha256}{extension}"
+
+    @staticmethod
+    def commit(partial_name, sha256, file_name):
+        """
+        Moves a fully written upload to its content name. If that content
+        is already stored, the partial file is dropped instead.
+
+        Args:
+            partial_name (str): Storage name the upload was written to.
+            sha256 (str): Hex SHA-256 of the content.
+            file_name (str): The uploaded file's name.
+
+        Returns:
+            str: The content's storage name.
+        """
+        name = UploadStore.content_name(sha256, file_name)
+        path = default_storage.path(name)
+        partial_path = default_storage.path(partial_name)
+        if os.path.exists(path):
+            os.remove(partial_path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Identical bytes if a concurrent upload got there first
+            os.replace(partial_path, path)
+            if default_storage.file_permissions_mode is not None:
+                os.chmod(path, default_storage.file_permissions_mode)
+        return name
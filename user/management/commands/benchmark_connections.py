@@ -0,0 +1,76 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory, override_settings
+
+from user.metrics import ConnectionMetrics
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares the latency of requests that open a database connection "
+        "each (CONN_MAX_AGE=0) with requests that reuse one, with and "
+        "without health checks. The list cache is disabled so every "
+        "request queries the database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--path", default="/v1/users/?page_size=10")
+        parser.add_argument("--requests", type=int, default=200)
+
+    def handle(self, *args, **options):
+        host = settings.ALLOWED_HOSTS[0].replace("*", "") or "localhost"
+        # The test Client keeps connections open between requests, so
+        # requests go through the WSGI handler as a server would call it
+        environ = RequestFactory(HTTP_HOST=host).get(options["path"]).environ
+        original = dict(connection.settings_dict)
+        try:
+            for name, max_age, health_checks in (
+                ("new connection", 0, False),
+                ("persistent", 60, False),
+                ("persistent + checks", 60, True),
+            ):
+                connection.settings_dict["CONN_MAX_AGE"] = max_age
+                connection.settings_dict["CONN_HEALTH_CHECKS"] = health_checks
+                connection.close()
+                timings, metrics = self.time_requests(
+                    environ, options["requests"]
+                )
+                self.stdout.write(
+                    f"{name:20} median {statistics.median(timings):7.2f}ms  "
+                    f"p95 {self.percentile(timings, 95):7.2f}ms  "
+                    f"connections {metrics['connections_opened']:5}  "
+                    f"reuse {metrics['reuse_ratio']:6.1%}"
+                )
+        finally:
+            connection.close()
+            connection.settings_dict.update(original)
+
+    @override_settings(USER_DATA_CACHE_TIMEOUT=0)
+    def time_requests(self, environ, count):
+        handler = WSGIHandler()
+        statuses = []
+
+        def start_response(status, headers):
+            statuses.append(status)
+
+        ConnectionMetrics.reset()
+        timings = []
+        for _ in range(count):
+            start = time.perf_counter()
+            response = handler(dict(environ), start_response)
+            b"".join(response)
+            response.close()
+            timings.append((time.perf_counter() - start) * 1000)
+            if not statuses[-1].startswith("200"):
+                raise CommandError(f"Request failed with {statuses[-1]}")
+        return timings, ConnectionMetrics.snapshot()
+
+    @staticmethod
+    def percentile(timings, percent):
+        ordered = sorted(timings)
+        return ordered[min(len(ordered) - 1, len(ordered) * percent // 100)]
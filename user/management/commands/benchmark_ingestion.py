@@ -0,0 +1,137 @@
+import json
+import platform
+import shutil
+import tempfile
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from user.benchmarks import (
+    IngestionBenchmark,
+    UserDataGenerator,
+    current_commit,
+)
+from user.tasks import LOADERS
+
+
+class Command(BaseCommand):
+    help = (
+        "Times reading, header checking, validating and processing end to "
+        "end a generated UserData file in each format, and optionally "
+        "saves the results as JSON to compare against another commit. The "
+        "same options always generate the same rows. Benchmark rows are "
+        "deleted again afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=50000)
+        parser.add_argument("--invalid-ratio", type=float, default=0.05)
+        parser.add_argument("--duplicate-ratio", type=float, default=0.05)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--formats", nargs="+", default=[".csv", ".xlsx"],
+            choices=UserDataGenerator.WRITABLE_EXTENSIONS,
+        )
+        parser.add_argument(
+            "--stages", nargs="+", default=list(IngestionBenchmark.STAGES),
+            choices=IngestionBenchmark.STAGES,
+            help="Leave out end_to_end to run without a database.",
+        )
+        parser.add_argument("--repeat", type=int, default=3)
+        parser.add_argument("--loader", choices=LOADERS)
+        parser.add_argument("--output", help="File to save the results to.")
+        parser.add_argument(
+            "--baseline", help="Results saved earlier to compare against."
+        )
+
+    def handle(self, *args, **options):
+        try:
+            generator = UserDataGenerator(
+                options["rows"],
+                invalid_ratio=options["invalid_ratio"],
+                duplicate_ratio=options["duplicate_ratio"],
+                seed=options["seed"],
+                prefix=f"benchmark-ingestion-{options['seed']}-",
+            )
+        except ValueError as exc:
+            raise CommandError(exc)
+        parameters = {
+            "rows": options["rows"],
+            "invalid_ratio": options["invalid_ratio"],
+            "duplicate_ratio": options["duplicate_ratio"],
+            "seed": options["seed"],
+            "repeat": options["repeat"],
+        }
+        baseline = None
+        if options["baseline"]:
+            baseline = self.load(options["baseline"])
+            if baseline.get("parameters") != parameters:
+                self.stderr.write(
+                    "The baseline was run with different options: "
+                    f"{baseline.get('parameters')}"
+                )
+
+        directory = tempfile.mkdtemp(prefix="benchmark-ingestion-")
+        benchmark = IngestionBenchmark(
+            generator,
+            directory,
+            stages=options["stages"],
+            repeat=options["repeat"],
+            loader=options["loader"],
+        )
+        results = {}
+        try:
+            for extension in options["formats"]:
+                results[extension] = benchmark.run(extension)
+                self.report(extension, results[extension], baseline)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+        if options["output"]:
+            report = {
+                "commit": current_commit(),
+                "created_at": timezone.now().isoformat(),
+                "environment": {
+                    "python": platform.python_version(),
+                    "django": django.get_version(),
+                    "database": connection.vendor,
+                    "loader": benchmark.loader,
+                    "batch_size": settings.USER_DATA_BATCH_SIZE,
+                },
+                "parameters": parameters,
+                "results": results,
+            }
+            with open(options["output"], "w") as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Saved results to {options['output']}")
+
+    def report(self, extension, result, baseline):
+        self.stdout.write(
+            f"{extension}: {result['bytes']:,} bytes, {result['counts']}"
+        )
+        previous = {}
+        if baseline is not None:
+            previous = (
+                baseline["results"].get(extension, {}).get("stages", {})
+            )
+        for stage, timing in result["stages"].items():
+            line = f"  {stage:11} {timing['seconds']:8.3f}s"
+            if timing["rows_per_second"] is not None:
+                line += f"  {timing['rows_per_second']:12,.0f} rows/s"
+            else:
+                line += " " * 21
+            if stage in previous:
+                change = timing["seconds"] / previous[stage]["seconds"] - 1
+                line += f"  {change:+7.1%} vs baseline"
+            self.stdout.write(line)
+
+    @staticmethod
+    def load(path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as exc:
+            raise CommandError(f"Cannot read baseline {path}: {exc}")
@@ -0,0 +1,58 @@
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from user.models import UserData
+from user.tasks import LOADERS, ingest_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares the ingestion throughput of the UserData loaders. "
+        "Benchmark rows are deleted again afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=100000)
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--loaders", nargs="+", choices=LOADERS, default=list(LOADERS)
+        )
+
+    def handle(self, *args, **options):
+        for loader in options["loaders"]:
+            prefix = f"benchmark-{loader}-{uuid.uuid4().hex}-"
+            rows = [
+                {
+                    "first_name": "John",
+                    "last_name": "Doe",
+                    "national_id": str(index),
+                    "birth_date": "1990-01-01",
+                    "address": "123 Main St",
+                    "country": "Kenya",
+                    "phone_number": "254700000000",
+                    "email": f"john{index}@example.com",
+                    "finger_print_signature": f"{prefix}{index}",
+                }
+                for index in range(options["rows"])
+            ]
+
+            try:
+                with override_settings(
+                    USER_DATA_BATCH_SIZE=options["batch_size"]
+                ):
+                    start = time.perf_counter()
+                    result = ingest_rows(iter(rows), loader=loader)
+                    elapsed = time.perf_counter() - start
+            finally:
+                UserData.objects.filter(
+                    finger_print_signature__startswith=prefix
+                ).delete()
+
+            self.stdout.write(
+                f"{loader}: {result['inserted']} rows in {elapsed:.2f}s "
+                f"({result['inserted'] / elapsed:,.0f} rows/s, "
+                f"{result['insert_seconds']:.2f}s inserting)"
+            )
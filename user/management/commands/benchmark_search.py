@@ -0,0 +1,92 @@
+import random
+import statistics
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+from rest_framework.test import APIRequestFactory
+
+from user.filters import SEARCH_BACKEND_FULLTEXT, SEARCH_BACKEND_ICONTAINS
+from user.helpers import CopyInserter
+from user.models import UserData
+from user.tasks import USER_DATA_FIELDS
+from user.views import UserDataViewSet
+
+FIRST_NAMES = ["John", "Jane", "Peter", "Mary", "Joseph", "Grace", "Brian"]
+LAST_NAMES = ["Doe", "Kamau", "Otieno", "Wanjiru", "Mwangi", "Achieng"]
+QUERIES = [
+    {"search": "jo"},
+    {"search": "kamau"},
+    {"search": "grace otieno"},
+    {"search": "2547001"},
+    {"first_name": "Mary"},
+    {"ordering": "last_name"},
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds UserData rows and compares /v1/users/ latency for the "
+        "icontains and full-text search backends. Requires PostgreSQL. "
+        "Seeded rows are deleted again afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=200000)
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        prefix = f"benchmark-search-{uuid.uuid4().hex}-"
+        try:
+            self.seed(prefix, options["rows"], options["seed"])
+            for backend in (SEARCH_BACKEND_ICONTAINS, SEARCH_BACKEND_FULLTEXT):
+                with override_settings(USER_DATA_SEARCH_BACKEND=backend):
+                    for params in QUERIES:
+                        timings = self.time_query(params, options["repeat"])
+                        self.stdout.write(
+                            f"{backend:9} {str(params):28} "
+                            f"median {statistics.median(timings):7.2f}ms  "
+                            f"max {max(timings):7.2f}ms"
+                        )
+        finally:
+            UserData.objects.filter(
+                finger_print_signature__startswith=prefix
+            ).delete()
+
+    def seed(self, prefix, rows, seed):
+        generator = random.Random(seed)
+        inserter = CopyInserter(
+            UserData, USER_DATA_FIELDS, "finger_print_signature",
+            batch_size=10000,
+        )
+        for index in range(rows):
+            first_name = generator.choice(FIRST_NAMES)
+            inserter.add({
+                "first_name": first_name,
+                "last_name": generator.choice(LAST_NAMES),
+                "national_id": str(index),
+                "birth_date": "1990-01-01",
+                "address": "123 Main St",
+                "country": "Kenya",
+                "phone_number": f"254700{generator.randrange(10**6):06d}",
+                "email": f"{first_name.lower()}{index}@example.com",
+                "finger_print_signature": f"{prefix}{index}",
+            })
+        inserter.flush()
+        with connection.cursor() as cursor:
+            cursor.execute(f"ANALYZE {UserData._meta.db_table}")
+
+    def time_query(self, params, repeat):
+        view = UserDataViewSet.as_view({"get": "list"})
+        factory = APIRequestFactory()
+        timings = []
+        for _ in range(repeat):
+            request = factory.get("/v1/users/", params)
+            start = time.perf_counter()
+            response = view(request)
+            response.render()
+            timings.append((time.perf_counter() - start) * 1000)
+        return timings
@@ -0,0 +1,92 @@
+import statistics
+import time
+import tracemalloc
+import uuid
+
+from django.core.management.base import BaseCommand
+from rest_framework.mixins import ListModelMixin
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from user.helpers import BatchInserter
+from user.models import UserData
+from user.views import UserDataViewSet
+
+
+class SerializerUserDataViewSet(UserDataViewSet):
+    """The list as served before the values() path and FastJSONRenderer."""
+
+    renderer_classes = [JSONRenderer]
+    list = ListModelMixin.list
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares /v1/users/ latency and allocations for the values() and "
+        "orjson list path against ModelSerializer and JSONRenderer. "
+        "Seeded rows are deleted again afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=5000)
+        parser.add_argument("--page-size", type=int, default=1000)
+        parser.add_argument("--repeat", type=int, default=20)
+
+    def handle(self, *args, **options):
+        prefix = f"benchmark-serialization-{uuid.uuid4().hex}-"
+        params = {"page_size": options["page_size"]}
+        try:
+            self.seed(prefix, options["rows"])
+            for name, viewset in (
+                ("serializer", SerializerUserDataViewSet),
+                ("values", UserDataViewSet),
+            ):
+                timings = self.time_list(viewset, params, options["repeat"])
+                peak = self.measure_peak_memory(viewset, params)
+                self.stdout.write(
+                    f"{name:10} median {statistics.median(timings):7.2f}ms  "
+                    f"max {max(timings):7.2f}ms  "
+                    f"peak allocated {peak / 1024:8.1f}KiB"
+                )
+        finally:
+            UserData.objects.filter(
+                finger_print_signature__startswith=prefix
+            ).delete()
+
+    def seed(self, prefix, rows):
+        inserter = BatchInserter(UserData, batch_size=5000)
+        for index in range(rows):
+            inserter.add(UserData(
+                first_name="John",
+                last_name="Doe",
+                national_id=str(index),
+                birth_date="1990-01-01",
+                address="123 Main St",
+                country="Kenya",
+                phone_number=f"254700{index:06d}",
+                email=f"john{index}@example.com",
+                finger_print_signature=f"{prefix}{index}",
+            ))
+        inserter.flush()
+
+    def render(self, viewset, params):
+        view = viewset.as_view({"get": "list"})
+        request = APIRequestFactory().get("/v1/users/", params)
+        return view(request).render()
+
+    def time_list(self, viewset, params, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            self.render(viewset, params)
+            timings.append((time.perf_counter() - start) * 1000)
+        return timings
+
+    def measure_peak_memory(self, viewset, params):
+        """Returns the most memory in bytes allocated during one request."""
+        tracemalloc.start()
+        try:
+            self.render(viewset, params)
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
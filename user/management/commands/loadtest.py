@@ -0,0 +1,362 @@
+import contextlib
+import http.client
+import json
+import os
+import subprocess
+import threading
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from user.benchmarks import (
+    UPLOADS_PATH,
+    LatencySummary,
+    LoadTestMix,
+    UserDataGenerator,
+    current_commit,
+    multipart_file,
+    seed_user_data,
+)
+from user.models import UserData
+
+SLOW_UPLOAD_CSV = (
+    "first_name,last_name,national_id,birth_date,address,"
+    "country,phone_number,email,finger_print_signature\n"
+).encode()
+SEED_PREFIX = "loadtest-seed-"
+# The server configurations --serve can start, all run with gunicorn
+SERVERS = {
+    "sync": ["fileUpload.wsgi:application", "--worker-class", "sync"],
+    "threaded": [
+        "fileUpload.wsgi:application", "--worker-class", "gthread",
+        "--threads", "4",
+    ],
+    "asgi": [
+        "fileUpload.asgi:application",
+        "--worker-class", "uvicorn.workers.UvicornWorker",
+    ],
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Sends concurrent requests to running servers, or to gunicorn "
+        "servers it starts with --serve, and reports throughput, error "
+        "rate and p50/p95/p99 latency for each. --scenario users filters, "
+        "searches, orders and pages deep into /v1/users/; uploads posts "
+        "CSV files of varying sizes; mixed does both; url requests the "
+        "given URL. --slow-uploads keeps that many uploads trickling in "
+        "at the same time, to compare how sync and ASGI workers cope with "
+        "slow clients."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "urls", nargs="*",
+            help="e.g. http://127.0.0.1:8000/v1/users/, optionally named "
+            "as name=URL",
+        )
+        parser.add_argument(
+            "--serve", nargs="+", choices=SERVERS, default=[],
+            help="Start each of these gunicorn configurations in turn.",
+        )
+        parser.add_argument("--port", type=int, default=8010)
+        parser.add_argument("--workers", type=int, default=2)
+        parser.add_argument(
+            "--scenario", default="url",
+            choices=["url", *LoadTestMix.SCENARIOS],
+        )
+        parser.add_argument("--concurrency", type=int, default=16)
+        parser.add_argument("--duration", type=float, default=10.0)
+        parser.add_argument(
+            "--warmup", type=float, default=1.0,
+            help="Seconds of requests sent before measuring.",
+        )
+        parser.add_argument("--timeout", type=float, default=30.0)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--page-size", type=int, default=100)
+        parser.add_argument(
+            "--upload-rows", type=int, nargs="+", default=[100, 1000, 10000]
+        )
+        parser.add_argument(
+            "--seed-rows", type=int, default=0,
+            help="Insert this many UserData rows first. They are kept, so "
+            "later runs reuse them; see --remove-seed.",
+        )
+        parser.add_argument(
+            "--remove-seed", action="store_true",
+            help="Delete the rows inserted by --seed-rows and by the "
+            "uploads of earlier runs, then exit.",
+        )
+        parser.add_argument("--slow-uploads", type=int, default=0)
+        parser.add_argument(
+            "--upload-seconds", type=float, default=5.0,
+            help="Time each slow upload takes to send its body.",
+        )
+        parser.add_argument("--output", help="File to save the results to.")
+
+    def handle(self, *args, **options):
+        if options["remove_seed"]:
+            _, deleted = UserData.objects.filter(
+                finger_print_signature__startswith="loadtest-"
+            ).delete()
+            rows = deleted.get(UserData._meta.label, 0)
+            self.stdout.write(f"Deleted {rows} rows")
+            return
+        if not options["urls"] and not options["serve"]:
+            raise CommandError("Give the URL of a server, or use --serve.")
+        if options["serve"] and options["scenario"] == "url":
+            raise CommandError("--serve needs a --scenario other than url.")
+        targets = [self.parse_target(target) for target in options["urls"]]
+
+        if options["seed_rows"]:
+            seed_user_data(UserDataGenerator(
+                options["seed_rows"], seed=options["seed"], prefix=SEED_PREFIX
+            ))
+        mix = None
+        if options["scenario"] != "url":
+            mix = LoadTestMix(
+                options["scenario"],
+                UserData.objects.count(),
+                seed=options["seed"],
+                page_size=options["page_size"],
+                upload_rows=options["upload_rows"],
+            )
+
+        results = {}
+        for name, url in targets:
+            results[name] = self.run(name, url, mix, options)
+        for name in options["serve"]:
+            url = urlsplit(f"http://127.0.0.1:{options['port']}/")
+            with self.serve(name, options["port"], options["workers"]):
+                results[name] = self.run(name, url, mix, options)
+        if len(results) > 1:
+            self.compare(results)
+
+        if options["output"]:
+            report = {
+                "commit": current_commit(),
+                "created_at": timezone.now().isoformat(),
+                "parameters": {
+                    option: options[option]
+                    for option in (
+                        "scenario", "concurrency", "duration", "warmup",
+                        "seed", "page_size", "upload_rows", "workers",
+                        "slow_uploads",
+                    )
+                },
+                "results": results,
+            }
+            with open(options["output"], "w") as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Saved results to {options['output']}")
+
+    @staticmethod
+    def parse_target(target):
+        name, _, address = target.partition("=")
+        # The "=" was in the query string of an unnamed URL
+        if "://" in name:
+            name, address = "", target
+        url = urlsplit(address)
+        if url.scheme != "http" or not url.hostname:
+            raise CommandError("Only http:// URLs are supported.")
+        return name or url.netloc, url
+
+    @contextlib.contextmanager
+    def serve(self, name, port, workers):
+        """Runs a gunicorn configuration until the block exits."""
+        process = subprocess.Popen(
+            [
+                "gunicorn", *SERVERS[name],
+                "--workers", str(workers),
+                "--bind", f"127.0.0.1:{port}",
+            ],
+            env=dict(os.environ),
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            self.wait_until_ready(process, port)
+            yield
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+
+    @staticmethod
+    def wait_until_ready(process, port, timeout=30.0):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise CommandError(
+                    f"The server exited with status {process.returncode}."
+                )
+            try:
+                connection = http.client.HTTPConnection(
+                    "127.0.0.1", port, timeout=5
+                )
+                connection.request("GET", "/metrics")
+                connection.getresponse().read()
+                connection.close()
+                return
+            except OSError:
+                time.sleep(0.2)
+        raise CommandError(f"The server did not start within {timeout}s.")
+
+    def run(self, name, url, mix, options):
+        """
+        Sends requests from concurrent clients for the given duration.
+
+        Returns:
+            dict: The summary of all requests, as built by
+            ``LatencySummary.summarize``, with one per request kind under
+            "kinds" and the slow uploads sent and completed.
+        """
+        path = url.path + (f"?{url.query}" if url.query else "")
+        timeout = options["timeout"]
+        started = time.monotonic()
+        measure_from = started + options["warmup"]
+        deadline = measure_from + options["duration"]
+        samples, uploads = [], []
+        lock = threading.Lock()
+
+        def request_loop(stream):
+            if mix is not None:
+                requests = mix.requests(stream)
+            else:
+                requests = iter(lambda: ("url", "GET", path, None, {}), None)
+            while time.monotonic() < deadline:
+                kind, method, request_path, body, headers = next(requests)
+                expected = LoadTestMix.EXPECTED_STATUSES.get(kind, (200,))
+                sent = time.monotonic()
+                start = time.perf_counter()
+                try:
+                    status = self.send(
+                        url, method, request_path, body, headers, timeout
+                    )
+                except OSError as exc:
+                    status = type(exc).__name__
+                elapsed = time.perf_counter() - start
+                if sent < measure_from:
+                    continue
+                with lock:
+                    samples.append((kind, elapsed, status in expected, status))
+
+        def upload_loop():
+            while time.monotonic() < deadline:
+                try:
+                    status = self.slow_upload(
+                        url, options["upload_seconds"], timeout
+                    )
+                except OSError as exc:
+                    status = type(exc).__name__
+                with lock:
+                    uploads.append(status)
+
+        threads = [
+            threading.Thread(target=request_loop, args=(stream,))
+            for stream in range(options["concurrency"])
+        ] + [
+            threading.Thread(target=upload_loop)
+            for _ in range(options["slow_uploads"])
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # Requests still in flight at the deadline are counted too
+        elapsed = max(time.monotonic(), deadline) - measure_from
+
+        result = self.summarize(samples, elapsed)
+        result["kinds"] = {
+            kind: self.summarize(
+                [sample for sample in samples if sample[0] == kind], elapsed
+            )
+            for kind in sorted({sample[0] for sample in samples})
+        }
+        result["slow_uploads"] = len(uploads)
+        result["slow_uploads_completed"] = sum(
+            1 for status in uploads if status in (200, 201)
+        )
+        self.report(name, result, samples)
+        return result
+
+    @staticmethod
+    def summarize(samples, elapsed):
+        return LatencySummary.summarize(
+            [seconds for _, seconds, ok, _ in samples if ok],
+            sum(1 for _, _, ok, _ in samples if not ok),
+            elapsed,
+        )
+
+    def send(self, url, method, path, body, headers, timeout):
+        connection = http.client.HTTPConnection(
+            url.hostname, url.port or 80, timeout=timeout
+        )
+        try:
+            connection.request(method, path, body=body, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            return response.status
+        finally:
+            connection.close()
+
+    def slow_upload(self, url, seconds, timeout):
+        """
+        Posts a small CSV to the upload endpoint, sending the multipart
+        body in ten pieces spread over the given number of seconds.
+        """
+        body, content_type = multipart_file(SLOW_UPLOAD_CSV, "loadtest.csv")
+        pieces = 10
+        size = -(-len(body) // pieces)
+
+        connection = http.client.HTTPConnection(
+            url.hostname, url.port or 80, timeout=timeout
+        )
+        try:
+            connection.putrequest("POST", UPLOADS_PATH)
+            connection.putheader("Content-Type", content_type)
+            connection.putheader("Content-Length", str(len(body)))
+            connection.endheaders()
+            for offset in range(0, len(body), size):
+                time.sleep(seconds / pieces)
+                connection.send(body[offset:offset + size])
+            response = connection.getresponse()
+            response.read()
+            return response.status
+        finally:
+            connection.close()
+
+    def report(self, server, result, samples):
+        self.stdout.write(server)
+        for name, summary in [("all", result), *result["kinds"].items()]:
+            self.stdout.write(f"  {name:10} {self.format(summary)}")
+        failures = sorted({str(status) for _, _, ok, status in samples
+                           if not ok})
+        if failures:
+            self.stdout.write(f"  error statuses {failures}")
+        if result["slow_uploads"]:
+            self.stdout.write(
+                f"  slow uploads {result['slow_uploads']}  "
+                f"completed {result['slow_uploads_completed']}"
+            )
+
+    def compare(self, results):
+        self.stdout.write("comparison")
+        width = max(len(name) for name in results)
+        for name, result in results.items():
+            self.stdout.write(f"  {name:{width}} {self.format(result)}")
+
+    @staticmethod
+    def format(summary):
+        latencies = "  ".join(
+            f"{name} {summary[name]:8.1f}ms" if summary[name] is not None
+            else f"{name} {'-':>8}  "
+            for name in ("p50", "p95", "p99")
+        )
+        return (
+            f"requests {summary['requests']:6}  "
+            f"errors {summary['error_rate']:6.1%}  "
+            f"throughput {summary['throughput']:8.1f} req/s  {latencies}"
+        )
@@ -0,0 +1,35 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from user.metrics import QueueMetrics
+from user.tasks import INGESTION_QUEUES
+
+
+class Command(BaseCommand):
+    help = (
+        "Shows how many tasks wait in each ingestion queue and how long "
+        "uploads picked up recently waited in it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--minutes", type=int, default=60,
+            help="Only count uploads picked up in this many minutes.",
+        )
+
+    def handle(self, *args, **options):
+        since = timezone.now() - datetime.timedelta(minutes=options["minutes"])
+        depths = QueueMetrics.depths(INGESTION_QUEUES)
+        waits = QueueMetrics.wait_times(since)
+        for queue in INGESTION_QUEUES:
+            wait = waits.get(queue)
+            line = f"{queue:14} depth {depths[queue]:6}"
+            if wait:
+                line += (
+                    f"  uploads {wait['uploads']:6}"
+                    f"  wait avg {wait['average']:8.1f}s"
+                    f"  max {wait['longest']:8.1f}s"
+                )
+            self.stdout.write(line)
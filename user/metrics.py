@@ -0,0 +1,334 @@
+import os
+import threading
+
+from celery import current_app
+from django.db.models import Avg, Count, Max
+from kombu.exceptions import ChannelError, OperationalError
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client.core import GaugeMetricFamily
+
+from .models import FileUpload
+
+# Prometheus metrics. With PROMETHEUS_MULTIPROC_DIR set, every gunicorn,
+# uvicorn and Celery worker process writes its samples to files in that
+# directory and /metrics adds them up, so it must be shared by the web
+# and worker processes and emptied when they are all restarted.
+REQUEST_SECONDS = Histogram(
+    "fileupload_http_request_duration_seconds",
+    "Time to build the response of an API request; for streaming "
+    "responses, the time to the first byte.",
+    ["view", "method"],
+)
+REQUESTS = Counter(
+    "fileupload_http_requests_total",
+    "API requests served, by response status.",
+    ["view", "method", "status"],
+)
+INGESTION_STAGE_SECONDS = Histogram(
+    "fileupload_ingestion_stage_seconds",
+    "Time spent per batch in each ingestion stage, and per file checking "
+    "the header.",
+    ["stage"],
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+INGESTION_ROWS_PER_SECOND = Histogram(
+    "fileupload_ingestion_rows_per_second",
+    "Rows read per second over each processed upload.",
+    buckets=(100, 1000, 5000, 10000, 25000, 50000, 100000, 250000, 500000),
+)
+INGESTION_BYTES_PER_SECOND = Histogram(
+    "fileupload_ingestion_bytes_per_second",
+    "Bytes of the stored file ingested per second over each processed "
+    "upload.",
+    buckets=(1e4, 1e5, 1e6, 5e6, 1e7, 2.5e7, 5e7, 1e8, 2.5e8, 1e9),
+)
+INGESTED_ROWS = Counter(
+    "fileupload_ingested_rows_total",
+    "Rows read from uploads, by outcome: inserted, rejected or duplicate.",
+    ["outcome"],
+)
+QUEUE_WAIT_SECONDS = Histogram(
+    "fileupload_queue_wait_seconds",
+    "Time from dispatching an upload to a worker claiming it.",
+    ["queue"],
+    buckets=(0.1, 0.5, 1, 5, 15, 60, 300, 900, 3600, 4 * 3600),
+)
+DB_CONNECTION_EVENTS = Counter(
+    "fileupload_db_connection_events_total",
+    "Database connections opened, and requests and tasks served.",
+    ["event"],
+)
+
+
+class ConnectionMetrics:
+    """
+    Counts the database connections a process opens against the requests
+    and tasks it serves, which shows how often persistent connections
+    (``CONN_MAX_AGE``) are reused instead of opened anew.
+
+    Counters are kept per process and only grow.
+    """
+
+    _lock = threading.Lock()
+    _counters = {"connections_opened": 0, "requests": 0, "tasks": 0}
+
+    @staticmethod
+    def increment(name, value=1):
+        """
+        Adds to a counter.
+
+        Args:
+            name (str): "connections_opened", "requests" or "tasks".
+            value (int): The amount to add.
+        """
+        with ConnectionMetrics._lock:
+            ConnectionMetrics._counters[name] += value
+        DB_CONNECTION_EVENTS.labels(event=name).inc(value)
+
+    @staticmethod
+    def snapshot():
+        """
+        Returns the counters along with the share of requests and tasks
+        that ran on a connection kept from an earlier one.
+
+        Returns:
+            dict: The counters and "reuse_ratio", a float from 0 to 1.
+        """
+        with ConnectionMetrics._lock:
+            counters = dict(ConnectionMetrics._counters)
+        served = counters["requests"] + counters["tasks"]
+        reused = max(served - counters["connections_opened"], 0)
+        counters["reuse_ratio"] = reused / served if served else 0.0
+        return counters
+
+    @staticmethod
+    def reset():
+        """Sets every counter back to zero."""
+        with ConnectionMetrics._lock:
+            for name in ConnectionMetrics._counters:
+                ConnectionMetrics._counters[name] = 0
+
+
+class QueueMetrics:
+    """
+    Reports how many tasks wait in each ingestion queue and how long
+    uploads waited there before a worker picked them up.
+    """
+
+    @staticmethod
+    def depths(queues, timeout=None):
+        """
+        Counts the messages waiting in each queue of the broker.
+
+        Args:
+            queues (iterable of str): The queue names.
+            timeout (float): Seconds to wait for the broker, which is
+            then tried only once. By default the connection is retried
+            as configured for the app.
+
+        Returns:
+            dict: The number of waiting messages by queue name. A queue
+            the broker does not know yet counts as empty.
+        """
+        options = {}
+        if timeout is not None:
+            options = {
+                "connect_timeout": timeout,
+                "transport_options": {
+                    "socket_connect_timeout": timeout,
+                    "socket_timeout": timeout,
+                },
+            }
+        depths = {}
+        with current_app.connection_for_read(**options) as connection:
+            if timeout is not None:
+                connection.ensure_connection(max_retries=0, timeout=timeout)
+            channel = connection.default_channel
+            for queue in queues:
+                try:
+                    declared = channel.queue_declare(queue=queue, passive=True)
+                except ChannelError:
+                    depths[queue] = 0
+                else:
+                    depths[queue] = declared.message_count
+        return depths
+
+    @staticmethod
+    def wait_times(since):
+        """
+        Summarizes the time uploads picked up since the given time spent
+        waiting in their queue.
+
+        Args:
+            since (datetime.datetime): Only uploads whose processing
+            started at or after this time are counted.
+
+        Returns:
+            dict: By queue name, a dict with the number of "uploads" and
+            the "average" and "longest" wait in seconds.
+        """
+        rows = (
+            FileUpload.objects.filter(
+                processing_started_at__gte=since,
+                queue_wait_seconds__isnull=False,
+            )
+            .values("queue")
+            .annotate(
+                uploads=Count("id"),
+                average=Avg("queue_wait_seconds"),
+                longest=Max("queue_wait_seconds"),
+            )
+            .order_by("queue")
+        )
+        return {row.pop("queue"): row for row in rows}
+
+
+class UploadStateCollector:
+    """
+    Reports, each time metrics are scraped, how many uploads are in each
+    status, whether the broker answered and how many tasks wait in each
+    ingestion queue.
+    """
+
+    # Seconds a scrape waits for the broker before reporting it down
+    broker_timeout = 1.0
+
+    def __init__(self, queues=()):
+        self.queues = queues
+
+    def collect(self):
+        uploads = GaugeMetricFamily(
+            "fileupload_uploads",
+            "File uploads by status.",
+            labels=["status"],
+        )
+        counts = dict(
+            FileUpload.objects.values_list("status")
+            .annotate(Count("id"))
+            .order_by()
+        )
+        for status, _ in FileUpload.FILE_STATUSES:
+            uploads.add_metric([status], counts.get(status, 0))
+        yield uploads
+
+        broker_up = GaugeMetricFamily(
+            "fileupload_broker_up",
+            "Whether the broker answered when the queue depths were read.",
+        )
+        try:
+            depths = QueueMetrics.depths(self.queues, self.broker_timeout)
+        except (OSError, OperationalError):
+            # The broker is down; the upload counts are still useful
+            broker_up.add_metric([], 0)
+            yield broker_up
+            return
+        broker_up.add_metric([], 1)
+        yield broker_up
+        depth = GaugeMetricFamily(
+            "fileupload_queue_depth",
+            "Tasks waiting in each ingestion queue.",
+            labels=["queue"],
+        )
+        for queue, count in depths.items():
+            depth.add_metric([queue], count)
+        yield depth
+
+
+class PrometheusMetrics:
+    """Records and renders the Prometheus metrics defined above."""
+
+    CONTENT_TYPE = CONTENT_TYPE_LATEST
+
+    @staticmethod
+    def observe_request(view, method, status, seconds):
+        """
+        Records the latency and status of an API request.
+
+        Args:
+            view (str): The URL name of the view, e.g. "user-list".
+            method (str): The HTTP method.
+            status (int): The response status code.
+            seconds (float): Time taken to build the response.
+        """
+        REQUEST_SECONDS.labels(view=view, method=method).observe(seconds)
+        REQUESTS.labels(view=view, method=method, status=status).inc()
+
+    @staticmethod
+    def time_stage(stage):
+        """
+        Times an ingestion stage.
+
+        Args:
+            stage (str): "header", "parse", "validate", "dedup" or
+            "insert".
+
+        Returns:
+            context manager: Observes the time spent inside it.
+        """
+        return INGESTION_STAGE_SECONDS.labels(stage=stage).time()
+
+    @staticmethod
+    def observe_queue_wait(queue, seconds):
+        QUEUE_WAIT_SECONDS.labels(queue=queue or "unknown").observe(seconds)
+
+    @staticmethod
+    def observe_rows(result):
+        """
+        Counts the rows of one ingestion run by outcome.
+
+        Args:
+            result (dict): Counters as returned by ``ingest_rows``.
+        """
+        rejected = sum(result["rejected"].values())
+        INGESTED_ROWS.labels(outcome="inserted").inc(result["inserted"])
+        INGESTED_ROWS.labels(outcome="rejected").inc(rejected)
+        INGESTED_ROWS.labels(outcome="duplicate").inc(result["duplicates"])
+
+    @staticmethod
+    def observe_ingestion(file_upload):
+        """
+        Records the throughput of a processed upload.
+
+        Args:
+            file_upload (FileUpload): The upload, with its statistics
+            recorded.
+        """
+        if file_upload.bytes_per_second is not None:
+            INGESTION_BYTES_PER_SECOND.observe(file_upload.bytes_per_second)
+        if file_upload.processing_started_at is None:
+            return
+        elapsed = (
+            file_upload.processing_finished_at
+            - file_upload.processing_started_at
+        ).total_seconds()
+        if elapsed > 0:
+            INGESTION_ROWS_PER_SECOND.observe(file_upload.rows_read / elapsed)
+
+    @staticmethod
+    def render(queues=()):
+        """
+        Renders the metrics of this process, or of every process sharing
+        PROMETHEUS_MULTIPROC_DIR, along with the upload and queue gauges.
+
+        Args:
+            queues (iterable of str): The queues to report the depth of.
+
+        Returns:
+            bytes: The metrics in the Prometheus text format.
+        """
+        if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = REGISTRY
+        state = CollectorRegistry()
+        state.register(UploadStateCollector(queues))
+        return generate_latest(registry) + generate_latest(state)
@@ -0,0 +1,26 @@
+import time
+
+from .metrics import PrometheusMetrics
+
+
+class RequestMetricsMiddleware:
+    """
+    Records the latency and status of every request that reached a view,
+    labelled by the view's URL name, e.g. "user-list".
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        response = self.get_response(request)
+        match = request.resolver_match
+        if match is not None and match.view_name:
+            PrometheusMetrics.observe_request(
+                match.view_name,
+                request.method,
+                response.status_code,
+                time.perf_counter() - start,
+            )
+        return response
@@ -0,0 +1,57 @@
+# Generated by Django 4.1.7 on 2026-10-18 07:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("user", "0002_alter_userdata_options_alter_fileupload_file"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="fileupload",
+            name="bytes_per_second",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="fileupload",
+            name="duplicates_skipped",
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="fileupload",
+            name="processing_finished_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="fileupload",
+            name="processing_started_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="fileupload",
+            name="rejected_reasons",
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name="fileupload",
+            name="rejected_rows_file",
+            field=models.FileField(blank=True, upload_to="media/rejected/"),
+        ),
+        migrations.AddField(
+            model_name="fileupload",
+            name="rows_inserted",
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="fileupload",
+            name="rows_read",
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="fileupload",
+            name="rows_rejected",
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
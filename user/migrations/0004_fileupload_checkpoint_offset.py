@@ -0,0 +1,17 @@
+# Generated by Django 4.1.7 on 2026-10-18 07:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("user", "0003_fileupload_statistics"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="fileupload",
+            name="checkpoint_offset",
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
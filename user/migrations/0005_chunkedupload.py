@@ -0,0 +1,53 @@
+# Generated by Django 4.1.7 on 2026-10-18 07:33
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django_fsm
+import uuid
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("user", "0004_fileupload_checkpoint_offset"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ChunkedUpload",
+            fields=[
+                ("time_added", models.DateTimeField(auto_now_add=True)),
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("filename", models.CharField(max_length=255)),
+                ("size", models.PositiveBigIntegerField(blank=True, null=True)),
+                ("offset", models.PositiveBigIntegerField(default=0)),
+                (
+                    "status",
+                    django_fsm.FSMField(
+                        choices=[("uploading", "Uploading"), ("complete", "Complete")],
+                        default="uploading",
+                        max_length=50,
+                    ),
+                ),
+                (
+                    "file_upload",
+                    models.OneToOneField(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to="user.fileupload",
+                    ),
+                ),
+            ],
+            options={
+                "abstract": False,
+            },
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.1.7 on 2026-10-18 07:38
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Build the indexes without locking user_userdata against writes
+    atomic = False
+
+    dependencies = [
+        ("user", "0005_chunkedupload"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="userdata",
+            index=models.Index(fields=["first_name"], name="userdata_first_name_idx"),
+        ),
+        AddIndexConcurrently(
+            model_name="userdata",
+            index=models.Index(fields=["last_name"], name="userdata_last_name_idx"),
+        ),
+        AddIndexConcurrently(
+            model_name="userdata",
+            index=models.Index(
+                fields=["phone_number"], name="userdata_phone_number_idx"
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="userdata",
+            index=models.Index(fields=["email"], name="userdata_email_idx"),
+        ),
+        AddIndexConcurrently(
+            model_name="userdata",
+            index=models.Index(fields=["birth_date"], name="userdata_birth_date_idx"),
+        ),
+        AddIndexConcurrently(
+            model_name="userdata",
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.search.SearchVector(
+                    "first_name", "last_name", "phone_number", "email", config="simple"
+                ),
+                name="userdata_search_vector_idx",
+            ),
+        ),
+    ]
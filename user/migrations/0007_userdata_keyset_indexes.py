@@ -0,0 +1,50 @@
+# Generated by Django 4.1.7 on 2026-10-18 07:42
+
+from django.contrib.postgres.operations import (
+    AddIndexConcurrently,
+    RemoveIndexConcurrently,
+)
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Build the new indexes before dropping the ones they replace, without
+    # locking user_userdata against writes
+    atomic = False
+
+    dependencies = [
+        ("user", "0006_userdata_indexes"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="userdata",
+            index=models.Index(
+                fields=["first_name", "id"], name="userdata_first_name_id_idx"
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="userdata",
+            index=models.Index(
+                fields=["last_name", "id"], name="userdata_last_name_id_idx"
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="userdata",
+            index=models.Index(
+                fields=["birth_date", "id"], name="userdata_birth_date_id_idx"
+            ),
+        ),
+        RemoveIndexConcurrently(
+            model_name="userdata",
+            name="userdata_first_name_idx",
+        ),
+        RemoveIndexConcurrently(
+            model_name="userdata",
+            name="userdata_last_name_idx",
+        ),
+        RemoveIndexConcurrently(
+            model_name="userdata",
+            name="userdata_birth_date_idx",
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.1.7 on 2026-10-18 07:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("user", "0007_userdata_keyset_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="fileupload",
+            name="sha256",
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.1.7 on 2026-10-18 07:58
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("user", "0008_fileupload_sha256"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="fileupload",
+            name="original_filename",
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AlterField(
+            model_name="chunkedupload",
+            name="file_upload",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                to="user.fileupload",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="fileupload",
+            index=models.Index(fields=["sha256"], name="fileupload_sha256_idx"),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.1.7 on 2026-10-18 08:04
+
+from django.db import migrations, models
+import uuid
+
+
+def fill_dispatch_keys(apps, schema_editor):
+    # A default is evaluated once for AddField, which would give every
+    # existing upload the same key, and so the same Celery task id
+    FileUpload = apps.get_model("user", "FileUpload")
+    for file_upload in FileUpload.objects.filter(dispatch_key__isnull=True):
+        file_upload.dispatch_key = uuid.uuid4()
+        file_upload.save(update_fields=["dispatch_key"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("user", "0009_fileupload_dedup"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="fileupload",
+            name="dispatch_key",
+            field=models.UUIDField(editable=False, null=True),
+        ),
+        migrations.RunPython(
+            fill_dispatch_keys, reverse_code=migrations.RunPython.noop
+        ),
+        migrations.AlterField(
+            model_name="fileupload",
+            name="dispatch_key",
+            field=models.UUIDField(default=uuid.uuid4, editable=False),
+        ),
+        migrations.AddField(
+            model_name="fileupload",
+            name="dispatched_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="fileupload",
+            name="heartbeat_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.1.7 on 2026-10-18 08:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("user", "0010_fileupload_dispatch"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="chunkedupload",
+            name="priority",
+            field=models.CharField(
+                choices=[("high", "High"), ("normal", "Normal"), ("low", "Low")],
+                default="normal",
+                max_length=10,
+            ),
+        ),
+        migrations.AddField(
+            model_name="fileupload",
+            name="priority",
+            field=models.CharField(
+                choices=[("high", "High"), ("normal", "Normal"), ("low", "Low")],
+                default="normal",
+                max_length=10,
+            ),
+        ),
+        migrations.AddField(
+            model_name="fileupload",
+            name="queue",
+            field=models.CharField(blank=True, max_length=50),
+        ),
+        migrations.AddField(
+            model_name="fileupload",
+            name="queue_wait_seconds",
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.1.7 on 2026-10-18 08:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("user", "0011_upload_priority_queue"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="fileupload",
+            name="split_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
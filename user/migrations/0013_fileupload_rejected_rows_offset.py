@@ -0,0 +1,17 @@
+# Generated by Django 4.1.7 on 2026-10-18 08:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("user", "0012_fileupload_split_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="fileupload",
+            name="rejected_rows_offset",
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 4.1.7 on 2026-10-18 08:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("user", "0013_fileupload_rejected_rows_offset"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FileUploadChunk",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("time_added", models.DateTimeField(auto_now_add=True)),
+                ("start", models.PositiveBigIntegerField()),
+                ("end", models.PositiveBigIntegerField()),
+                ("rows_read", models.PositiveBigIntegerField(default=0)),
+                ("rows_inserted", models.PositiveBigIntegerField(default=0)),
+                ("rejected_reasons", models.JSONField(blank=True, default=dict)),
+                ("duplicates_skipped", models.PositiveBigIntegerField(default=0)),
+                ("checkpoint_offset", models.PositiveBigIntegerField()),
+                ("rejected_rows_offset", models.PositiveBigIntegerField(default=0)),
+                (
+                    "file_upload",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="chunks",
+                        to="user.fileupload",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="fileuploadchunk",
+            constraint=models.UniqueConstraint(
+                fields=("file_upload", "start"),
+                name="fileuploadchunk_upload_start_uniq",
+            ),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.1.7 on 2026-10-18 08:43
+
+from django.db import migrations, models
+
+
+def copy_dispatched_at(apps, schema_editor):
+    # The last dispatch is the best known first dispatch of existing rows
+    FileUpload = apps.get_model("user", "FileUpload")
+    FileUpload.objects.update(first_dispatched_at=models.F("dispatched_at"))
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("user", "0014_fileuploadchunk"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="fileupload",
+            name="first_dispatched_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(
+            copy_dispatched_at, reverse_code=migrations.RunPython.noop
+        ),
+    ]
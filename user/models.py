@@ -1,5 +1,9 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector
 from django.db import models
+from django.utils import timezone
 import os
+import uuid
 from django_fsm import FSMField, transition
 
 
@@ -10,6 +14,17 @@ class Base(models.Model):
         abstract = True
 
 
+def user_data_search_vector():
+    """
+    Builds the full-text search vector over the searchable UserData
+    fields. The same expression backs the GIN index, so queries must use
+    this function for PostgreSQL to pick the index.
+    """
+    return SearchVector(
+        "first_name", "last_name", "phone_number", "email", config="simple"
+    )
+
+
 class UserData(Base):
     first_name = models.CharField(max_length=100)
     last_name = models.CharField(max_length=100)
@@ -23,6 +38,25 @@ class UserData(Base):
 
     class Meta:
         ordering = ["-id"]
+        indexes = [
+            # Ordering fields are paired with id for keyset pagination
+            models.Index(
+                fields=["first_name", "id"], name="userdata_first_name_id_idx"
+            ),
+            models.Index(
+                fields=["last_name", "id"], name="userdata_last_name_id_idx"
+            ),
+            models.Index(
+                fields=["phone_number"], name="userdata_phone_number_idx"
+            ),
+            models.Index(fields=["email"], name="userdata_email_idx"),
+            models.Index(
+                fields=["birth_date", "id"], name="userdata_birth_date_id_idx"
+            ),
+            GinIndex(
+                user_data_search_vector(), name="userdata_search_vector_idx"
+            ),
+        ]
 
     def is_finger_print_signature_unique(self):
         """
@@ -64,9 +98,67 @@ class FileUpload(Base):
         (FILE_STATUS_PROCESSED, "Processed"),
         (FILE_STATUS_FAILED, "Failed"),
     )
+    PRIORITY_HIGH = "high"
+    PRIORITY_NORMAL = "normal"
+    PRIORITY_LOW = "low"
+    PRIORITIES = (
+        (PRIORITY_HIGH, "High"),
+        (PRIORITY_NORMAL, "Normal"),
+        (PRIORITY_LOW, "Low"),
+    )
 
     file = models.FileField(upload_to="media/uploads/")
+    # Uploads are stored under their content hash, so keep the name the
+    # client sent
+    original_filename = models.CharField(max_length=255, blank=True)
     status = FSMField(default=FILE_STATUS_PENDING, choices=FILE_STATUSES)
+    # Hex SHA-256 of the file content, computed while it is received
+    sha256 = models.CharField(max_length=64, blank=True)
+
+    # Ingestion statistics, filled in by process_uploaded_file
+    rows_read = models.PositiveBigIntegerField(default=0)
+    rows_inserted = models.PositiveBigIntegerField(default=0)
+    rows_rejected = models.PositiveBigIntegerField(default=0)
+    rejected_reasons = models.JSONField(default=dict, blank=True)
+    duplicates_skipped = models.PositiveBigIntegerField(default=0)
+    bytes_per_second = models.FloatField(null=True, blank=True)
+    processing_started_at = models.DateTimeField(null=True, blank=True)
+    processing_finished_at = models.DateTimeField(null=True, blank=True)
+    # Byte offset of the CSV body up to which rows are committed, so an
+    # interrupted ingestion can resume instead of starting over
+    checkpoint_offset = models.PositiveBigIntegerField(default=0)
+    rejected_rows_file = models.FileField(
+        upload_to="media/rejected/", blank=True
+    )
+    # Size of the rejected-rows file at that checkpoint, so rows written
+    # for a batch that then failed to commit are not written twice
+    rejected_rows_offset = models.PositiveBigIntegerField(default=0)
+    # Idempotency key of process_uploaded_file for this upload, sent as
+    # the Celery task id of every dispatch, including re-dispatches
+    dispatch_key = models.UUIDField(default=uuid.uuid4, editable=False)
+    dispatched_at = models.DateTimeField(null=True, blank=True)
+    # Kept when the sweeper dispatches the upload again, so the queue
+    # wait covers all the time it spent waiting
+    first_dispatched_at = models.DateTimeField(null=True, blank=True)
+    # Ingestion queue the upload was last dispatched to, chosen by its
+    # size; priority orders it within that queue
+    priority = models.CharField(
+        max_length=10, choices=PRIORITIES, default=PRIORITY_NORMAL
+    )
+    queue = models.CharField(max_length=50, blank=True)
+    # Seconds between the first dispatch and a worker picking it up
+    queue_wait_seconds = models.FloatField(null=True, blank=True)
+    # Refreshed as ingestion commits its progress, so an upload a dead
+    # worker left in processing can be told from one still being worked on
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    # Set when a large CSV is split into a chord of chunk tasks, which own
+    # the upload from then on, however long they wait in their queue
+    split_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["sha256"], name="fileupload_sha256_idx"),
+        ]
 
     @transition(field=status,
                 source=FILE_STATUS_PENDING, target=FILE_STATUS_PROCESSING)
@@ -81,6 +173,11 @@ class FileUpload(Base):
     def mark_failed(self):
         pass
 
+    @transition(field=status,
+                source=FILE_STATUS_FAILED, target=FILE_STATUS_PROCESSING)
+    def resume_processing(self):
+        pass
+
     @transition(
         field=status,
         source=FILE_STATUS_PROCESSING, target=FILE_STATUS_PROCESSED
@@ -94,11 +191,215 @@ class FileUpload(Base):
         target=FILE_STATUS_FAILED,
     )
     def mark_processing_failed(self):
-        pass
+        # A retry starts over, splitting the file again if it is large
+        self.split_at = None
 
     def save(self, *args, **kwargs):
         # Save the file first
         super().save(*args, **kwargs)
 
     def filename(self):
-        return os.path.basename(self.file.name)
+        return self.original_filename or os.path.basename(self.file.name)
+
+    @classmethod
+    def find_duplicate(cls, sha256):
+        """
+        Finds an upload of the same content that is processed or on its
+        way to being processed.
+
+        Args:
+            sha256 (str): Hex SHA-256 of the content.
+
+        Returns:
+            FileUpload: The earliest such upload, or None. Failed uploads
+            are not matched, so re-sending a file retries it.
+        """
+        if not sha256:
+            return None
+        return (
+            cls.objects.filter(sha256=sha256)
+            .exclude(status=cls.FILE_STATUS_FAILED)
+            .order_by("id")
+            .first()
+        )
+
+    @classmethod
+    def stale(cls, before):
+        """
+        Finds uploads that should be processing but show no sign of it:
+        pending uploads last dispatched before the given time, whose task
+        was lost, and processing uploads whose worker has not reported
+        progress since then. Split uploads are left to their chunks.
+
+        Args:
+            before (datetime.datetime): The staleness cutoff.
+
+        Returns:
+            QuerySet: The stale uploads.
+        """
+        not_dispatched_since = models.Q(dispatched_at__isnull=True) | models.Q(
+            dispatched_at__lt=before
+        )
+        no_heartbeat_since = models.Q(heartbeat_at__isnull=True) | models.Q(
+            heartbeat_at__lt=before
+        )
+        return cls.objects.filter(
+            not_dispatched_since
+            & (
+                models.Q(status=cls.FILE_STATUS_PENDING)
+                | (
+                    models.Q(status=cls.FILE_STATUS_PROCESSING)
+                    & models.Q(split_at__isnull=True)
+                    & no_heartbeat_since
+                )
+            )
+        )
+
+    def is_claimed(self, before):
+        """
+        Checks if a worker is processing this upload and has reported
+        progress since the given time, or its chunks are queued or
+        running.
+        """
+        return self.status == self.FILE_STATUS_PROCESSING and (
+            self.split_at is not None
+            or (
+                self.heartbeat_at is not None
+                and self.heartbeat_at >= before
+            )
+        )
+
+    def has_checkpoint(self):
+        """Checks if part of this file was already ingested."""
+        return self.rows_read > 0
+
+    def record_progress(self, result, offset=None):
+        """
+        Stores the running counters of an ingestion run and, optionally,
+        the checkpoint offset they were committed up to.
+
+        Args:
+            result (dict): Counters as returned by ``ingest_rows``.
+            offset (int): Byte offset reached in the CSV body.
+        """
+        self.rows_read = result["rows_read"]
+        self.rows_inserted = result["inserted"]
+        self.rejected_reasons = result["rejected"]
+        self.rows_rejected = sum(result["rejected"].values())
+        self.duplicates_skipped = result["duplicates"]
+        if offset is not None:
+            self.checkpoint_offset = offset
+
+    def record_statistics(self, result):
+        """
+        Stores the counters returned by an ingestion run and derives
+        the throughput from the processing start time.
+
+        Args:
+            result (dict): Counters as returned by ``ingest_rows``.
+        """
+        self.record_progress(result)
+        if result.get("rejected_file"):
+            self.rejected_rows_file.name = result["rejected_file"]
+
+        self.processing_finished_at = timezone.now()
+        if self.processing_started_at:
+            elapsed = (
+                self.processing_finished_at - self.processing_started_at
+            ).total_seconds()
+            if elapsed > 0:
+                self.bytes_per_second = self.file.size / elapsed
+
+
+class FileUploadChunk(Base):
+    """
+    Progress of one byte range of a split upload, saved in the transaction
+    that commits each of its batches, so a retried chunk resumes after the
+    rows it committed and keeps counting them as inserted.
+    """
+
+    file_upload = models.ForeignKey(
+        FileUpload, on_delete=models.CASCADE, related_name="chunks"
+    )
+    start = models.PositiveBigIntegerField()
+    end = models.PositiveBigIntegerField()
+    rows_read = models.PositiveBigIntegerField(default=0)
+    rows_inserted = models.PositiveBigIntegerField(default=0)
+    rejected_reasons = models.JSONField(default=dict, blank=True)
+    duplicates_skipped = models.PositiveBigIntegerField(default=0)
+    # Byte offset within the range up to which rows are committed
+    checkpoint_offset = models.PositiveBigIntegerField()
+    rejected_rows_offset = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["file_upload", "start"],
+                name="fileuploadchunk_upload_start_uniq",
+            ),
+        ]
+
+    def has_checkpoint(self):
+        """Checks if part of this range was already ingested."""
+        return self.rows_read > 0
+
+    def progress(self):
+        """
+        Returns the counters committed so far, in the form
+        ``ingest_rows`` returns them.
+        """
+        return {
+            "rows_read": self.rows_read,
+            "inserted": self.rows_inserted,
+            "rejected": self.rejected_reasons,
+            "duplicates": self.duplicates_skipped,
+        }
+
+    def record_progress(self, result, offset, rejected_rows_offset):
+        """
+        Stores the running counters of the chunk and the offsets they
+        were committed up to.
+
+        Args:
+            result (dict): Counters as returned by ``ingest_rows``.
+            offset (int): Byte offset reached in the CSV body.
+            rejected_rows_offset (int): Size of the rejected-rows file.
+        """
+        self.rows_read = result["rows_read"]
+        self.rows_inserted = result["inserted"]
+        self.rejected_reasons = result["rejected"]
+        self.duplicates_skipped = result["duplicates"]
+        self.checkpoint_offset = offset
+        self.rejected_rows_offset = rejected_rows_offset
+
+
+class ChunkedUpload(Base):
+    STATUS_UPLOADING = "uploading"
+    STATUS_COMPLETE = "complete"
+    STATUSES = (
+        (STATUS_UPLOADING, "Uploading"),
+        (STATUS_COMPLETE, "Complete"),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    filename = models.CharField(max_length=255)
+    # Total size announced by the client, checked on completion if given
+    size = models.PositiveBigIntegerField(null=True, blank=True)
+    offset = models.PositiveBigIntegerField(default=0)
+    priority = models.CharField(
+        max_length=10,
+        choices=FileUpload.PRIORITIES,
+        default=FileUpload.PRIORITY_NORMAL,
+    )
+    status = FSMField(default=STATUS_UPLOADING, choices=STATUSES)
+    # Identical chunked uploads are linked to the same file upload
+    file_upload = models.ForeignKey(
+        FileUpload, null=True, blank=True, on_delete=models.SET_NULL
+    )
+
+    @transition(field=status, source=STATUS_UPLOADING, target=STATUS_COMPLETE)
+    def complete(self):
+        pass
+
+    def part_name(self):
+        return f"media/uploads/partial/{self.id}.part"
@@ -0,0 +1,246 @@
+import base64
+import binascii
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.db.models import Q
+from rest_framework import pagination
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class UserPagination(pagination.PageNumberPagination):
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 1000
+
+
+class KeysetPagination(pagination.BasePagination):
+    """
+    Opt-in keyset (cursor) pagination.
+
+    Enabled with ``?pagination=cursor``. Each page is fetched with a
+    ``WHERE`` on the ordering columns of the last row of the previous
+    page instead of an ``OFFSET``, and no ``COUNT(*)`` is run, so every
+    page costs the same however deep it is. The queryset ordering (as set
+    by OrderingFilter, or the model default) is used, with ``id`` added
+    as a tiebreaker. Querysets with neither are paged newest first.
+
+    ``?count=approximate`` adds the table row estimate from
+    ``pg_class.reltuples`` for unfiltered listings, and ``?count=exact``
+    runs a real count.
+
+    Requests that do not opt in are handled by ``fallback_class``, or
+    left unpaginated if it is None.
+    """
+
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 1000
+    mode_query_param = "pagination"
+    cursor_query_param = "cursor"
+    count_query_param = "count"
+    fallback_class = None
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.fallback = None
+        if request.query_params.get(self.mode_query_param) != "cursor":
+            if self.fallback_class is None:
+                return None
+            self.fallback = self.fallback_class()
+            return self.fallback.paginate_queryset(queryset, request, view)
+
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(queryset)
+        self.count = self.get_count(queryset, request)
+
+        cursor = self.decode_cursor(request, queryset.model)
+        if cursor is not None:
+            queryset = queryset.filter(self.build_filter(cursor))
+        rows = list(queryset.order_by(*self.ordering)[:self.page_size + 1])
+
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        return self.page
+
+    def get_paginated_response(self, data):
+        if self.fallback is not None:
+            return self.fallback.get_paginated_response(data)
+        return Response(OrderedDict([
+            ("count", self.count),
+            ("next", self.get_next_link()),
+            ("results", data),
+        ]))
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_ordering(self, queryset):
+        """
+        Returns the queryset ordering with an id tiebreaker that follows
+        the direction of the first field, so (field, id) indexes apply.
+        Without any ordering, rows are ordered by descending id, the
+        default the models that declare one use.
+        """
+        ordering = list(
+            queryset.query.order_by or queryset.model._meta.ordering
+        )
+        if not ordering:
+            return ["-id"]
+        if not any(field.lstrip("-") in ("id", "pk") for field in ordering):
+            descending = ordering[0].startswith("-")
+            ordering.append("-id" if descending else "id")
+        return ordering
+
+    def get_count(self, queryset, request):
+        mode = request.query_params.get(self.count_query_param)
+        if mode == "exact":
+            return queryset.count()
+        if (
+            mode == "approximate"
+            and not queryset.query.where
+            and connection.vendor == "postgresql"
+        ):
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT reltuples::bigint FROM pg_class "
+                    "WHERE oid = %s::regclass",
+                    [queryset.model._meta.db_table],
+                )
+                estimate = cursor.fetchone()[0]
+            # reltuples is -1 until the table is first analyzed
+            return estimate if estimate >= 0 else None
+        return None
+
+    def build_filter(self, values):
+        """
+        Builds the condition selecting rows after the given ordering
+        values: (a > x) OR (a = x AND b > y) OR ..., with < for
+        descending fields.
+        """
+        condition = Q()
+        equal = Q()
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip("-")
+            lookup = "lt" if field.startswith("-") else "gt"
+            condition |= equal & Q(**{f"{name}__{lookup}": value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        # Rows are model instances, or dicts from a values() queryset
+        if isinstance(last, dict):
+            values = [last[field.lstrip("-")] for field in self.ordering]
+        else:
+            values = [
+                getattr(last, field.lstrip("-")) for field in self.ordering
+            ]
+        url = self.request.build_absolute_uri()
+        return replace_query_param(
+            url, self.cursor_query_param, self.encode_cursor(values)
+        )
+
+    def encode_cursor(self, values):
+        payload = json.dumps(values, default=str).encode()
+        return base64.urlsafe_b64encode(payload).decode()
+
+    def decode_cursor(self, request, model):
+        """
+        Decodes the cursor of the request into one value per ordering
+        field, converted to that field's type, so a stale or tampered
+        cursor is refused with a 404 rather than failing the query.
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            values = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+        except (binascii.Error, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+
+        converted = []
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip("-")
+            model_field = (
+                model._meta.pk if name == "pk" else model._meta.get_field(name)
+            )
+            try:
+                value = model_field.to_python(value)
+            except (ValidationError, TypeError, ValueError):
+                raise NotFound(self.invalid_cursor_message)
+            if value is None:
+                raise NotFound(self.invalid_cursor_message)
+            converted.append(value)
+        return converted
+
+    def get_schema_operation_parameters(self, view):
+        parameters = [
+            {
+                "name": self.mode_query_param,
+                "required": False,
+                "in": "query",
+                "description": "Set to 'cursor' for keyset pagination.",
+                "schema": {"type": "string", "enum": ["cursor"]},
+            },
+            {
+                "name": self.cursor_query_param,
+                "required": False,
+                "in": "query",
+                "description": "The pagination cursor value.",
+                "schema": {"type": "string"},
+            },
+            {
+                "name": self.count_query_param,
+                "required": False,
+                "in": "query",
+                "description": "'approximate' or 'exact' to include a count.",
+                "schema": {"type": "string",
+                           "enum": ["approximate", "exact"]},
+            },
+        ]
+        if self.fallback_class is not None:
+            fallback = self.fallback_class()
+            parameters += fallback.get_schema_operation_parameters(view)
+        else:
+            parameters.append({
+                "name": self.page_size_query_param,
+                "required": False,
+                "in": "query",
+                "description": "Number of results to return per page.",
+                "schema": {"type": "integer"},
+            })
+        return parameters
+
+    def get_paginated_response_schema(self, schema):
+        if self.fallback_class is not None:
+            return self.fallback_class().get_paginated_response_schema(schema)
+        return {
+            "type": "object",
+            "properties": {
+                "count": {"type": "integer", "nullable": True},
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+
+class UserDataPagination(KeysetPagination):
+    """Page number pagination, with keyset pagination on request."""
+
+    fallback_class = UserPagination
@@ -0,0 +1,123 @@
+import csv
+import io
+import json
+
+import orjson
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer that encodes with orjson.
+
+    The output is byte-identical to JSONRenderer with the default compact,
+    unicode and strict settings: dates and datetimes are left to DRF's
+    encoder so they keep its format, and U+2028/U+2029 are escaped the
+    same way. Indented output (the browsable API, or an ``indent`` media
+    type parameter) and non-default settings go through JSONRenderer.
+    """
+
+    options = (
+        orjson.OPT_PASSTHROUGH_DATETIME
+        | orjson.OPT_PASSTHROUGH_DATACLASS
+        | orjson.OPT_NON_STR_KEYS
+    )
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+
+        if (
+            self.ensure_ascii
+            or not self.compact
+            or not self.strict
+            or self.get_indent(accepted_media_type, renderer_context or {})
+            is not None
+        ):
+            return super().render(
+                data, accepted_media_type, renderer_context
+            )
+
+        ret = orjson.dumps(
+            data, default=self.encoder_class().default, option=self.options
+        )
+        return ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(
+            b"\xe2\x80\xa9", b"\\u2029"
+        )
+
+
+class StreamingExportRenderer(BaseRenderer):
+    """
+    Base class for the formats rows can be exported in.
+
+    Exports are streamed through ``stream()`` rather than rendered from
+    a ``Response``; ``render()`` only serves error responses, such as an
+    invalid filter value, which are written as JSON.
+    """
+
+    charset = "utf-8"
+    # Rows buffered into each chunk sent to the client
+    rows_per_chunk = 1000
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return json.dumps(data, default=str).encode(self.charset)
+
+    def stream(self, fields, rows):
+        """
+        Yields the export as encoded chunks.
+
+        Args:
+            fields (tuple): Column names, in the order of each row.
+            rows (iterable): Tuples of values, e.g. from values_list().
+        """
+        buffer = io.StringIO()
+        write_row = self.get_row_writer(buffer, fields)
+        count = 0
+        for row in rows:
+            write_row(row)
+            count += 1
+            if count % self.rows_per_chunk == 0:
+                yield self.drain(buffer)
+        data = self.drain(buffer)
+        if data:
+            yield data
+
+    def drain(self, buffer):
+        data = buffer.getvalue().encode(self.charset)
+        buffer.seek(0)
+        buffer.truncate()
+        return data
+
+    def get_row_writer(self, buffer, fields):
+        """
+        Writes any header to the buffer and returns a callable that
+        writes one row to it.
+        """
+        raise NotImplementedError
+
+
+class CSVExportRenderer(StreamingExportRenderer):
+    media_type = "text/csv"
+    format = "csv"
+
+    def get_row_writer(self, buffer, fields):
+        # None is written as an empty cell and dates as YYYY-MM-DD
+        writer = csv.writer(buffer)
+        writer.writerow(fields)
+        return writer.writerow
+
+
+class NDJSONExportRenderer(StreamingExportRenderer):
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+
+    def get_row_writer(self, buffer, fields):
+        encode = json.JSONEncoder(default=str).encode
+
+        def write_row(row):
+            buffer.write(encode(dict(zip(fields, row))))
+            buffer.write("\n")
+
+        return write_row
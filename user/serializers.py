@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import UserData, FileUpload
+from .models import UserData, FileUpload, ChunkedUpload
 
 
 class UserDataSerializer(serializers.ModelSerializer):
@@ -22,5 +22,43 @@ class UserDataSerializer(serializers.ModelSerializer):
 class FileUploadSerializer(serializers.ModelSerializer):
     class Meta:
         model = FileUpload
-        fields = ("id", "file", "status")
-        read_only_fields = ("id", "status")
+        fields = (
+            "id",
+            "file",
+            "original_filename",
+            "sha256",
+            "priority",
+            "queue",
+            "queue_wait_seconds",
+            "status",
+            "rows_read",
+            "rows_inserted",
+            "rows_rejected",
+            "rejected_reasons",
+            "duplicates_skipped",
+            "bytes_per_second",
+            "rejected_rows_file",
+        )
+        read_only_fields = (
+            "id",
+            "original_filename",
+            "sha256",
+            "priority",
+            "queue",
+            "queue_wait_seconds",
+            "status",
+            "rows_read",
+            "rows_inserted",
+            "rows_rejected",
+            "rejected_reasons",
+            "duplicates_skipped",
+            "bytes_per_second",
+            "rejected_rows_file",
+        )
+
+
+class ChunkedUploadSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ChunkedUpload
+        fields = ("id", "filename", "size", "priority", "offset", "status")
+        read_only_fields = ("id", "offset", "status")
@@ -1,10 +1,38 @@
+import logging
+
+from celery.signals import task_postrun, worker_process_shutdown
+from django.core.signals import request_finished
+from django.db.backends.signals import connection_created
 from django.dispatch import receiver
 from django.db.models.signals import post_save
+from .metrics import ConnectionMetrics
 from .models import FileUpload
-from .tasks import process_uploaded_file
+from .tasks import dispatch_upload
+
+logger = logging.getLogger()
 
 
 @receiver(post_save, sender=FileUpload)
 def start_file_upload_signal(sender, instance, created, **kwargs):
     if created:
-        process_uploaded_file.delay(instance.id)
+        dispatch_upload(instance)
+
+
+@receiver(connection_created)
+def count_connection_signal(sender, connection, **kwargs):
+    ConnectionMetrics.increment("connections_opened")
+
+
+@receiver(request_finished)
+def count_request_signal(sender, **kwargs):
+    ConnectionMetrics.increment("requests")
+
+
+@task_postrun.connect
+def count_task_signal(sender=None, **kwargs):
+    ConnectionMetrics.increment("tasks")
+
+
+@worker_process_shutdown.connect
+def log_connection_metrics_signal(**kwargs):
+    logger.info(f"Database connection metrics: {ConnectionMetrics.snapshot()}")
@@ -1,52 +1,417 @@
+import datetime
+import itertools
 import logging
-from celery import shared_task
+import os
+from collections import Counter
 
-from .helpers import FileReader
-from .utils import FileHeaderValidator, RowDataValidator
-from .models import FileUpload, UserData
+from celery import chord, shared_task
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from kombu.exceptions import OperationalError as BrokerOperationalError
+
+from .cache import UserDataCache
+from .helpers import (
+    BatchInserter,
+    CopyInserter,
+    CsvRowStream,
+    FileReader,
+    RejectedRowsWriter,
+)
+from .metrics import PrometheusMetrics, QueueMetrics
+from .utils import (
+    FileHeaderValidator,
+    FingerprintDeduplicator,
+    RowDataValidator,
+)
+from .models import FileUpload, FileUploadChunk, UserData
 
 logger = logging.getLogger()
 
+USER_DATA_FIELDS = (
+    "first_name",
+    "last_name",
+    "national_id",
+    "birth_date",
+    "address",
+    "country",
+    "phone_number",
+    "email",
+    "finger_print_signature",
+)
+
+LOADER_ORM = "orm"
+LOADER_COPY = "copy"
+LOADERS = (LOADER_ORM, LOADER_COPY)
+
+# Uploads are ingested from separate queues by size, each consumed by its
+# own workers, so small files never wait behind large ones
+INGESTION_QUEUE_SMALL = "ingest_small"
+INGESTION_QUEUE_LARGE = "ingest_large"
+INGESTION_QUEUES = (INGESTION_QUEUE_SMALL, INGESTION_QUEUE_LARGE)
+
+# Celery message priority of each upload priority; with the Redis broker
+# 0 is served first
+TASK_PRIORITIES = {
+    FileUpload.PRIORITY_HIGH: 0,
+    FileUpload.PRIORITY_NORMAL: 3,
+    FileUpload.PRIORITY_LOW: 6,
+}
+
+# Seconds sweep_stale_uploads waits for the broker to report queue depths
+SWEEP_BROKER_TIMEOUT = 5.0
+
+
+def get_inserter(loader):
+    """
+    Builds the inserter for a loader, along with the function that turns
+    a row into what the inserter expects.
+
+    Args:
+        loader (str): "orm" to use ``bulk_create``, or "copy" to stream
+        rows through PostgreSQL ``COPY``.
+
+    Returns:
+        tuple: The inserter and the row conversion function.
+    """
+    if loader == LOADER_COPY:
+        inserter = CopyInserter(
+            UserData, USER_DATA_FIELDS, "finger_print_signature"
+        )
+        return inserter, dict
+    if loader == LOADER_ORM:
+        inserter = BatchInserter(UserData, ignore_conflicts=True)
+        return inserter, lambda row: UserData(
+            **{field: row[field] for field in USER_DATA_FIELDS}
+        )
+    raise ValueError(f"Invalid loader: {loader}")
+
+
+def ingest_rows(rows, rejected_writer=None, checkpoint=None, loader=None):
+    """
+    Validates, deduplicates and inserts rows into the UserData model.
+
+    Args:
+        rows (iterable of dict): The rows to ingest.
+        rejected_writer (RejectedRowsWriter): Receives every row that
+        fails validation, together with the reason.
+        checkpoint (callable): Called with the running counters inside
+        the transaction that commits each batch, so progress can be
+        saved atomically with the inserted rows.
+        loader (str): "orm" or "copy". Defaults to
+        ``settings.USER_DATA_LOADER``.
+
+    Returns:
+        dict: Counts of rows read, inserted, rejected by reason and
+        skipped as duplicates, plus the time spent inserting.
+    """
+    inserter, to_record = get_inserter(loader or settings.USER_DATA_LOADER)
+    deduplicator = FingerprintDeduplicator()
+    rows_read = 0
+    rejected = Counter()
+
+    def counters():
+        return {
+            "rows_read": rows_read,
+            "inserted": inserter.inserted,
+            "rejected": dict(rejected),
+            "batches": len(inserter.timings),
+            "duplicates": deduplicator.duplicates,
+            "insert_seconds": sum(inserter.timings),
+        }
+
+    # Validate each chunk, drop rows whose fingerprint is already
+    # stored or repeated in this file, and insert the rest into the
+    # UserData model as one batch per chunk
+    chunks = FileReader.iter_chunks(rows, inserter.batch_size)
+    while True:
+        with PrometheusMetrics.time_stage("parse"):
+            chunk = next(chunks, None)
+        if chunk is None:
+            break
+        rows_read += len(chunk)
+        with PrometheusMetrics.time_stage("validate"):
+            mask, reasons = RowDataValidator.validate_chunk(chunk)
+            valid_rows = []
+            for row, is_valid, reason in zip(chunk, mask, reasons):
+                if is_valid:
+                    valid_rows.append(row)
+                    continue
+                rejected[reason] += 1
+                if rejected_writer is not None:
+                    rejected_writer.write(row, reason)
+            if rejected_writer is not None:
+                rejected_writer.flush()
+
+        with transaction.atomic():
+            inserted = inserter.inserted
+            with PrometheusMetrics.time_stage("dedup"):
+                unique_rows = deduplicator.filter(valid_rows)
+            with PrometheusMetrics.time_stage("insert"):
+                for row in unique_rows:
+                    inserter.add(to_record(row))
+                inserter.flush()
+            if inserter.inserted > inserted:
+                # Cached /v1/users/ responses no longer match once the
+                # batch is visible
+                transaction.on_commit(UserDataCache.bump_generation)
+            if checkpoint is not None:
+                checkpoint(counters())
+
+    return counters()
+
+
+def merge_results(results):
+    """
+    Adds up the counters of several ingestion runs.
+
+    Args:
+        results (list of dict): Counters as returned by ``ingest_rows``.
+
+    Returns:
+        dict: The summed counters.
+    """
+    totals = {
+        key: sum(result.get(key, 0) for result in results)
+        for key in (
+            "rows_read", "inserted", "batches", "duplicates", "insert_seconds"
+        )
+    }
+    totals["rejected"] = dict(
+        sum((Counter(result["rejected"]) for result in results), Counter())
+    )
+    return totals
+
+
+def rejected_rows_name(id, part=None):
+    """Builds the storage name of an upload's rejected-rows file."""
+    suffix = f"-{part}" if part is not None else ""
+    return f"media/rejected/{id}{suffix}.csv"
+
+
+def should_split(file_path):
+    """
+    Checks if a file is large enough to be processed in parallel. Only
+    uncompressed CSV files can be read from an arbitrary byte offset.
+    """
+    return (
+        file_path.endswith(".csv")
+        and os.path.getsize(file_path)
+        > settings.PARALLEL_INGESTION_THRESHOLD
+    )
+
+
+def stale_before():
+    """Returns the time before which a silent upload counts as stale."""
+    return timezone.now() - datetime.timedelta(
+        seconds=settings.UPLOAD_STALE_AFTER
+    )
+
+
+def ingestion_queue(file_upload):
+    """
+    Picks the queue an upload is ingested from by the size of its stored
+    file, compressed or not.
+
+    Args:
+        file_upload (FileUpload): The upload.
+
+    Returns:
+        str: INGESTION_QUEUE_LARGE for files of at least
+        ``settings.INGESTION_LARGE_FILE_SIZE`` bytes, otherwise
+        INGESTION_QUEUE_SMALL.
+    """
+    try:
+        size = file_upload.file.size
+    except OSError:
+        # Let the task report the missing file
+        size = 0
+    if size >= settings.INGESTION_LARGE_FILE_SIZE:
+        return INGESTION_QUEUE_LARGE
+    return INGESTION_QUEUE_SMALL
+
+
+def dispatch_upload(file_upload):
+    """
+    Enqueues process_uploaded_file for an upload once the current
+    transaction commits, so the worker always finds the committed row.
+
+    Every dispatch of an upload uses its ``dispatch_key`` as the task id,
+    and the task claims the upload before working on it, so a duplicate
+    dispatch does nothing. The task goes to the upload's size queue with
+    the Celery priority of its ``priority``.
+
+    Args:
+        file_upload (FileUpload): The upload to process.
+    """
+    id, key = file_upload.id, str(file_upload.dispatch_key)
+    priority = TASK_PRIORITIES[file_upload.priority]
+
+    def send():
+        # Chosen once committed, when the file is at its stored name
+        queue = ingestion_queue(file_upload)
+        now = timezone.now()
+        FileUpload.objects.filter(id=id).update(
+            dispatched_at=now,
+            first_dispatched_at=Coalesce("first_dispatched_at", Value(now)),
+            queue=queue,
+        )
+        process_uploaded_file.apply_async(
+            (id,),
+            {"dispatch_key": key},
+            task_id=key,
+            queue=queue,
+            priority=priority,
+        )
+
+    transaction.on_commit(send)
+
 
 @shared_task()
-def process_uploaded_file(id):
-    file = FileUpload.objects.filter(id=id).first()
-    if not file:
-        return
+def process_uploaded_file(id, loader=None, dispatch_key=None):
+    """
+    Ingests an uploaded file into the UserData model.
+
+    Args:
+        id (int): The primary key of the FileUpload.
+        loader (str): "orm" or "copy". Defaults to
+        ``settings.USER_DATA_LOADER``.
+        dispatch_key (str): The upload's idempotency key, if the task was
+        sent by ``dispatch_upload``.
+    """
+    # Claim the upload, so a duplicate delivery of the task leaves it to
+    # the worker already processing it
+    with transaction.atomic():
+        file = FileUpload.objects.select_for_update().filter(id=id).first()
+        if not file:
+            return
+        if dispatch_key is not None and dispatch_key != str(
+            file.dispatch_key
+        ):
+            logger.warning(f"Ignoring task for upload {id} with a stale key")
+            return
+        if file.is_claimed(stale_before()):
+            return
 
-    file.start_processing()
-    file.save()
+        if file.status == FileUpload.FILE_STATUS_PENDING:
+            if file.first_dispatched_at is not None:
+                file.queue_wait_seconds = (
+                    timezone.now() - file.first_dispatched_at
+                ).total_seconds()
+                PrometheusMetrics.observe_queue_wait(
+                    file.queue, file.queue_wait_seconds
+                )
+            file.start_processing()
+        elif file.status == FileUpload.FILE_STATUS_FAILED:
+            # A retry resumes from the last checkpoint
+            file.resume_processing()
+        elif file.status == FileUpload.FILE_STATUS_PROCESSED:
+            return
+        # An upload still marked as processing lost its worker, which
+        # stopped reporting progress, so it resumes as well
+        if file.processing_started_at is None:
+            file.processing_started_at = timezone.now()
+        file.heartbeat_at = timezone.now()
+        file.save()
 
     file_path = str(file.file.path)
 
     try:
-        headers_are_valid = FileHeaderValidator.is_valid(file_path)
+        with PrometheusMetrics.time_stage("header"):
+            headers_are_valid = FileHeaderValidator.is_valid(file_path)
         if not headers_are_valid:
             raise ValueError("Invalid file headers.")
 
-        # Read the file using FileReader
-        rows = FileReader.read_file(file_path)
-
-        # Iterate over each row in the CSV file,
-        # validate its data, and save it to the UserData model
-        for row in rows:
-            if RowDataValidator.is_valid(row):
-                user_data = UserData(
-                    first_name=row["first_name"],
-                    last_name=row["last_name"],
-                    national_id=row["national_id"],
-                    birth_date=row["birth_date"],
-                    address=row["address"],
-                    country=row["country"],
-                    phone_number=row["phone_number"],
-                    email=row["email"],
-                    finger_print_signature=row["finger_print_signature"],
+        # Fan large CSV files out across workers, one byte range each
+        if should_split(file_path):
+            ranges = FileReader.split_csv_file(
+                file_path, settings.PARALLEL_INGESTION_CHUNK_SIZE
+            )
+            # The chunks of a large file queue behind each other, not
+            # ahead of small files
+            queue = file.queue or INGESTION_QUEUE_LARGE
+            # Record the chord before sending it, so neither the sweeper
+            # nor another delivery of this task splits the file again
+            file.split_at = timezone.now()
+            file.save(update_fields=["split_at"])
+            callback = finalize_uploaded_file.s(id).set(queue=queue).on_error(
+                mark_upload_failed.si(id).set(queue=queue)
+            )
+            chord(
+                process_file_chunk.s(id, start, end, loader).set(
+                    queue=queue, priority=TASK_PRIORITIES[file.priority]
                 )
-                user_data.save()
+                for start, end in ranges
+            )(callback)
+            logger.info(
+                f"Split uploaded file {file_path} into {len(ranges)} chunks"
+            )
+            return f"File split into {len(ranges)} chunks."
+
+        # Stream the file so memory stays flat, skipping whatever an
+        # earlier attempt already committed
+        previous = {
+            "rows_read": file.rows_read,
+            "inserted": file.rows_inserted,
+            "rejected": file.rejected_reasons,
+            "duplicates": file.duplicates_skipped,
+        }
+        if FileReader.split_extension(file_path)[0] == ".csv":
+            rows = CsvRowStream(
+                file_path, start=file.checkpoint_offset or None
+            )
+        else:
+            rows = itertools.islice(
+                FileReader.read_file(file_path, stream=True),
+                file.rows_read, None,
+            )
+        if file.has_checkpoint():
+            logger.info(
+                f"Resuming uploaded file {file_path} after "
+                f"{file.rows_read} rows"
+            )
+
+        def save_checkpoint(progress):
+            file.record_progress(
+                merge_results([previous, progress]),
+                getattr(rows, "offset", None),
+            )
+            file.rejected_rows_offset = rejected_writer.tell()
+            file.heartbeat_at = timezone.now()
+            file.save(update_fields=[
+                "rows_read",
+                "rows_inserted",
+                "rejected_reasons",
+                "rows_rejected",
+                "duplicates_skipped",
+                "checkpoint_offset",
+                "rejected_rows_offset",
+                "heartbeat_at",
+            ])
+
+        # Rejected rows are written before their batch commits, so a
+        # resumed run first drops those of the batch that failed
+        rejected_writer = RejectedRowsWriter(
+            rejected_rows_name(id),
+            append=file.has_checkpoint(),
+            size=file.rejected_rows_offset,
+        )
+        try:
+            result = ingest_rows(
+                rows, rejected_writer, save_checkpoint, loader
+            )
+        finally:
+            result_file = rejected_writer.close()
 
         # Update file upload status to 'processed'
+        PrometheusMetrics.observe_rows(result)
+        result = merge_results([previous, result])
+        file.record_statistics(dict(result, rejected_file=result_file))
         file.mark_processed()
         file.save()
+        PrometheusMetrics.observe_ingestion(file)
 
     except ValueError as exc:
         logger.error(f"Failed to process uploaded file: {exc}")
@@ -62,5 +427,148 @@ def process_uploaded_file(id):
 
         raise process_uploaded_file.retry(exc=exc, max_retries=3)
 
-    logger.info(f"Successfully processed uploaded file: {file_path}")
+    logger.info(
+        f"Successfully processed uploaded file: {file_path} "
+        f"({result['inserted']} rows in {result['batches']} batches, "
+        f"{file.rows_rejected} rejected, "
+        f"{result['duplicates']} duplicates skipped, "
+        f"{result['insert_seconds']:.3f}s spent inserting)"
+    )
     return "File processed successfully!"
+
+
+@shared_task()
+def process_file_chunk(id, start, end, loader=None):
+    """
+    Ingests the rows of one byte range of an uploaded CSV file.
+
+    The chunk's progress is saved with every batch it commits, so a retry
+    resumes after those rows instead of counting them as duplicates. The
+    upload's heartbeat is refreshed with every batch too, so its progress
+    shows while the chunks run.
+    """
+    file = FileUpload.objects.get(id=id)
+    file_path = str(file.file.path)
+    chunk, _ = FileUploadChunk.objects.get_or_create(
+        file_upload=file,
+        start=start,
+        defaults={"end": end, "checkpoint_offset": start},
+    )
+    previous = chunk.progress()
+
+    try:
+        rows = CsvRowStream(file_path, chunk.checkpoint_offset, end)
+        rejected_writer = RejectedRowsWriter(
+            rejected_rows_name(id, start),
+            append=chunk.has_checkpoint(),
+            size=chunk.rejected_rows_offset,
+        )
+
+        def checkpoint(progress):
+            chunk.record_progress(
+                merge_results([previous, progress]),
+                rows.offset,
+                rejected_writer.tell(),
+            )
+            chunk.save()
+            FileUpload.objects.filter(id=id).update(
+                heartbeat_at=timezone.now()
+            )
+
+        try:
+            result = ingest_rows(
+                rows, rejected_writer, checkpoint, loader=loader
+            )
+        finally:
+            rejected_file = rejected_writer.close()
+        FileUpload.objects.filter(id=id).update(heartbeat_at=timezone.now())
+        result = merge_results([previous, result])
+        return dict(result, rejected_file=rejected_file)
+    except Exception as exc:
+        logger.error(
+            f"Failed to process bytes {start}-{end} of {file_path}: {exc}"
+        )
+        raise process_file_chunk.retry(exc=exc, max_retries=3)
+
+
+@shared_task()
+def finalize_uploaded_file(results, id):
+    """
+    Aggregates chunk results and marks the upload as processed. An upload
+    already processed, by an earlier delivery of this task or another
+    chord over the same file, is left as it is.
+    """
+    with transaction.atomic():
+        file = FileUpload.objects.select_for_update().get(id=id)
+        if file.status == FileUpload.FILE_STATUS_PROCESSED:
+            logger.warning(f"Upload {id} was already finalized")
+            return None
+        totals = merge_results(results)
+        totals["rejected_file"] = RejectedRowsWriter.merge(
+            rejected_rows_name(id),
+            [result["rejected_file"] for result in results
+             if result["rejected_file"]],
+        )
+
+        file.record_statistics(totals)
+        file.mark_processed()
+        file.save()
+        file.chunks.all().delete()
+    PrometheusMetrics.observe_rows(totals)
+    PrometheusMetrics.observe_ingestion(file)
+
+    logger.info(
+        f"Successfully processed uploaded file: {file.file.name} "
+        f"({totals['inserted']} rows in {len(results)} chunks, "
+        f"{file.rows_rejected} rejected, "
+        f"{totals['duplicates']} duplicates skipped, "
+        f"{totals['insert_seconds']:.3f}s spent inserting)"
+    )
+    return totals
+
+
+@shared_task()
+def mark_upload_failed(id):
+    """
+    Marks an upload as failed when one of its chunks fails, unless it was
+    processed in the meantime.
+    """
+    with transaction.atomic():
+        file = FileUpload.objects.select_for_update().get(id=id)
+        if file.status == FileUpload.FILE_STATUS_PROCESSED:
+            return
+        file.mark_processing_failed()
+        file.save()
+    logger.error(f"Failed to process uploaded file: {file.file.name}")
+
+
+@shared_task()
+def sweep_stale_uploads():
+    """
+    Dispatches again the uploads whose task was lost before it ran or
+    whose worker died while processing them. Runs periodically from
+    Celery beat.
+
+    A pending upload is only dispatched again once its queue is empty,
+    since until then its message may still be waiting in the broker.
+
+    Returns:
+        int: The number of uploads dispatched.
+    """
+    try:
+        depths = QueueMetrics.depths(INGESTION_QUEUES, SWEEP_BROKER_TIMEOUT)
+    except (OSError, BrokerOperationalError) as exc:
+        logger.warning(f"Cannot read the ingestion queue depths: {exc}")
+        depths = None
+
+    count = 0
+    for file_upload in FileUpload.stale(stale_before()).iterator():
+        if file_upload.status == FileUpload.FILE_STATUS_PENDING and (
+            depths is None or depths.get(file_upload.queue)
+        ):
+            continue
+        dispatch_upload(file_upload)
+        count += 1
+    if count:
+        logger.warning(f"Dispatched {count} stale uploads again")
+    return count
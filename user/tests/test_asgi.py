@@ -0,0 +1,65 @@
+import json
+
+from asgiref.testing import ApplicationCommunicator
+from django.test import TransactionTestCase, override_settings
+
+from fileUpload.asgi import application
+from user.models import UserData
+
+
+def http_scope(path, query_string=b""):
+    return {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "query_string": query_string,
+        "headers": [(b"host", b"testserver")],
+        "server": ("testserver", 80),
+    }
+
+
+@override_settings(ALLOWED_HOSTS=["testserver"], USER_DATA_CACHE_TIMEOUT=0)
+class ASGIHandlerTestCase(TransactionTestCase):
+    def setUp(self):
+        for index in range(3):
+            UserData.objects.create(
+                first_name=f"User{index}",
+                last_name="Doe",
+                phone_number="1234567890",
+                email=f"user{index}@example.com",
+                birth_date="1990-01-01",
+                finger_print_signature=f"signature{index}",
+            )
+
+    async def request(self, path, query_string=b""):
+        communicator = ApplicationCommunicator(
+            application, http_scope(path, query_string)
+        )
+        await communicator.send_input({"type": "http.request"})
+        start = await communicator.receive_output(timeout=10)
+        body = b""
+        while True:
+            message = await communicator.receive_output(timeout=10)
+            body += message.get("body", b"")
+            if not message.get("more_body", False):
+                break
+        await communicator.wait()
+        return start["status"], body
+
+    async def test_list(self):
+        status, body = await self.request("/v1/users/")
+        self.assertEqual(status, 200)
+        self.assertEqual(len(json.loads(body)["results"]), 3)
+
+    async def test_streaming_export_reads_rows_off_the_event_loop(self):
+        status, body = await self.request(
+            "/v1/users/export/", b"format=ndjson&ordering=first_name"
+        )
+        self.assertEqual(status, 200)
+        self.assertEqual(
+            [json.loads(line)["first_name"] for line in body.splitlines()],
+            ["User0", "User1", "User2"],
+        )
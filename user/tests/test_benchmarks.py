@@ -0,0 +1,146 @@
+import os
+import shutil
+import tempfile
+
+from django.test import TestCase
+
+from user.benchmarks import (
+    IngestionBenchmark,
+    LatencySummary,
+    LoadTestMix,
+    UserDataGenerator,
+)
+from user.helpers import FileReader
+from user.models import FileUpload, UserData
+from user.utils import RowDataValidator
+
+
+class UserDataGeneratorTestCase(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write(self, name, **options):
+        path = os.path.join(self.directory, name)
+        generator = UserDataGenerator(
+            500, invalid_ratio=0.2, duplicate_ratio=0.1, **options
+        )
+        counts = generator.write(path)
+        with open(path, "rb") as f:
+            return f.read(), counts, path
+
+    def test_same_seed_writes_the_same_file(self):
+        for name in ("rows.csv", "rows.csv.gz", "rows.csv.zst"):
+            first, first_counts, _ = self.write(name, seed=7)
+            second, second_counts, _ = self.write(name, seed=7)
+            other, _, _ = self.write(name, seed=8)
+
+            self.assertEqual(first, second)
+            self.assertEqual(first_counts, second_counts)
+            self.assertNotEqual(first, other)
+
+    def test_rows_are_rejected_for_the_reasons_counted(self):
+        _, counts, path = self.write("rows.xlsx", seed=1)
+        rows = list(FileReader.read_file(path, stream=True))
+
+        mask, reasons = RowDataValidator.validate_chunk(rows)
+
+        self.assertEqual(len(rows), 500)
+        rejected = {}
+        for reason in reasons:
+            if reason is not None:
+                rejected[reason] = rejected.get(reason, 0) + 1
+        invalid = {
+            kind: counts[kind]
+            for kind in UserDataGenerator.INVALID_KINDS
+            if kind in counts
+        }
+        self.assertEqual(rejected, invalid)
+        signatures = {
+            row["finger_print_signature"]
+            for row, valid in zip(rows, mask)
+            if valid
+        }
+        self.assertEqual(len(signatures), counts["valid"])
+        self.assertEqual(sum(mask), counts["valid"] + counts["duplicate"])
+
+    def test_ratios_must_leave_room_for_valid_rows(self):
+        with self.assertRaises(ValueError):
+            UserDataGenerator(10, invalid_ratio=0.6, duplicate_ratio=0.6)
+
+
+class IngestionBenchmarkTestCase(TestCase):
+    def test_stages_are_timed_and_rows_removed(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        generator = UserDataGenerator(
+            200, invalid_ratio=0.1, duplicate_ratio=0.1, prefix="bench-"
+        )
+        benchmark = IngestionBenchmark(generator, directory, repeat=2)
+
+        result = benchmark.run(".csv")
+
+        self.assertEqual(
+            list(result["stages"]), list(IngestionBenchmark.STAGES)
+        )
+        for stage in result["stages"].values():
+            self.assertEqual(len(stage["runs"]), 2)
+            self.assertGreater(stage["seconds"], 0)
+        self.assertIsNone(result["stages"]["header"]["rows_per_second"])
+        self.assertFalse(UserData.objects.exists())
+        self.assertFalse(FileUpload.objects.exists())
+
+
+class LatencySummaryTestCase(TestCase):
+    def test_percentiles_and_error_rate(self):
+        latencies = [index / 1000 for index in range(1, 101)]
+
+        summary = LatencySummary.summarize(latencies, 25, 10.0)
+
+        self.assertEqual(summary["requests"], 125)
+        self.assertEqual(summary["error_rate"], 0.2)
+        self.assertEqual(summary["throughput"], 10.0)
+        self.assertAlmostEqual(summary["p50"], 50)
+        self.assertAlmostEqual(summary["p95"], 95)
+        self.assertAlmostEqual(summary["p99"], 99)
+        self.assertAlmostEqual(summary["max"], 100)
+
+    def test_no_successful_requests(self):
+        summary = LatencySummary.summarize([], 3, 1.0)
+
+        self.assertEqual(summary["error_rate"], 1.0)
+        self.assertIsNone(summary["p99"])
+
+
+class LoadTestMixTestCase(TestCase):
+    def take(self, mix, stream, count):
+        requests = mix.requests(stream)
+        return [next(requests)[:3] for _ in range(count)]
+
+    def test_same_seed_sends_the_same_requests(self):
+        mix = LoadTestMix("users", 10000, seed=3)
+        again = LoadTestMix("users", 10000, seed=3)
+
+        first = self.take(mix, 0, 50)
+
+        self.assertEqual(first, self.take(again, 0, 50))
+        self.assertNotEqual(first, self.take(mix, 1, 50))
+        self.assertEqual(
+            {kind for kind, _, _ in first}, set(LoadTestMix.SCENARIOS["users"])
+        )
+        for kind, _, path in first:
+            if kind == "deep_page":
+                page = int(path.split("page=")[1].split("&")[0])
+                self.assertGreaterEqual(page, 75)
+
+    def test_uploads_are_distinct_csv_files(self):
+        mix = LoadTestMix("uploads", 0, upload_rows=(5,))
+        requests = mix.requests(0)
+
+        _, method, path, body, headers = next(requests)
+        other = next(requests)[3]
+
+        self.assertEqual((method, path), ("POST", "/v1/file-upload/"))
+        self.assertIn("multipart/form-data", headers["Content-Type"])
+        self.assertIn(b"first_name,last_name", body)
+        self.assertNotEqual(body, other)
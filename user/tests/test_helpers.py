@@ -0,0 +1,293 @@
+import datetime
+import gzip
+import os
+import shutil
+import tempfile
+import types
+from unittest import skipUnless
+
+import openpyxl
+import zstandard
+from django.db import connection
+from django.test import TestCase
+
+from user.helpers import (
+    BatchInserter,
+    CopyInserter,
+    CsvRowStream,
+    FileReader,
+)
+from user.models import UserData
+
+
+def make_user_data(index):
+    return UserData(
+        first_name="John",
+        last_name="Doe",
+        national_id=str(index),
+        birth_date="1990-01-01",
+        address="123 Main St",
+        country="USA",
+        phone_number="1234567890",
+        email="john.doe@example.com",
+        finger_print_signature=f"signature{index}",
+    )
+
+
+class BatchInserterTestCase(TestCase):
+    def test_add_flushes_full_batches(self):
+        inserter = BatchInserter(UserData, batch_size=2)
+        for index in range(5):
+            inserter.add(make_user_data(index))
+
+        self.assertEqual(UserData.objects.count(), 4)
+        self.assertEqual(len(inserter.pending), 1)
+        self.assertEqual(len(inserter.timings), 2)
+
+    def test_flush_writes_remaining_rows(self):
+        inserter = BatchInserter(UserData, batch_size=10)
+        for index in range(3):
+            inserter.add(make_user_data(index))
+
+        self.assertEqual(inserter.flush(), 3)
+        self.assertEqual(inserter.flush(), 0)
+        self.assertEqual(inserter.inserted, 3)
+        self.assertEqual(UserData.objects.count(), 3)
+
+    def test_rows_skipped_on_conflict_are_not_counted(self):
+        make_user_data(0).save()
+        inserter = BatchInserter(
+            UserData, batch_size=10, ignore_conflicts=True
+        )
+        for index in [0, 1, 2, 2]:
+            inserter.add(make_user_data(index))
+
+        self.assertEqual(inserter.flush(), 2)
+        self.assertEqual(inserter.inserted, 2)
+        self.assertEqual(UserData.objects.count(), 3)
+
+
+@skipUnless(connection.vendor == "postgresql", "COPY requires PostgreSQL")
+class CopyInserterTestCase(TestCase):
+    fields = [
+        "first_name",
+        "last_name",
+        "national_id",
+        "birth_date",
+        "address",
+        "country",
+        "phone_number",
+        "email",
+        "finger_print_signature",
+    ]
+
+    def make_row(self, index):
+        instance = make_user_data(index)
+        return {field: getattr(instance, field) for field in self.fields}
+
+    def test_flush_copies_rows_and_skips_conflicts(self):
+        make_user_data(0).save()
+        inserter = CopyInserter(
+            UserData, self.fields, "finger_print_signature", batch_size=10
+        )
+        for index in [0, 1, 2, 2]:
+            inserter.add(self.make_row(index))
+
+        self.assertEqual(inserter.flush(), 2)
+        self.assertEqual(UserData.objects.count(), 3)
+        self.assertIsNotNone(
+            UserData.objects.get(finger_print_signature="signature1")
+            .time_added
+        )
+
+    def test_empty_text_fields_are_copied_as_empty_strings(self):
+        inserter = CopyInserter(
+            UserData, self.fields, "finger_print_signature", batch_size=10
+        )
+        row = self.make_row(0)
+        row["address"] = ""
+        inserter.add(row)
+
+        self.assertEqual(inserter.flush(), 1)
+        self.assertEqual(UserData.objects.get().address, "")
+
+
+class FileReaderTestCase(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.tmp_dir, "rows.csv")
+        with open(self.file_path, "w") as f:
+            f.write("first_name,last_name\n")
+            for index in range(5):
+                f.write(f"John{index},Doe\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_read_file_returns_list(self):
+        rows = FileReader.read_file(self.file_path)
+        self.assertIsInstance(rows, list)
+        self.assertEqual(len(rows), 5)
+
+    def test_read_file_streams_rows(self):
+        rows = FileReader.read_file(self.file_path, stream=True)
+        self.assertIsInstance(rows, types.GeneratorType)
+        self.assertEqual(next(rows)["first_name"], "John0")
+        self.assertEqual(len(list(rows)), 4)
+
+    def test_read_file_streams_chunks(self):
+        chunks = FileReader.read_file(
+            self.file_path, stream=True, chunk_size=2)
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 2, 1])
+
+    def test_split_csv_file_covers_every_row_once(self):
+        ranges = FileReader.split_csv_file(self.file_path, chunk_bytes=15)
+
+        self.assertGreater(len(ranges), 1)
+        rows = [
+            row["first_name"]
+            for start, end in ranges
+            for row in FileReader.stream_csv_file(self.file_path, start, end)
+        ]
+        self.assertEqual(rows, [f"John{index}" for index in range(5)])
+
+    def test_split_csv_file_keeps_quoted_newlines_in_their_record(self):
+        with open(self.file_path, "w") as f:
+            f.write("first_name,address\n")
+            for index in range(20):
+                f.write(f'John{index},"{index} Main St\nFloor ""2""\n"\n')
+
+        for chunk_bytes, scan_bytes in [(10, 1024), (25, 7), (1000, 3)]:
+            ranges = FileReader.split_csv_file(
+                self.file_path, chunk_bytes, scan_bytes=scan_bytes
+            )
+            rows = [
+                row
+                for start, end in ranges
+                for row in FileReader.stream_csv_file(
+                    self.file_path, start, end
+                )
+            ]
+            self.assertEqual(
+                [row["first_name"] for row in rows],
+                [f"John{index}" for index in range(20)],
+            )
+            self.assertEqual(rows[3]["address"], '3 Main St\nFloor "2"\n')
+
+
+class ExcelReaderTestCase(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.tmp_dir, "rows.xlsx")
+        book = openpyxl.Workbook()
+        sheet = book.active
+        sheet.append(["first_name", "national_id", "birth_date"])
+        sheet.append(["John", 123456789, datetime.date(1990, 1, 1)])
+        sheet.append(["Jane", 987654321, "1995-05-15"])
+        book.save(self.file_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_stream_excel_file_yields_rows_as_strings(self):
+        rows = FileReader.read_file(self.file_path, stream=True)
+
+        self.assertIsInstance(rows, types.GeneratorType)
+        self.assertEqual(
+            list(rows),
+            [
+                {
+                    "first_name": "John",
+                    "national_id": "123456789",
+                    "birth_date": "1990-01-01",
+                },
+                {
+                    "first_name": "Jane",
+                    "national_id": "987654321",
+                    "birth_date": "1995-05-15",
+                },
+            ],
+        )
+
+    def test_read_header(self):
+        self.assertEqual(
+            FileReader.read_header(self.file_path),
+            ["first_name", "national_id", "birth_date"],
+        )
+
+
+class CsvRowStreamTestCase(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.tmp_dir, "rows.csv")
+        with open(self.file_path, "w") as f:
+            f.write("first_name,last_name\nJohn,Doe\nJane,Doe\nJim,Doe\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_offset_points_past_last_row(self):
+        stream = CsvRowStream(self.file_path)
+        rows = iter(stream)
+        next(rows)
+
+        self.assertEqual(
+            stream.offset, len("first_name,last_name\nJohn,Doe\n"))
+
+    def test_resumes_from_offset(self):
+        stream = CsvRowStream(self.file_path)
+        rows = iter(stream)
+        next(rows)
+
+        resumed = CsvRowStream(self.file_path, start=stream.offset)
+        self.assertEqual(
+            [row["first_name"] for row in resumed], ["Jane", "Jim"])
+
+
+class CompressedCsvTestCase(TestCase):
+    CONTENT = b"first_name,last_name\nJohn,Doe\nJane,Doe\nJim,Doe\n"
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.paths = {
+            ".gz": os.path.join(self.tmp_dir, "rows.csv.gz"),
+            ".zst": os.path.join(self.tmp_dir, "rows.CSV.zst"),
+        }
+        with gzip.open(self.paths[".gz"], "wb") as f:
+            f.write(self.CONTENT)
+        with zstandard.open(self.paths[".zst"], "wb") as f:
+            f.write(self.CONTENT)
+
+    def test_split_extension(self):
+        self.assertEqual(
+            FileReader.split_extension("rows.csv.gz"), (".csv", ".gz"))
+        self.assertEqual(
+            FileReader.split_extension("Rows.CSV.ZST"), (".csv", ".zst"))
+        self.assertEqual(FileReader.split_extension("rows.csv"), (".csv", ""))
+
+    def test_rows_and_header_are_read_through_compression(self):
+        for compression, path in self.paths.items():
+            with self.subTest(compression):
+                self.assertEqual(
+                    FileReader.read_header(path), ["first_name", "last_name"]
+                )
+                self.assertEqual(
+                    [row["first_name"] for row in FileReader.read_file(path)],
+                    ["John", "Jane", "Jim"],
+                )
+
+    def test_resumes_from_decompressed_offset(self):
+        for compression, path in self.paths.items():
+            with self.subTest(compression):
+                stream = CsvRowStream(path)
+                rows = iter(stream)
+                next(rows)
+
+                resumed = CsvRowStream(path, start=stream.offset)
+                self.assertEqual(
+                    [row["first_name"] for row in resumed], ["Jane", "Jim"])
+
+    def test_compressed_excel_is_refused(self):
+        with self.assertRaises(ValueError):
+            FileReader.read_file(os.path.join(self.tmp_dir, "rows.xlsx.gz"))
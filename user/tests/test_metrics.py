@@ -0,0 +1,131 @@
+import datetime
+from unittest import mock
+
+from django.core.signals import request_finished
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from prometheus_client import REGISTRY
+
+from user.metrics import ConnectionMetrics, QueueMetrics
+from user.models import FileUpload
+
+
+class ConnectionMetricsTestCase(SimpleTestCase):
+    def setUp(self):
+        ConnectionMetrics.reset()
+        self.addCleanup(ConnectionMetrics.reset)
+
+    def test_reuse_ratio_counts_requests_without_a_new_connection(self):
+        connection_created.send(sender=type(connection), connection=connection)
+        for _ in range(4):
+            request_finished.send(sender=self.__class__)
+
+        snapshot = ConnectionMetrics.snapshot()
+
+        self.assertEqual(snapshot["connections_opened"], 1)
+        self.assertEqual(snapshot["requests"], 4)
+        self.assertEqual(snapshot["reuse_ratio"], 0.75)
+
+    def test_reuse_ratio_is_zero_before_any_request(self):
+        self.assertEqual(ConnectionMetrics.snapshot()["reuse_ratio"], 0.0)
+
+
+class QueueMetricsTestCase(TestCase):
+    @mock.patch("user.signals.dispatch_upload")
+    def test_wait_times_are_summarized_by_queue(self, dispatch):
+        now = timezone.now()
+        for queue, wait in (
+            ("ingest_small", 1.0),
+            ("ingest_small", 3.0),
+            ("ingest_large", 60.0),
+        ):
+            FileUpload.objects.create(
+                file="media/uploads/a.csv",
+                queue=queue,
+                queue_wait_seconds=wait,
+                processing_started_at=now,
+            )
+        FileUpload.objects.create(
+            file="media/uploads/old.csv",
+            queue="ingest_small",
+            queue_wait_seconds=500.0,
+            processing_started_at=now - datetime.timedelta(hours=2),
+        )
+
+        waits = QueueMetrics.wait_times(now - datetime.timedelta(hours=1))
+
+        self.assertEqual(
+            waits,
+            {
+                "ingest_large": {
+                    "uploads": 1, "average": 60.0, "longest": 60.0
+                },
+                "ingest_small": {
+                    "uploads": 2, "average": 2.0, "longest": 3.0
+                },
+            },
+        )
+
+
+@override_settings(USER_DATA_CACHE_TIMEOUT=0)
+class MetricsEndpointTestCase(TestCase):
+    def setUp(self):
+        depths = mock.patch.object(
+            QueueMetrics, "depths",
+            return_value={"ingest_small": 2, "ingest_large": 0},
+        )
+        self.depths = depths.start()
+        self.addCleanup(depths.stop)
+
+    def sample(self, name, labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    @mock.patch("user.signals.dispatch_upload")
+    def test_reports_uploads_by_status(self, dispatch):
+        FileUpload.objects.create(file="media/uploads/a.csv")
+        FileUpload.objects.create(
+            file="media/uploads/b.csv",
+            status=FileUpload.FILE_STATUS_PROCESSED,
+        )
+
+        response = self.client.get("/metrics")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+        body = response.content.decode()
+        self.assertIn('fileupload_uploads{status="pending"} 1.0', body)
+        self.assertIn('fileupload_uploads{status="failed"} 0.0', body)
+        self.assertIn('fileupload_queue_depth{queue="ingest_small"} 2.0', body)
+        self.assertIn("fileupload_broker_up 1.0", body)
+
+    def test_unreachable_broker_is_reported_down(self):
+        self.depths.side_effect = OSError("Connection refused")
+
+        response = self.client.get("/metrics")
+
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn("fileupload_broker_up 0.0", body)
+        self.assertIn('fileupload_uploads{status="pending"}', body)
+        self.assertNotIn("fileupload_queue_depth{", body)
+
+    def test_api_requests_are_timed_by_view(self):
+        labels = {"view": "user-list", "method": "GET"}
+        before = self.sample(
+            "fileupload_http_request_duration_seconds_count", labels
+        )
+
+        self.client.get("/v1/users/")
+
+        self.assertEqual(
+            self.sample(
+                "fileupload_http_request_duration_seconds_count", labels
+            ),
+            before + 1,
+        )
+        self.assertIn(
+            "fileupload_http_requests_total",
+            self.client.get("/metrics").content.decode(),
+        )
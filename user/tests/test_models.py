@@ -78,5 +78,12 @@ class FileUploadTestCase(TestCase):
         self.assertEqual(self.file_upload.status,
                          FileUpload.FILE_STATUS_FAILED)
 
+    def test_resume_processing_transition_from_failed(self):
+        self.file_upload.start_processing()
+        self.file_upload.mark_processing_failed()
+        self.file_upload.resume_processing()
+        self.assertEqual(self.file_upload.status,
+                         FileUpload.FILE_STATUS_PROCESSING)
+
     def test_filename(self):
         self.assertEqual(self.file_upload.filename(), "test_file.csv")
@@ -51,6 +51,18 @@ class TestSerializers(TestCase):
         expected_data = {
             "id": file_upload.id,
             "file": "/path/to/file.txt",
+            "original_filename": "",
+            "sha256": "",
+            "priority": "normal",
+            "queue": "",
+            "queue_wait_seconds": None,
             "status": "pending",
+            "rows_read": 0,
+            "rows_inserted": 0,
+            "rows_rejected": 0,
+            "rejected_reasons": {},
+            "duplicates_skipped": 0,
+            "bytes_per_second": None,
+            "rejected_rows_file": None,
         }
         self.assertEqual(serializer.data, expected_data)
@@ -0,0 +1,655 @@
+import csv
+import datetime
+import os
+import uuid
+import shutil
+import tempfile
+from unittest import mock
+
+import openpyxl
+import zstandard
+from prometheus_client import REGISTRY
+
+from unittest import skipUnless
+
+from django.core.files.storage import default_storage
+from django.db import OperationalError, connection, transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from user.cache import UserDataCache
+from user.helpers import BatchInserter
+from user.models import FileUpload, UserData
+from user.tasks import (
+    INGESTION_QUEUE_LARGE,
+    INGESTION_QUEUE_SMALL,
+    finalize_uploaded_file,
+    ingest_rows,
+    mark_upload_failed,
+    process_file_chunk,
+    process_uploaded_file,
+    sweep_stale_uploads,
+)
+
+HEADER = (
+    "first_name,last_name,national_id,birth_date,address,"
+    "country,phone_number,email,finger_print_signature\n"
+)
+
+
+class ProcessUploadedFileTestCase(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(
+            MEDIA_ROOT=self.media_root, USER_DATA_BATCH_SIZE=2
+        )
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root)
+
+    def create_upload(self, content, name="upload.csv"):
+        path = os.path.join(self.media_root, name)
+        with open(path, "w") as f:
+            f.write(content)
+        with mock.patch("user.signals.dispatch_upload"):
+            return FileUpload.objects.create(file=name)
+
+    def test_valid_rows_are_inserted_in_batches(self):
+        rows = "".join(
+            f"John,Doe,{i},1990-01-01,123 Main St,USA,"
+            f"1234567890,john@example.com,signature{i}\n"
+            for i in range(5)
+        )
+        upload = self.create_upload(HEADER + rows)
+
+        process_uploaded_file(upload.id)
+
+        upload.refresh_from_db()
+        self.assertEqual(upload.status, FileUpload.FILE_STATUS_PROCESSED)
+        self.assertEqual(UserData.objects.count(), 5)
+
+    def test_stages_and_rows_are_measured(self):
+        def sample(name, labels=None):
+            return REGISTRY.get_sample_value(name, labels or {}) or 0
+
+        stages = ("header", "parse", "validate", "dedup", "insert")
+        before = {
+            stage: sample(
+                "fileupload_ingestion_stage_seconds_count", {"stage": stage}
+            )
+            for stage in stages
+        }
+        inserted = sample(
+            "fileupload_ingested_rows_total", {"outcome": "inserted"}
+        )
+        ingestions = sample("fileupload_ingestion_rows_per_second_count")
+        rows = "".join(
+            f"John,Doe,{i},1990-01-01,123 Main St,USA,"
+            f"1234567890,john@example.com,signature{i}\n"
+            for i in range(3)
+        )
+        upload = self.create_upload(HEADER + rows)
+
+        process_uploaded_file(upload.id)
+
+        for stage in stages:
+            self.assertGreater(
+                sample(
+                    "fileupload_ingestion_stage_seconds_count",
+                    {"stage": stage},
+                ),
+                before[stage],
+            )
+        self.assertEqual(
+            sample("fileupload_ingested_rows_total", {"outcome": "inserted"}),
+            inserted + 3,
+        )
+        self.assertEqual(
+            sample("fileupload_ingestion_rows_per_second_count"),
+            ingestions + 1,
+        )
+
+    def test_committed_batches_invalidate_cached_user_data(self):
+        rows = "".join(
+            f"John,Doe,{i},1990-01-01,123 Main St,USA,"
+            f"1234567890,john@example.com,signature{i}\n"
+            for i in range(3)
+        )
+        upload = self.create_upload(HEADER + rows)
+        generation = UserDataCache.generation()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            process_uploaded_file(upload.id)
+
+        # One bump per committed batch of USER_DATA_BATCH_SIZE=2 rows
+        self.assertEqual(UserDataCache.generation(), generation + 2)
+
+    @skipUnless(connection.vendor == "postgresql", "COPY requires PostgreSQL")
+    def test_copy_loader_inserts_rows(self):
+        rows = "".join(
+            f"John,Doe,{i},1990-01-01,123 Main St,USA,"
+            f"1234567890,john@example.com,signature{i}\n"
+            for i in range(5)
+        )
+        upload = self.create_upload(HEADER + rows)
+
+        process_uploaded_file(upload.id, loader="copy")
+
+        upload.refresh_from_db()
+        self.assertEqual(upload.status, FileUpload.FILE_STATUS_PROCESSED)
+        self.assertEqual(upload.rows_inserted, 5)
+        self.assertEqual(UserData.objects.count(), 5)
+
+    def test_xlsx_rows_are_inserted(self):
+        book = openpyxl.Workbook()
+        sheet = book.active
+        sheet.append(HEADER.strip().split(","))
+        for i in range(3):
+            sheet.append([
+                "John", "Doe", 1000 + i, datetime.date(1990, 1, 1),
+                "123 Main St", "USA", 1234567890, "john@example.com",
+                f"signature{i}",
+            ])
+        book.save(os.path.join(self.media_root, "upload.xlsx"))
+        with mock.patch("user.signals.dispatch_upload"):
+            upload = FileUpload.objects.create(file="upload.xlsx")
+
+        process_uploaded_file(upload.id)
+
+        upload.refresh_from_db()
+        self.assertEqual(upload.status, FileUpload.FILE_STATUS_PROCESSED)
+        self.assertEqual(upload.rows_inserted, 3)
+        self.assertEqual(
+            str(UserData.objects.get(national_id="1000").birth_date),
+            "1990-01-01",
+        )
+
+    def test_compressed_rows_are_inserted(self):
+        rows = "".join(
+            f"John,Doe,{i},1990-01-01,123 Main St,USA,"
+            f"1234567890,john@example.com,signature{i}\n"
+            for i in range(5)
+        )
+        name = "upload.csv.zst"
+        with zstandard.open(os.path.join(self.media_root, name), "w") as f:
+            f.write(HEADER + rows)
+        with mock.patch("user.signals.dispatch_upload"):
+            upload = FileUpload.objects.create(file=name)
+
+        process_uploaded_file(upload.id)
+
+        upload.refresh_from_db()
+        self.assertEqual(upload.status, FileUpload.FILE_STATUS_PROCESSED)
+        self.assertEqual(UserData.objects.count(), 5)
+
+    def test_invalid_rows_are_skipped(self):
+        rows = (
+            "John,Doe,1,1990-01-01,123 Main St,USA,"
+            "1234567890,john@example.com,signature1\n"
+            "J0hn,Doe,2,1990-01-01,123 Main St,USA,"
+            "1234567890,john@example.com,signature2\n"
+            "John,Doe,3,not-a-date,123 Main St,USA,"
+            "1234567890,john@example.com,signature3\n"
+        )
+        upload = self.create_upload(HEADER + rows)
+
+        process_uploaded_file(upload.id)
+
+        self.assertEqual(
+            list(UserData.objects.values_list(
+                "finger_print_signature", flat=True)),
+            ["signature1"],
+        )
+
+        upload.refresh_from_db()
+        self.assertEqual(upload.rows_read, 3)
+        self.assertEqual(upload.rows_inserted, 1)
+        self.assertEqual(upload.rows_rejected, 2)
+        self.assertEqual(
+            upload.rejected_reasons,
+            {"invalid_first_name": 1, "invalid_birth_date": 1},
+        )
+        self.assertIsNotNone(upload.bytes_per_second)
+        with upload.rejected_rows_file.open("r") as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines[0], "reason," + HEADER.strip())
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[1].startswith("invalid_first_name,J0hn,"))
+
+    def test_duplicate_signatures_are_skipped(self):
+        UserData.objects.create(
+            first_name="Jane",
+            last_name="Doe",
+            national_id="9",
+            birth_date="1990-01-01",
+            address="123 Main St",
+            country="USA",
+            phone_number="1234567890",
+            email="jane@example.com",
+            finger_print_signature="signature0",
+        )
+        rows = "".join(
+            f"John,Doe,{i},1990-01-01,123 Main St,USA,"
+            f"1234567890,john@example.com,signature{i % 3}\n"
+            for i in range(6)
+        )
+        upload = self.create_upload(HEADER + rows)
+
+        process_uploaded_file(upload.id)
+
+        upload.refresh_from_db()
+        self.assertEqual(upload.status, FileUpload.FILE_STATUS_PROCESSED)
+        self.assertEqual(UserData.objects.count(), 3)
+        self.assertEqual(upload.duplicates_skipped, 4)
+
+    def test_large_file_is_processed_in_parallel_chunks(self):
+        rows = "".join(
+            f"John,Doe,{i},1990-01-01,123 Main St,USA,"
+            f"1234567890,john@example.com,signature{i % 7}\n"
+            for i in range(20)
+        )
+        upload = self.create_upload(HEADER + rows)
+
+        with override_settings(
+            PARALLEL_INGESTION_THRESHOLD=0, PARALLEL_INGESTION_CHUNK_SIZE=200
+        ), mock.patch("user.tasks.chord") as chord:
+            result = process_uploaded_file(upload.id)
+
+        self.assertTrue(result.startswith("File split into"))
+        chunks = list(chord.call_args.args[0])
+        callback = chord.return_value.call_args.args[0]
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(
+            {chunk.task for chunk in chunks}, {process_file_chunk.name}
+        )
+        self.assertEqual(callback.task, finalize_uploaded_file.name)
+        self.assertEqual(callback.args, (upload.id,))
+        # Run the chord as a worker would: the chunks, then the callback
+        finalize_uploaded_file(
+            [process_file_chunk(*chunk.args) for chunk in chunks],
+            *callback.args,
+        )
+
+        upload.refresh_from_db()
+        self.assertEqual(upload.status, FileUpload.FILE_STATUS_PROCESSED)
+        self.assertEqual(UserData.objects.count(), 7)
+        self.assertEqual(upload.rows_read, 20)
+
+    def test_queued_chunks_keep_the_upload_from_being_split_again(self):
+        rows = "".join(
+            f"John,Doe,{i},1990-01-01,123 Main St,USA,"
+            f"1234567890,john@example.com,signature{i}\n"
+            for i in range(20)
+        )
+        upload = self.create_upload(HEADER + rows)
+
+        with override_settings(
+            PARALLEL_INGESTION_THRESHOLD=0, PARALLEL_INGESTION_CHUNK_SIZE=200
+        ), mock.patch("user.tasks.chord") as chord:
+            process_uploaded_file(upload.id)
+            # The chunks wait in their queue past UPLOAD_STALE_AFTER
+            long_ago = timezone.now() - datetime.timedelta(hours=1)
+            FileUpload.objects.filter(id=upload.id).update(
+                dispatched_at=long_ago, heartbeat_at=long_ago
+            )
+            with mock.patch("user.tasks.dispatch_upload") as dispatch:
+                self.assertEqual(sweep_stale_uploads(), 0)
+            process_uploaded_file(upload.id)
+
+        dispatch.assert_not_called()
+        chord.assert_called_once()
+        upload.refresh_from_db()
+        self.assertEqual(upload.status, FileUpload.FILE_STATUS_PROCESSING)
+        self.assertIsNotNone(upload.split_at)
+
+    def test_chunk_refreshes_heartbeat_with_every_batch(self):
+        rows = "".join(
+            f"John,Doe,{i},1990-01-01,123 Main St,USA,"
+            f"1234567890,john@example.com,signature{i}\n"
+            for i in range(5)
+        )
+        upload = self.create_upload(HEADER + rows)
+        long_ago = timezone.now() - datetime.timedelta(hours=1)
+        FileUpload.objects.filter(id=upload.id).update(heartbeat_at=long_ago)
+        heartbeats = []
+
+        def recording_ingest_rows(rows, rejected_writer, checkpoint, loader):
+            def record(progress):
+                checkpoint(progress)
+                heartbeats.append(
+                    FileUpload.objects.get(id=upload.id).heartbeat_at
+                )
+            return ingest_rows(rows, rejected_writer, record, loader)
+
+        with mock.patch("user.tasks.ingest_rows", recording_ingest_rows):
+            process_file_chunk(
+                upload.id, len(HEADER), len(HEADER) + len(rows)
+            )
+
+        self.assertEqual(len(heartbeats), 3)
+        self.assertTrue(all(beat > long_ago for beat in heartbeats))
+
+    def test_retried_chunk_resumes_after_its_committed_rows(self):
+        rows = "".join(
+            f"John,Doe,{i},1990-01-01,123 Main St,USA,"
+            f"1234567890,{email},signature{i}\n"
+            for i, email in enumerate([
+                "john@example.com", "bad0", "john@example.com", "bad1",
+                "john@example.com",
+            ])
+        )
+        upload = self.create_upload(HEADER + rows)
+        FileUpload.objects.filter(id=upload.id).update(
+            status=FileUpload.FILE_STATUS_PROCESSING
+        )
+        start, end = len(HEADER), len(HEADER) + len(rows)
+        original_flush = BatchInserter.flush
+
+        def failing_flush(inserter):
+            signatures = [
+                row.finger_print_signature for row in inserter.pending
+            ]
+            if "signature2" in signatures:
+                raise OperationalError("connection lost")
+            return original_flush(inserter)
+
+        with mock.patch.object(BatchInserter, "flush", failing_flush):
+            with self.assertRaises(OperationalError):
+                process_file_chunk(upload.id, start, end)
+        result = process_file_chunk(upload.id, start, end)
+
+        self.assertEqual(result["rows_read"], 5)
+        self.assertEqual(result["inserted"], 3)
+        self.assertEqual(result["duplicates"], 0)
+        self.assertEqual(result["rejected"], {"invalid_email": 2})
+        with default_storage.open(result["rejected_file"], "r") as f:
+            rejected = list(csv.DictReader(f))
+        self.assertEqual(
+            [row["email"] for row in rejected], ["bad0", "bad1"]
+        )
+
+        finalize_uploaded_file([result], upload.id)
+
+        upload.refresh_from_db()
+        self.assertEqual(upload.rows_inserted, 3)
+        self.assertEqual(upload.duplicates_skipped, 0)
+        self.assertFalse(upload.chunks.exists())
+
+    def test_finalizing_twice_keeps_the_upload_processed(self):
+        rows = "".join(
+            f"John,Doe,{i},1990-01-01,123 Main St,USA,"
+            f"1234567890,john@example.com,signature{i}\n"
+            for i in range(4)
+        )
+        upload = self.create_upload(HEADER + rows)
+        FileUpload.objects.filter(id=upload.id).update(
+            status=FileUpload.FILE_STATUS_PROCESSING
+        )
+        results = [
+            process_file_chunk(upload.id, len(HEADER), len(HEADER) + len(rows))
+        ]
+
+        finalize_uploaded_file(results, upload.id)
+        self.assertIsNone(finalize_uploaded_file(results, upload.id))
+        mark_upload_failed(upload.id)
+
+        upload.refresh_from_db()
+        self.assertEqual(upload.status, FileUpload.FILE_STATUS_PROCESSED)
+        self.assertEqual(upload.rows_inserted, 4)
+
+    def test_retry_resumes_from_checkpoint(self):
+        rows = "".join(
+            f"John,Doe,{i},1990-01-01,123 Main St,USA,"
+            f"1234567890,john@example.com,signature{i}\n"
+            for i in range(5)
+        )
+        upload = self.create_upload(HEADER + rows)
+        original_flush = BatchInserter.flush
+
+        def failing_flush(inserter):
+            signatures = [
+                row.finger_print_signature for row in inserter.pending
+            ]
+            if "signature2" in signatures:
+                raise OperationalError("connection lost")
+            return original_flush(inserter)
+
+        with mock.patch.object(BatchInserter, "flush", failing_flush):
+            with self.assertRaises(OperationalError):
+                process_uploaded_file(upload.id)
+
+        upload.refresh_from_db()
+        self.assertEqual(upload.status, FileUpload.FILE_STATUS_FAILED)
+        self.assertEqual(upload.rows_read, 2)
+        self.assertEqual(upload.checkpoint_offset, len(HEADER) + len(
+            "".join(rows.splitlines(keepends=True)[:2])))
+        self.assertEqual(UserData.objects.count(), 2)
+
+        process_uploaded_file(upload.id)
+
+        upload.refresh_from_db()
+        self.assertEqual(upload.status, FileUpload.FILE_STATUS_PROCESSED)
+        self.assertEqual(upload.rows_read, 5)
+        self.assertEqual(upload.rows_inserted, 5)
+        self.assertEqual(upload.duplicates_skipped, 0)
+        self.assertEqual(UserData.objects.count(), 5)
+
+    def test_retry_does_not_write_rejected_rows_twice(self):
+        rows = "".join(
+            f"John,Doe,{i},1990-01-01,123 Main St,USA,"
+            f"1234567890,{email},signature{i}\n"
+            for i, email in enumerate([
+                "john@example.com", "bad0", "john@example.com", "bad1",
+                "john@example.com",
+            ])
+        )
+        upload = self.create_upload(HEADER + rows)
+        original_flush = BatchInserter.flush
+
+        def failing_flush(inserter):
+            signatures = [
+                row.finger_print_signature for row in inserter.pending
+            ]
+            if "signature2" in signatures:
+                raise OperationalError("connection lost")
+            return original_flush(inserter)
+
+        # The second batch writes bad1 and then fails to commit
+        with mock.patch.object(BatchInserter, "flush", failing_flush):
+            with self.assertRaises(OperationalError):
+                process_uploaded_file(upload.id)
+        process_uploaded_file(upload.id)
+
+        upload.refresh_from_db()
+        self.assertEqual(upload.status, FileUpload.FILE_STATUS_PROCESSED)
+        self.assertEqual(upload.rows_rejected, 2)
+        with upload.rejected_rows_file.open("r") as f:
+            rejected = list(csv.DictReader(f))
+        self.assertEqual(
+            [row["email"] for row in rejected], ["bad0", "bad1"]
+        )
+
+
+class DispatchUploadTestCase(TestCase):
+    def setUp(self):
+        patcher = mock.patch("user.tasks.process_uploaded_file.apply_async")
+        self.apply_async = patcher.start()
+        self.addCleanup(patcher.stop)
+        depths = mock.patch(
+            "user.tasks.QueueMetrics.depths",
+            return_value={
+                INGESTION_QUEUE_SMALL: 0, INGESTION_QUEUE_LARGE: 0,
+            },
+        )
+        self.depths = depths.start()
+        self.addCleanup(depths.stop)
+
+    def test_task_is_sent_after_commit_with_the_upload_key(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            upload = FileUpload.objects.create(file="media/uploads/a.csv")
+            self.apply_async.assert_not_called()
+
+        for callback in callbacks:
+            callback()
+
+        key = str(upload.dispatch_key)
+        self.apply_async.assert_called_once_with(
+            (upload.id,),
+            {"dispatch_key": key},
+            task_id=key,
+            queue=INGESTION_QUEUE_SMALL,
+            priority=3,
+        )
+        upload.refresh_from_db()
+        self.assertIsNotNone(upload.dispatched_at)
+        self.assertEqual(upload.queue, INGESTION_QUEUE_SMALL)
+
+    @override_settings(INGESTION_LARGE_FILE_SIZE=100)
+    def test_large_files_go_to_their_own_queue(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        with open(os.path.join(media_root, "large.csv"), "w") as f:
+            f.write(HEADER * 2)
+
+        with override_settings(MEDIA_ROOT=media_root):
+            with self.captureOnCommitCallbacks(execute=True):
+                FileUpload.objects.create(
+                    file="large.csv", priority=FileUpload.PRIORITY_HIGH
+                )
+
+        kwargs = self.apply_async.call_args.kwargs
+        self.assertEqual(kwargs["queue"], INGESTION_QUEUE_LARGE)
+        self.assertEqual(kwargs["priority"], 0)
+
+    def test_claim_records_the_queue_wait(self):
+        # Dispatched again by the sweeper a moment ago
+        upload = FileUpload.objects.create(
+            file="media/uploads/missing.csv",
+            first_dispatched_at=(
+                timezone.now() - datetime.timedelta(seconds=30)
+            ),
+            dispatched_at=timezone.now(),
+        )
+
+        with self.assertRaises(FileNotFoundError):
+            process_uploaded_file(upload.id)
+
+        upload.refresh_from_db()
+        self.assertGreaterEqual(upload.queue_wait_seconds, 30)
+
+    def test_task_is_not_sent_when_the_upload_is_rolled_back(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            try:
+                with transaction.atomic():
+                    FileUpload.objects.create(file="media/uploads/a.csv")
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+
+        self.assertEqual(callbacks, [])
+        self.apply_async.assert_not_called()
+
+    def test_duplicate_delivery_leaves_a_claimed_upload_alone(self):
+        upload = FileUpload.objects.create(
+            file="media/uploads/a.csv",
+            status=FileUpload.FILE_STATUS_PROCESSING,
+            heartbeat_at=timezone.now(),
+        )
+
+        with mock.patch.object(FileUpload, "save") as save:
+            process_uploaded_file(
+                upload.id, dispatch_key=str(upload.dispatch_key)
+            )
+
+        save.assert_not_called()
+
+    def test_task_with_another_key_is_ignored(self):
+        upload = FileUpload.objects.create(file="media/uploads/a.csv")
+
+        process_uploaded_file(upload.id, dispatch_key=str(uuid.uuid4()))
+
+        upload.refresh_from_db()
+        self.assertEqual(upload.status, FileUpload.FILE_STATUS_PENDING)
+
+    @override_settings(UPLOAD_STALE_AFTER=60)
+    def test_sweeper_dispatches_stale_uploads_again(self):
+        long_ago = timezone.now() - datetime.timedelta(minutes=5)
+        lost = FileUpload.objects.create(
+            file="media/uploads/lost.csv", dispatched_at=long_ago
+        )
+        dead = FileUpload.objects.create(
+            file="media/uploads/dead.csv",
+            status=FileUpload.FILE_STATUS_PROCESSING,
+            dispatched_at=long_ago,
+            heartbeat_at=long_ago,
+        )
+        FileUpload.objects.create(
+            file="media/uploads/queued.csv", dispatched_at=timezone.now()
+        )
+        FileUpload.objects.create(
+            file="media/uploads/working.csv",
+            status=FileUpload.FILE_STATUS_PROCESSING,
+            dispatched_at=long_ago,
+            heartbeat_at=timezone.now(),
+        )
+        FileUpload.objects.create(
+            file="media/uploads/done.csv",
+            status=FileUpload.FILE_STATUS_PROCESSED,
+            dispatched_at=long_ago,
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            # One query finds the uploads, with every field dispatch needs
+            with self.assertNumQueries(1):
+                self.assertEqual(sweep_stale_uploads(), 2)
+
+        sent = {call.args[0][0] for call in self.apply_async.call_args_list}
+        self.assertEqual(sent, {lost.id, dead.id})
+
+    @override_settings(UPLOAD_STALE_AFTER=60)
+    def test_sweeper_keeps_the_first_dispatch_time(self):
+        long_ago = timezone.now() - datetime.timedelta(minutes=5)
+        upload = FileUpload.objects.create(
+            file="media/uploads/lost.csv",
+            first_dispatched_at=long_ago,
+            dispatched_at=long_ago,
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(sweep_stale_uploads(), 1)
+
+        upload.refresh_from_db()
+        self.assertEqual(upload.first_dispatched_at, long_ago)
+        self.assertGreater(upload.dispatched_at, long_ago)
+
+    @override_settings(UPLOAD_STALE_AFTER=60)
+    def test_sweeper_leaves_pending_uploads_to_a_busy_queue(self):
+        long_ago = timezone.now() - datetime.timedelta(minutes=5)
+        FileUpload.objects.create(
+            file="media/uploads/waiting.csv",
+            queue=INGESTION_QUEUE_LARGE,
+            dispatched_at=long_ago,
+        )
+        dead = FileUpload.objects.create(
+            file="media/uploads/dead.csv",
+            status=FileUpload.FILE_STATUS_PROCESSING,
+            queue=INGESTION_QUEUE_LARGE,
+            dispatched_at=long_ago,
+            heartbeat_at=long_ago,
+        )
+        self.depths.return_value = {
+            INGESTION_QUEUE_SMALL: 0, INGESTION_QUEUE_LARGE: 3,
+        }
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(sweep_stale_uploads(), 1)
+        # Nor are they dispatched while the broker cannot be asked
+        FileUpload.objects.filter(id=dead.id).update(dispatched_at=long_ago)
+        self.depths.side_effect = OSError("Connection refused")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(sweep_stale_uploads(), 1)
+
+        sent = [call.args[0][0] for call in self.apply_async.call_args_list]
+        self.assertEqual(sent, [dead.id, dead.id])
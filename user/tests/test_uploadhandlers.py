@@ -0,0 +1,86 @@
+import io
+import os
+import shutil
+import tempfile
+
+from django.http.multipartparser import MultiPartParser
+from django.test import SimpleTestCase, override_settings
+
+from user.uploadhandlers import DirectStorageUploadHandler
+
+BOUNDARY = "boundary"
+
+
+def multipart_body(filename, content):
+    return (
+        f"--{BOUNDARY}\r\n"
+        'Content-Disposition: form-data; name="file"; '
+        f'filename="{filename}"\r\n'
+        "Content-Type: text/csv\r\n\r\n"
+    ).encode() + content + f"\r\n--{BOUNDARY}--\r\n".encode()
+
+
+class CountingStream(io.BytesIO):
+    def __init__(self, data):
+        super().__init__(data)
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self.bytes_read += len(data)
+        return data
+
+
+class DirectStorageUploadHandlerTestCase(SimpleTestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def stored_files(self):
+        directory = os.path.join(self.media_root, "media", "uploads")
+        return [
+            name for _, _, names in os.walk(directory) for name in names
+        ]
+
+    def parse(self, body, handler):
+        stream = CountingStream(body)
+        parser = MultiPartParser(
+            {
+                "CONTENT_TYPE": f"multipart/form-data; boundary={BOUNDARY}",
+                "CONTENT_LENGTH": str(len(body)),
+            },
+            stream,
+            [handler],
+        )
+        files = parser.parse()[1]
+        return files, stream.bytes_read
+
+    def test_bad_header_stops_reading_the_body(self):
+        body = multipart_body("big.csv", b"id,name\n" + b"1,x\n" * 500000)
+        handler = DirectStorageUploadHandler(None, [".csv"])
+
+        files, bytes_read = self.parse(body, handler)
+
+        self.assertIn("Invalid file header", handler.error)
+        self.assertNotIn("file", files)
+        self.assertLess(bytes_read, len(body) // 10)
+        self.assertEqual(self.stored_files(), [])
+
+    def test_interrupted_upload_is_removed(self):
+        body = multipart_body(
+            "cut.csv",
+            b"first_name,last_name,national_id,birth_date,address,"
+            b"country,phone_number,email,finger_print_signature\n"
+            b"John,Doe,1",
+        )
+        # The body ends before the closing boundary
+        body = body[:body.rindex(b"\r\n--")]
+        handler = DirectStorageUploadHandler(None, [".csv"])
+
+        files, _ = self.parse(body, handler)
+
+        self.assertNotIn("file", files)
+        self.assertEqual(self.stored_files(), [])
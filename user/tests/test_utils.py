@@ -0,0 +1,135 @@
+from django.test import TestCase
+
+from user.models import UserData
+from user.utils import FingerprintDeduplicator, RowDataValidator
+
+
+def make_row(signature, **overrides):
+    row = {
+        "first_name": "John",
+        "last_name": "Doe",
+        "national_id": "123456789",
+        "birth_date": "1990-01-01",
+        "address": "123 Main St",
+        "country": "USA",
+        "phone_number": "1234567890",
+        "email": "john.doe@example.com",
+        "finger_print_signature": signature,
+    }
+    row.update(overrides)
+    return row
+
+
+class RowDataValidatorTestCase(TestCase):
+    def setUp(self):
+        UserData.objects.create(**make_row("existing"))
+
+    def test_is_valid_rejects_existing_signature(self):
+        self.assertFalse(RowDataValidator.is_valid(make_row("existing")))
+
+    def test_is_valid_can_skip_duplicate_check(self):
+        self.assertTrue(
+            RowDataValidator.is_valid(
+                make_row("existing"), check_duplicates=False)
+        )
+
+
+class FingerprintDeduplicatorTestCase(TestCase):
+    def setUp(self):
+        UserData.objects.create(**make_row("existing"))
+
+    def test_filter_drops_stored_and_repeated_signatures(self):
+        deduplicator = FingerprintDeduplicator()
+        rows = [make_row("existing"), make_row("new"), make_row("new")]
+
+        with self.assertNumQueries(1):
+            unique_rows = deduplicator.filter(rows)
+
+        self.assertEqual(
+            [row["finger_print_signature"] for row in unique_rows], ["new"]
+        )
+        self.assertEqual(deduplicator.duplicates, 2)
+
+    def test_filter_finds_earlier_chunks_in_the_database(self):
+        deduplicator = FingerprintDeduplicator()
+        for row in deduplicator.filter([make_row("first")]):
+            UserData.objects.create(**row)
+
+        self.assertEqual(deduplicator.filter([make_row("first")]), [])
+        self.assertEqual(deduplicator.duplicates, 1)
+
+    def test_filter_only_remembers_the_current_chunk(self):
+        deduplicator = FingerprintDeduplicator()
+        deduplicator.filter([make_row("first")])
+
+        self.assertEqual(len(deduplicator.filter([make_row("first")])), 1)
+
+
+class ValidateChunkTestCase(TestCase):
+    def test_validate_chunk_returns_mask_and_reasons(self):
+        rows = [
+            make_row("a"),
+            make_row("b", first_name="J0hn"),
+            make_row("c", email=""),
+            make_row("d", birth_date="1990-13-01"),
+            make_row("e", phone_number=1234567890),
+        ]
+
+        mask, reasons = RowDataValidator.validate_chunk(rows)
+
+        self.assertEqual(mask, [True, False, False, False, False])
+        self.assertEqual(
+            reasons,
+            [
+                None,
+                "invalid_first_name",
+                "missing_email",
+                "invalid_birth_date",
+                "invalid_phone_number",
+            ],
+        )
+
+    def test_validate_chunk_matches_is_valid(self):
+        rows = [
+            make_row("a"),
+            make_row("b", last_name="Doe Smith"),
+            make_row("c", email="not-an-email"),
+            make_row("d", address="   "),
+            make_row("e", national_id="12a"),
+            # A CSV row that ends early: DictReader fills in None
+            make_row("f", email=None, finger_print_signature=None),
+            make_row("g", finger_print_signature=None),
+        ]
+
+        mask, reasons = RowDataValidator.validate_chunk(rows)
+
+        self.assertEqual(
+            mask,
+            [
+                RowDataValidator.is_valid(row, check_duplicates=False)
+                for row in rows
+            ],
+        )
+        self.assertEqual(reasons[5], "missing_email")
+        self.assertEqual(reasons[6], "missing_finger_print_signature")
+
+    def test_dates_are_checked_as_strptime_would(self):
+        values = [
+            "1990-01-28", "2000-02-29", "1900-02-29", "1990-04-31",
+            "1990-1-5", "1990-01- 5", "0000-01-01", "1990-13-01",
+            "1990-01-01 ", "90-01-01", "",
+        ]
+
+        self.assertEqual(
+            RowDataValidator.check_dates(values),
+            [True, True, False, False, True, True, False, False, False,
+             False, False],
+        )
+
+    def test_signatures_that_cannot_be_encoded_are_rejected(self):
+        rows = [make_row("a"), make_row("b\udc80")]
+
+        mask, reasons = RowDataValidator.validate_chunk(rows)
+
+        self.assertEqual(mask, [True, False])
+        self.assertEqual(reasons[1], "invalid_finger_print_signature")
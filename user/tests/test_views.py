@@ -1,17 +1,41 @@
+import base64
+import csv
+import datetime
+import decimal
+import gzip
+import hashlib
 import io
+import json
+import os
+import shutil
+import tempfile
+import uuid
+from unittest import mock, skipUnless
+
+import zstandard
+from django.core.files.storage import default_storage
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import TestCase
+from django.db import OperationalError, connection
+from django.test import TestCase, override_settings
 from rest_framework import status
-from rest_framework.test import APIClient
+from rest_framework.mixins import ListModelMixin
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APIRequestFactory
 from django.urls import reverse
 from rest_framework.test import APITestCase
 
+from user.cache import UserDataCache
+from user.helpers import FileReader
 from user.models import UserData
 from user.models import FileUpload
+from user.models import ChunkedUpload
 
-from user.serializers import FileUploadSerializer
+from user.renderers import CSVExportRenderer, FastJSONRenderer
+from user.serializers import FileUploadSerializer, UserDataSerializer
+from user.views import UserDataViewSet
 
 
+@override_settings(USER_DATA_CACHE_TIMEOUT=0)
 class UserDataViewSetTests(APITestCase):
     def setUp(self):
         self.user_data_1 = UserData.objects.create(
@@ -51,6 +75,26 @@ class UserDataViewSetTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data["results"]), 2)
 
+    @skipUnless(connection.vendor == "postgresql", "requires PostgreSQL")
+    @override_settings(USER_DATA_SEARCH_BACKEND="fulltext")
+    def test_full_text_search_user_data(self):
+        url = reverse("user-list")
+
+        response = self.client.get(url, {"search": "jo"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [row["first_name"] for row in response.data["results"]], ["John"]
+        )
+
+        response = self.client.get(url, {"search": "doe jane"})
+        self.assertEqual(len(response.data["results"]), 1)
+
+        response = self.client.get(url, {"search": "ohn"})
+        self.assertEqual(len(response.data["results"]), 0)
+
+        response = self.client.get(url, {"search": "o'brien & | !"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
     def test_order_user_data(self):
         url = reverse("user-list")
         # Order by first name ascending
@@ -66,12 +110,370 @@ class UserDataViewSetTests(APITestCase):
         self.assertEqual(response.data["results"][0]["first_name"], "John")
 
 
+class SerializerUserDataViewSet(UserDataViewSet):
+    """UserDataViewSet rendered through the serializer and JSONRenderer."""
+
+    renderer_classes = [JSONRenderer]
+    list = ListModelMixin.list
+
+
+@override_settings(USER_DATA_CACHE_TIMEOUT=0)
+class FastListTestCase(APITestCase):
+    def setUp(self):
+        names = [
+            "Zo\u00eb", "\u5f20\u4f1f", 'Quote " and \\ slash',
+            "Line\nbreak\ttab\x01", "Sep\u2028ara\u2029tors", "\U0001f600",
+        ]
+        for index, name in enumerate(names):
+            UserData.objects.create(
+                first_name=name,
+                last_name="Doe",
+                national_id="" if index % 2 else str(index),
+                phone_number=f"555000{index}",
+                email=f"user{index}@example.com",
+                birth_date=f"199{index}-0{index + 1}-1{index}",
+                finger_print_signature=f"signature{index}",
+            )
+
+    def assertSameContent(self, params):
+        factory = APIRequestFactory()
+        fast = UserDataViewSet.as_view({"get": "list"})(
+            factory.get("/v1/users/", params)
+        )
+        reference = SerializerUserDataViewSet.as_view({"get": "list"})(
+            factory.get("/v1/users/", params)
+        )
+        self.assertEqual(fast.render().content, reference.render().content)
+
+    def test_page_is_byte_identical(self):
+        self.assertSameContent({})
+        self.assertSameContent({"page_size": 4, "page": 2})
+        self.assertSameContent({"ordering": "first_name", "search": "Doe"})
+
+    def test_cursor_page_is_byte_identical(self):
+        self.assertSameContent({"pagination": "cursor", "page_size": 4})
+        self.assertSameContent(
+            {"pagination": "cursor", "ordering": "-birth_date"}
+        )
+
+    def test_renderer_matches_json_renderer(self):
+        data = {
+            "text": "\u2028\x1f\u00e9\"",
+            "when": datetime.datetime(
+                2023, 1, 2, 3, 4, 5, 678901, tzinfo=datetime.timezone.utc
+            ),
+            "day": datetime.date(2023, 1, 2),
+            "amount": decimal.Decimal("1.50"),
+            "id": uuid.UUID(int=1),
+            1: [None, True, 1.5],
+        }
+        self.assertEqual(
+            FastJSONRenderer().render(data), JSONRenderer().render(data)
+        )
+        self.assertEqual(
+            FastJSONRenderer().render(data, "application/json; indent=4"),
+            JSONRenderer().render(data, "application/json; indent=4"),
+        )
+
+
+class UserDataCacheTestCase(APITestCase):
+    def setUp(self):
+        UserDataCache.get_cache().clear()
+        self.create_user("John", "1")
+
+    def create_user(self, first_name, signature):
+        UserData.objects.create(
+            first_name=first_name,
+            last_name="Doe",
+            phone_number="1234567890",
+            email=f"{first_name.lower()}@example.com",
+            birth_date="1990-01-01",
+            finger_print_signature=signature,
+        )
+
+    def names(self, response):
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [row["first_name"] for row in response.json()["results"]]
+
+    def test_repeated_query_is_served_from_cache(self):
+        url = reverse("user-list")
+        first = self.client.get(url, {"search": "Doe", "ordering": "email"})
+
+        with self.assertNumQueries(0):
+            second = self.client.get(
+                url, {"ordering": "email", "search": "Doe", "page": ""}
+            )
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second["Content-Type"], first["Content-Type"])
+
+        with self.assertNumQueries(2):
+            self.client.get(url, {"search": "John"})
+
+    def test_bumping_the_generation_invalidates_entries(self):
+        url = reverse("user-list")
+        self.assertEqual(self.names(self.client.get(url)), ["John"])
+
+        self.create_user("Jane", "2")
+        self.assertEqual(self.names(self.client.get(url)), ["John"])
+
+        UserDataCache.bump_generation()
+        self.assertEqual(self.names(self.client.get(url)), ["Jane", "John"])
+
+    def test_lost_generation_starts_a_new_one(self):
+        url = reverse("user-list")
+        self.client.get(url)
+        UserDataCache.get_cache().delete(UserDataCache.GENERATION_KEY)
+
+        self.create_user("Jane", "2")
+        self.assertEqual(self.names(self.client.get(url)), ["Jane", "John"])
+
+    @override_settings(USER_DATA_CACHE_TIMEOUT=0)
+    def test_disabled_cache(self):
+        url = reverse("user-list")
+        self.client.get(url)
+        with self.assertNumQueries(2):
+            self.client.get(url)
+
+    def test_browsable_api_is_not_cached(self):
+        url = reverse("user-list")
+        self.client.get(url, HTTP_ACCEPT="text/html")
+        response = self.client.get(url, HTTP_ACCEPT="text/html")
+        self.assertEqual(response.data["results"][0]["first_name"], "John")
+
+
+class UserDataExportTestCase(APITestCase):
+    def setUp(self):
+        UserData.objects.create(
+            first_name="John",
+            last_name="Doe",
+            phone_number="1234567890",
+            email="john.doe@example.com",
+            birth_date="1990-01-01",
+            finger_print_signature="abceew123eeeee",
+        )
+        UserData.objects.create(
+            first_name="Jane",
+            last_name="Roe, Jr.",
+            phone_number="0987654321",
+            email="jane.roe@example.com",
+            birth_date="1995-01-01",
+            finger_print_signature="asedbceew123",
+        )
+
+    def read(self, response):
+        return b"".join(response.streaming_content).decode()
+
+    def test_export_csv(self):
+        response = self.client.get(
+            reverse("user-export"), {"ordering": "first_name"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response["Content-Type"].startswith("text/csv"))
+        self.assertIn("users.csv", response["Content-Disposition"])
+
+        rows = list(csv.DictReader(io.StringIO(self.read(response))))
+        self.assertEqual(
+            [row["last_name"] for row in rows], ["Roe, Jr.", "Doe"]
+        )
+        self.assertEqual(
+            rows[1],
+            {**UserDataSerializer(UserData.objects.get(first_name="John"))
+             .data, "national_id": "", "address": "", "country": ""},
+        )
+
+    def test_export_ndjson_matches_serializer(self):
+        response = self.client.get(
+            reverse("user-export"), {"format": "ndjson"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response["Content-Type"], "application/x-ndjson; charset=utf-8"
+        )
+
+        lines = self.read(response).splitlines()
+        self.assertEqual(
+            [json.loads(line) for line in lines],
+            UserDataSerializer(UserData.objects.all(), many=True).data,
+        )
+
+    def test_export_honours_filters_and_search(self):
+        response = self.client.get(
+            reverse("user-export"), {"format": "ndjson", "search": "Jane"}
+        )
+        lines = self.read(response).splitlines()
+        self.assertEqual(len(lines), 1)
+
+        response = self.client.get(
+            reverse("user-export"),
+            {"format": "ndjson", "last_name": "Doe"},
+        )
+        lines = self.read(response).splitlines()
+        self.assertEqual(json.loads(lines[0])["first_name"], "John")
+        self.assertEqual(len(lines), 1)
+
+    def test_export_streams_in_chunks(self):
+        with mock.patch.object(CSVExportRenderer, "rows_per_chunk", 1):
+            response = self.client.get(reverse("user-export"))
+            chunks = list(response.streaming_content)
+        # The header is sent with the first row
+        self.assertEqual(len(chunks), 2)
+
+
+@override_settings(USER_DATA_CACHE_TIMEOUT=0)
+class KeysetPaginationTestCase(APITestCase):
+    def setUp(self):
+        for index in range(7):
+            UserData.objects.create(
+                first_name=["Ann", "Bob"][index % 2],
+                last_name=f"Last{index}",
+                phone_number=f"555000{index}",
+                email=f"user{index}@example.com",
+                birth_date="1990-01-01",
+                finger_print_signature=f"signature{index}",
+            )
+
+    def walk(self, params):
+        url = reverse("user-list")
+        response = self.client.get(url, params)
+        pages = []
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            pages.append(response.data["results"])
+            if response.data["next"] is None:
+                return pages
+            response = self.client.get(response.data["next"])
+
+    def test_cursor_pages_cover_every_row_once(self):
+        pages = self.walk({
+            "pagination": "cursor", "page_size": 3, "ordering": "first_name"
+        })
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+
+        rows = [row for page in pages for row in page]
+        expected = list(
+            UserData.objects.order_by("first_name", "id")
+            .values_list("email", flat=True)
+        )
+        self.assertEqual([row["email"] for row in rows], expected)
+
+    def test_descending_cursor_pages(self):
+        pages = self.walk({
+            "pagination": "cursor", "page_size": 2, "ordering": "-first_name"
+        })
+        rows = [row for page in pages for row in page]
+        expected = list(
+            UserData.objects.order_by("-first_name", "-id")
+            .values_list("email", flat=True)
+        )
+        self.assertEqual([row["email"] for row in rows], expected)
+
+    def test_count_is_only_returned_on_request(self):
+        url = reverse("user-list")
+        response = self.client.get(url, {"pagination": "cursor"})
+        self.assertIsNone(response.data["count"])
+
+        response = self.client.get(
+            url, {"pagination": "cursor", "count": "exact", "search": "Ann"}
+        )
+        self.assertEqual(response.data["count"], 4)
+
+    def test_invalid_cursor_returns_not_found(self):
+        url = reverse("user-list")
+        response = self.client.get(
+            url, {"pagination": "cursor", "cursor": "not-a-cursor"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_cursor_with_values_of_the_wrong_type_returns_not_found(self):
+        url = reverse("user-list")
+        for ordering, values in [
+            ("birth_date", ["x", 1]),
+            ("birth_date", [None, 1]),
+            ("first_name", ["Ann", "not-an-id"]),
+            ("first_name", ["Ann", [1]]),
+        ]:
+            cursor = base64.urlsafe_b64encode(
+                json.dumps(values).encode()
+            ).decode()
+            response = self.client.get(url, {
+                "pagination": "cursor", "ordering": ordering,
+                "cursor": cursor,
+            })
+            self.assertEqual(
+                response.status_code, status.HTTP_404_NOT_FOUND, values
+            )
+
+    def test_page_number_pagination_is_the_default(self):
+        response = self.client.get(reverse("user-list"), {"page_size": 5})
+        self.assertEqual(response.data["count"], 7)
+        self.assertEqual(len(response.data["results"]), 5)
+
+    @mock.patch("user.signals.dispatch_upload")
+    def test_file_upload_cursor_pagination(self, dispatch):
+        for index in range(3):
+            FileUpload.objects.create(file=f"media/uploads/{index}.csv")
+
+        response = self.client.get(
+            "/v1/file-upload/", {"pagination": "cursor", "page_size": 2}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["results"]), 2)
+        self.assertIsNotNone(response.data["next"])
+
+        response = self.client.get(response.data["next"])
+        self.assertEqual(len(response.data["results"]), 1)
+        self.assertIsNone(response.data["next"])
+
+    @mock.patch("user.signals.dispatch_upload")
+    def test_file_upload_cursor_starts_with_the_newest(self, dispatch):
+        uploads = [
+            FileUpload.objects.create(file=f"media/uploads/{index}.csv")
+            for index in range(3)
+        ]
+
+        response = self.client.get(
+            "/v1/file-upload/", {"pagination": "cursor", "page_size": 2}
+        )
+        self.assertEqual(
+            [upload["id"] for upload in response.data["results"]],
+            [uploads[2].id, uploads[1].id],
+        )
+
+        response = self.client.get(response.data["next"])
+        self.assertEqual(
+            [upload["id"] for upload in response.data["results"]],
+            [uploads[0].id],
+        )
+
+
+CSV_CONTENT = (
+    b"first_name,last_name,national_id,birth_date,address,"
+    b"country,phone_number,email,finger_print_signature\n"
+    b"John,Doe,1,1990-01-01,123 Main St,USA,"
+    b"1234567890,john@example.com,signature1\n"
+)
+
+
 class FileUploadViewSetTestCase(TestCase):
     def setUp(self):
         self.client = APIClient()
 
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def stored_files(self):
+        directory = os.path.join(self.media_root, "media", "uploads")
+        return sorted(
+            os.path.relpath(os.path.join(root, name), directory)
+            for root, _, names in os.walk(directory)
+            for name in names
+        )
+
     def test_upload_file(self):
-        file_data = io.BytesIO(b"csv_file_content")
+        file_data = io.BytesIO(CSV_CONTENT)
         file = SimpleUploadedFile(
             "file.csv", file_data.getvalue(), content_type="text/csv"
         )
@@ -85,6 +487,183 @@ class FileUploadViewSetTestCase(TestCase):
                 FileUpload.objects.first()).data
         )
 
+    def test_upload_is_stored_in_place_with_its_checksum(self):
+        file = SimpleUploadedFile("file.csv", CSV_CONTENT)
+        with mock.patch(
+            "django.core.files.uploadhandler."
+            "TemporaryFileUploadHandler.new_file"
+        ) as temporary_file:
+            response = self.client.post(
+                "/v1/file-upload/", {"file": file}, format="multipart"
+            )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        temporary_file.assert_not_called()
+
+        file_upload = FileUpload.objects.get()
+        sha256 = hashlib.sha256(CSV_CONTENT).hexdigest()
+        self.assertEqual(file_upload.sha256, sha256)
+        self.assertEqual(
+            file_upload.file.name, f"media/uploads/{sha256[:2]}/{sha256}.csv"
+        )
+        self.assertEqual(file_upload.filename(), "file.csv")
+        self.assertEqual(response.data["sha256"], file_upload.sha256)
+        with file_upload.file.open("rb") as f:
+            self.assertEqual(f.read(), CSV_CONTENT)
+        self.assertEqual(
+            self.stored_files(), [f"{sha256[:2]}/{sha256}.csv"]
+        )
+
+    def test_same_name_uploads_get_distinct_files(self):
+        for row in (b"1,2\n", b"3,4\n"):
+            file = SimpleUploadedFile("file.csv", CSV_CONTENT + row)
+            self.client.post(
+                "/v1/file-upload/", {"file": file}, format="multipart"
+            )
+        names = FileUpload.objects.values_list("file", flat=True)
+        self.assertEqual(len(set(names)), 2)
+        self.assertEqual(len(self.stored_files()), 2)
+
+    @mock.patch("user.signals.dispatch_upload")
+    def test_identical_reupload_is_linked_to_the_first(self, dispatch):
+        first = self.client.post(
+            "/v1/file-upload/",
+            {"file": SimpleUploadedFile("file.csv", CSV_CONTENT)},
+            format="multipart",
+        )
+        second = self.client.post(
+            "/v1/file-upload/",
+            {"file": SimpleUploadedFile("again.csv", CSV_CONTENT)},
+            format="multipart",
+        )
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(second.data["id"], first.data["id"])
+        self.assertEqual(second.data["original_filename"], "file.csv")
+        self.assertEqual(FileUpload.objects.count(), 1)
+        dispatch.assert_called_once()
+        self.assertEqual(dispatch.call_args.args[0].id, first.data["id"])
+        self.assertEqual(len(self.stored_files()), 1)
+
+    @mock.patch("user.signals.dispatch_upload")
+    def test_reupload_of_failed_file_is_processed_again(self, dispatch):
+        self.client.post(
+            "/v1/file-upload/",
+            {"file": SimpleUploadedFile("file.csv", CSV_CONTENT)},
+            format="multipart",
+        )
+        FileUpload.objects.update(status=FileUpload.FILE_STATUS_FAILED)
+
+        response = self.client.post(
+            "/v1/file-upload/",
+            {"file": SimpleUploadedFile("file.csv", CSV_CONTENT)},
+            format="multipart",
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(FileUpload.objects.count(), 2)
+        self.assertEqual(dispatch.call_count, 2)
+        # Both refer to the one stored copy
+        self.assertEqual(len(self.stored_files()), 1)
+
+    def test_upload_with_invalid_header_is_rejected(self):
+        file = SimpleUploadedFile(
+            "file.csv", b"id,name\n1,John\n" * 1000
+        )
+        response = self.client.post(
+            "/v1/file-upload/", {"file": file}, format="multipart"
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertTrue(
+            response.data["error"].startswith("Invalid file header.")
+        )
+        self.assertEqual(FileUpload.objects.count(), 0)
+        self.assertEqual(self.stored_files(), [])
+
+    def test_compressed_csv_is_stored_compressed(self):
+        compressed = gzip.compress(CSV_CONTENT)
+        file = SimpleUploadedFile("file.csv.gz", compressed)
+        response = self.client.post(
+            "/v1/file-upload/", {"file": file}, format="multipart"
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        file_upload = FileUpload.objects.get()
+        self.assertTrue(file_upload.file.name.endswith(".csv.gz"))
+        self.assertEqual(
+            file_upload.sha256, hashlib.sha256(compressed).hexdigest()
+        )
+        with file_upload.file.open("rb") as f:
+            self.assertEqual(f.read(), compressed)
+
+    def test_compressed_csv_with_invalid_header_is_rejected(self):
+        for name, compress in (
+            ("file.csv.gz", gzip.compress),
+            ("file.csv.zst", zstandard.ZstdCompressor().compress),
+        ):
+            with self.subTest(name):
+                file = SimpleUploadedFile(
+                    name, compress(b"id,name\n1,John\n" * 1000)
+                )
+                response = self.client.post(
+                    "/v1/file-upload/", {"file": file}, format="multipart"
+                )
+                self.assertEqual(
+                    response.status_code, status.HTTP_400_BAD_REQUEST
+                )
+                self.assertTrue(
+                    response.data["error"].startswith("Invalid file header.")
+                )
+        self.assertEqual(self.stored_files(), [])
+
+    def test_corrupt_compressed_csv_is_rejected(self):
+        file = SimpleUploadedFile("file.csv.gz", b"not gzip at all")
+        response = self.client.post(
+            "/v1/file-upload/", {"file": file}, format="multipart"
+        )
+        self.assertEqual(
+            response.data, {"error": "Invalid compressed file."}
+        )
+        self.assertEqual(self.stored_files(), [])
+
+    def test_upload_priority_is_stored(self):
+        file = SimpleUploadedFile("file.csv", CSV_CONTENT)
+        response = self.client.post(
+            "/v1/file-upload/",
+            {"file": file, "priority": "high"},
+            format="multipart",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            FileUpload.objects.get().priority, FileUpload.PRIORITY_HIGH
+        )
+
+    def test_invalid_priority_is_rejected(self):
+        file = SimpleUploadedFile("file.csv", CSV_CONTENT)
+        response = self.client.post(
+            "/v1/file-upload/",
+            {"file": file, "priority": "urgent"},
+            format="multipart",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(FileUpload.objects.count(), 0)
+        self.assertEqual(self.stored_files(), [])
+
+    def test_excel_header_is_not_sniffed(self):
+        file = SimpleUploadedFile("file.xlsx", b"PK\x03\x04")
+        response = self.client.post(
+            "/v1/file-upload/", {"file": file}, format="multipart"
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_empty_upload_is_removed(self):
+        file = SimpleUploadedFile("file.csv", b"")
+        response = self.client.post(
+            "/v1/file-upload/", {"file": file}, format="multipart"
+        )
+        self.assertEqual(response.data, {"error": "File is empty."})
+        self.assertEqual(self.stored_files(), [])
+
     def test_upload_invalid_file_type(self):
         file_data = io.BytesIO(
             b"invalid_file_content"
@@ -98,6 +677,193 @@ class FileUploadViewSetTestCase(TestCase):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertEqual(
             response.data, {
-                "error": "Invalid file type. Only CSV files are allowed."}
+                "error": "Invalid file type. "
+                "Only .csv, .csv.gz, .csv.zst, .xls, .xlsx files are allowed."}
+        )
+        self.assertEqual(FileUpload.objects.count(), 0)
+
+
+class ChunkedUploadTestCase(APITestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        patcher = mock.patch("user.signals.dispatch_upload")
+        self.dispatch = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def initiate(self, **data):
+        response = self.client.post(
+            "/v1/file-upload/chunked/", data, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data["id"]
+
+    def complete(self, upload_id):
+        # The parts are moved once the completion commits
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(
+                f"/v1/file-upload/chunked/{upload_id}/complete/"
+            )
+
+    def put_part(self, upload_id, offset, content):
+        return self.client.put(
+            f"/v1/file-upload/chunked/{upload_id}/?offset={offset}",
+            content,
+            content_type="application/octet-stream",
+        )
+
+    def test_parts_are_assembled_on_complete(self):
+        upload_id = self.initiate(filename="chunked.csv", size=12)
+
+        self.assertEqual(
+            self.put_part(upload_id, 0, b"a,b\n").data["offset"], 4
+        )
+        self.assertEqual(
+            self.put_part(upload_id, 4, b"1,2\n3,4\n").data["offset"], 12
+        )
+        self.assertEqual(FileUpload.objects.count(), 0)
+
+        response = self.complete(upload_id)
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        file_upload = FileUpload.objects.get()
+        with file_upload.file.open("rb") as f:
+            self.assertEqual(f.read(), b"a,b\n1,2\n3,4\n")
+        self.dispatch.assert_called_once_with(file_upload)
+        self.assertEqual(
+            ChunkedUpload.objects.get().status, ChunkedUpload.STATUS_COMPLETE
+        )
+
+    def test_identical_chunked_upload_is_linked(self):
+        content = b"a,b\n1,2\n"
+        first = self.initiate(filename="first.csv")
+        self.put_part(first, 0, content)
+        self.complete(first)
+
+        second = self.initiate(filename="second.csv")
+        self.put_part(second, 0, content)
+        response = self.complete(second)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        file_upload = FileUpload.objects.get()
+        self.assertEqual(response.data["id"], file_upload.id)
+        self.assertEqual(
+            ChunkedUpload.objects.get(pk=second).file_upload, file_upload
+        )
+        self.dispatch.assert_called_once_with(file_upload)
+
+    def test_part_at_wrong_offset_returns_current_offset(self):
+        upload_id = self.initiate(filename="chunked.csv")
+        self.put_part(upload_id, 0, b"a,b\n")
+
+        response = self.put_part(upload_id, 2, b"1,2\n")
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data["offset"], 4)
+
+    def test_part_replaces_bytes_left_past_the_offset(self):
+        upload_id = self.initiate(filename="chunked.csv")
+        self.put_part(upload_id, 0, b"a,b\n")
+        path = default_storage.path(
+            ChunkedUpload.objects.get().part_name()
+        )
+        # An append interrupted after writing some of its bytes
+        with open(path, "ab") as part:
+            part.write(b"1,")
+
+        response = self.put_part(upload_id, 4, b"1,2\n")
+
+        self.assertEqual(response.data["offset"], 8)
+        with open(path, "rb") as part:
+            self.assertEqual(part.read(), b"a,b\n1,2\n")
+        self.assertEqual(os.listdir(os.path.dirname(path)), [
+            os.path.basename(path)
+        ])
+
+    def test_part_is_refused_if_another_arrived_while_receiving(self):
+        upload_id = self.initiate(filename="chunked.csv")
+        self.put_part(upload_id, 0, b"a,b\n")
+
+        def another_part_arrives():
+            ChunkedUpload.objects.filter(pk=upload_id).update(offset=8)
+            return ChunkedUpload.objects.all()
+
+        # The offset is checked again once the upload is locked
+        with mock.patch.object(
+            ChunkedUpload.objects, "select_for_update",
+            side_effect=another_part_arrives,
+        ):
+            response = self.put_part(upload_id, 4, b"1,2\n")
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data["offset"], 8)
+
+    def test_failed_completion_leaves_the_parts_for_another_attempt(self):
+        upload_id = self.initiate(filename="chunked.csv")
+        self.put_part(upload_id, 0, b"a,b\n1,2\n")
+
+        with mock.patch.object(
+            FileUpload, "save", side_effect=OperationalError("gone")
+        ), self.assertRaises(OperationalError):
+            self.complete(upload_id)
+
+        self.assertEqual(
+            ChunkedUpload.objects.get().status,
+            ChunkedUpload.STATUS_UPLOADING,
         )
+        response = self.complete(upload_id)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        with FileUpload.objects.get().file.open("rb") as f:
+            self.assertEqual(f.read(), b"a,b\n1,2\n")
+
+    def test_completing_without_parts_on_disk_is_refused(self):
+        upload_id = self.initiate(filename="chunked.csv")
+        self.put_part(upload_id, 0, b"a,b\n")
+        default_storage.delete(ChunkedUpload.objects.get().part_name())
+
+        response = self.complete(upload_id)
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(FileUpload.objects.count(), 0)
+
+    def test_part_added_while_hashing_is_not_lost(self):
+        upload_id = self.initiate(filename="chunked.csv")
+        self.put_part(upload_id, 0, b"a,b\n")
+        checksum = FileReader.checksum
+
+        def checksum_then_append(*args, **kwargs):
+            digest = checksum(*args, **kwargs)
+            self.put_part(upload_id, 4, b"1,2\n")
+            return digest
+
+        with mock.patch(
+            "user.views.FileReader.checksum", checksum_then_append
+        ):
+            response = self.complete(upload_id)
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data["offset"], 8)
+        response = self.complete(upload_id)
+        with FileUpload.objects.get().file.open("rb") as f:
+            self.assertEqual(f.read(), b"a,b\n1,2\n")
+
+    def test_incomplete_upload_is_not_completed(self):
+        upload_id = self.initiate(filename="chunked.csv", size=100)
+        self.put_part(upload_id, 0, b"a,b\n")
+
+        response = self.complete(upload_id)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertEqual(FileUpload.objects.count(), 0)
+
+    def test_initiate_rejects_invalid_file_type(self):
+        response = self.client.post(
+            "/v1/file-upload/chunked/", {"filename": "file.txt"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(ChunkedUpload.objects.count(), 0)
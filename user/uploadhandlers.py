@@ -0,0 +1,185 @@
+import csv
+import hashlib
+import os
+import zlib
+
+import zstandard
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import (
+    FileUploadHandler,
+    StopFutureHandlers,
+    StopUpload,
+)
+
+from .helpers import FileReader, UploadStore
+from .utils import FileExtensionValidator, FileHeaderValidator
+
+
+class StoredUploadedFile(UploadedFile):
+    """
+    An upload that was written straight to its final name in storage.
+
+    ``storage_name`` is the name to give the FileField, which then refers
+    to the file as it is instead of copying it. ``sha256`` is the hex
+    digest of the content. ``name`` is the name the client sent.
+    """
+
+    def __init__(self, file, storage_name, name, content_type, size,
+                 charset, content_type_extra, sha256):
+        super().__init__(
+            file, name, content_type, size, charset, content_type_extra
+        )
+        self.storage_name = storage_name
+        self.sha256 = sha256
+
+
+class DirectStorageUploadHandler(FileUploadHandler):
+    """
+    Upload handler that streams the ``file`` field of a request to disk,
+    hashing it on the way, then moves it to its content-addressed name
+    in UploadStore.
+
+    The file name is checked against the allowed extensions before any
+    content is written, and the header row of a CSV is checked as soon as
+    it has arrived, decompressing the start of a ``.csv.gz`` or
+    ``.csv.zst`` upload to find it. A rejected upload stops the request
+    body from being read any further; the reason is left in ``error``.
+    Other fields, and any further ``file`` parts, go to the next
+    handlers.
+    """
+
+    field_name_to_store = "file"
+    # Bytes of a CSV read while looking for the end of the header row
+    header_sniff_limit = 64 * 1024
+
+    def __init__(self, request=None, allowed_extensions=None):
+        super().__init__(request)
+        self.allowed_extensions = allowed_extensions
+        self.error = None
+        self.storing = False
+        self.stored = None
+
+    def new_file(self, field_name, file_name, *args, **kwargs):
+        super().new_file(field_name, file_name, *args, **kwargs)
+        self.storing = False
+        if field_name != self.field_name_to_store or self.stored is not None:
+            return
+
+        if self.allowed_extensions is not None:
+            validator = FileExtensionValidator(self.allowed_extensions)
+            if not validator.is_valid_extension(file_name):
+                self.reject(
+                    "Invalid file type. Only "
+                    f"{', '.join(self.allowed_extensions)} files are allowed."
+                )
+
+        self.storage_name, self.file = self.open_storage_file()
+        self.sha256 = hashlib.sha256()
+        is_csv = FileReader.split_extension(file_name)[0] == ".csv"
+        self.header = b"" if is_csv else None
+        self.decompressor = FileReader.decompressor(file_name)
+        self.storing = True
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        if not self.storing:
+            return raw_data
+
+        if self.header is not None:
+            self.header += self.decompress(raw_data)
+            if (
+                b"\n" in self.header
+                or len(self.header) >= self.header_sniff_limit
+            ):
+                self.check_header()
+
+        self.file.write(raw_data)
+        self.sha256.update(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        if not self.storing:
+            return None
+        if self.header:
+            # A single-line file never reached the end of its header
+            self.check_header()
+        self.storing = False
+
+        self.file.flush()
+        self.file.seek(0)
+        sha256 = self.sha256.hexdigest()
+        self.storage_name = UploadStore.commit(
+            self.storage_name, sha256, self.file_name
+        )
+        self.stored = StoredUploadedFile(
+            self.file,
+            self.storage_name,
+            self.file_name,
+            self.content_type,
+            file_size,
+            self.charset,
+            self.content_type_extra,
+            sha256,
+        )
+        return self.stored
+
+    def upload_complete(self):
+        # Remove the partial file of an upload that never completed
+        if self.storing:
+            self.discard()
+
+    def upload_interrupted(self):
+        if self.storing:
+            self.discard()
+
+    def decompress(self, data):
+        """
+        Returns the CSV bytes in a chunk of the upload. A compressed file
+        is stored as it was sent; only its start is decompressed, to find
+        the header row.
+        """
+        if self.decompressor is None:
+            return data
+        try:
+            return self.decompressor.decompress(data)
+        except (zlib.error, zstandard.ZstdError):
+            self.reject("Invalid compressed file.")
+
+    def check_header(self):
+        line = self.header.split(b"\n", 1)[0]
+        self.header = None
+        try:
+            headers = next(csv.reader([line.decode("utf-8")]), [])
+        except UnicodeDecodeError:
+            headers = []
+        if not FileHeaderValidator.is_valid_header(headers):
+            self.reject(
+                "Invalid file header. Expected columns: "
+                f"{', '.join(FileHeaderValidator.VALID_HEADERS)}."
+            )
+
+    def reject(self, error):
+        """Records why the upload was refused and stops reading it."""
+        self.error = error
+        if self.storing:
+            self.discard()
+        raise StopUpload(connection_reset=True)
+
+    def discard(self):
+        self.storing = False
+        self.file.close()
+        default_storage.delete(self.storage_name)
+
+    @staticmethod
+    def open_storage_file():
+        """
+        Creates the partial file an upload is written to.
+
+        Returns:
+            tuple: The storage name and the file opened for writing.
+        """
+        name = UploadStore.partial_name()
+        path = default_storage.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return name, open(path, mode="xb+")
@@ -1,25 +1,49 @@
+import contextlib
+import hashlib
+import os
+import shutil
+import uuid
+
+from django.conf import settings
+from django.core.files.storage import default_storage
 from django.db import transaction
-from django.http import Http404
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 
-from rest_framework.parsers import FormParser, MultiPartParser
+from rest_framework.decorators import action
+from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
 from rest_framework import filters
-from rest_framework import pagination
 from rest_framework.viewsets import GenericViewSet
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.mixins import ListModelMixin
 from rest_framework import mixins, status, viewsets
 from rest_framework.permissions import AllowAny
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.response import Response
 
-from .models import UserData, FileUpload
-from .serializers import UserDataSerializer, FileUploadSerializer
+from .cache import UserDataCache
+from .filters import UserDataSearchFilter
+from .helpers import FileReader, UploadStore
+from .metrics import PrometheusMetrics
+from .models import UserData, FileUpload, ChunkedUpload
+from .pagination import KeysetPagination, UserDataPagination
+from .renderers import (
+    CSVExportRenderer,
+    FastJSONRenderer,
+    NDJSONExportRenderer,
+)
+from .serializers import (
+    UserDataSerializer,
+    FileUploadSerializer,
+    ChunkedUploadSerializer,
+)
+from .tasks import INGESTION_QUEUES
+from .uploadhandlers import DirectStorageUploadHandler, StoredUploadedFile
 from .utils import FileExtensionValidator
 
+ALLOWED_UPLOAD_EXTENSIONS = [".csv", ".csv.gz", ".csv.zst", ".xls", ".xlsx"]
 
-class UserPagination(pagination.PageNumberPagination):
-    page_size = 20
-    page_size_query_param = "page_size"
-    max_page_size = 1000
+# Bytes read from the request body at a time when appending a part
+CHUNKED_UPLOAD_READ_SIZE = 64 * 1024
 
 
 class UserDataViewSet(ListModelMixin, GenericViewSet):
@@ -43,6 +67,24 @@ class UserDataViewSet(ListModelMixin, GenericViewSet):
         - search: Search for users based on any of the filter fields
         - ordering: Sort the results by first_name, last_name,
             or birth_date in ascending or descending order
+        - pagination: Set to "cursor" for keyset pagination, which
+            follows "next" links instead of page numbers and stays fast
+            on deep pages. Omits "previous" and only includes "count"
+            when requested with count=approximate or count=exact
+
+        JSON list responses are cached for USER_DATA_CACHE_TIMEOUT
+        seconds per distinct set of query parameters. Entries are
+        invalidated as soon as an upload commits new rows.
+
+        Endpoint: /v1/users/export/
+        Methods: GET
+        Description: Stream every matching row as a CSV or NDJSON
+        download. Takes the same filter, search and ordering parameters
+        as the list, and is not paginated.
+
+        Query Parameters:
+        - format: "csv" (default) or "ndjson"; an Accept header of
+          text/csv or application/x-ndjson also selects the format
 
         Expected Response:
         {
@@ -80,7 +122,7 @@ class UserDataViewSet(ListModelMixin, GenericViewSet):
     queryset = UserData.objects.all()
     filter_backends = [
         DjangoFilterBackend,
-        filters.SearchFilter,
+        UserDataSearchFilter,
         filters.OrderingFilter,
     ]
     filterset_fields = [
@@ -93,7 +135,8 @@ class UserDataViewSet(ListModelMixin, GenericViewSet):
     search_fields = ["first_name", "last_name",
                      "phone_number", "email", "birth_date"]
     ordering_fields = ["first_name", "last_name", "birth_date"]
-    pagination_class = UserPagination
+    pagination_class = UserDataPagination
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
 
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -106,6 +149,76 @@ class UserDataViewSet(ListModelMixin, GenericViewSet):
 
         return queryset
 
+    def list(self, request, *args, **kwargs):
+        # Only JSON is cached; the browsable API is rendered every time
+        cacheable = UserDataCache.enabled() and isinstance(
+            request.accepted_renderer, FastJSONRenderer
+        )
+        if cacheable:
+            generation = UserDataCache.generation()
+            cached = UserDataCache.get(request, generation)
+            if cached is not None:
+                return cached
+
+        response = self.list_rows(request)
+        if cacheable:
+            response.add_post_render_callback(
+                lambda rendered: UserDataCache.set(
+                    request, rendered, generation
+                )
+            )
+        return response
+
+    def list_rows(self, request):
+        # Every serializer field is a plain column that renders as-is, so
+        # rows are read with values() instead of being instantiated and
+        # serialized field by field. id is read for keyset cursors.
+        queryset = self.filter_queryset(self.get_queryset())
+        fields = self.get_serializer_class().Meta.fields
+        rows = queryset.values(*fields, "id")
+
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(self.represent(page, fields))
+        return Response(self.represent(rows, fields))
+
+    @staticmethod
+    def represent(rows, fields):
+        """
+        Returns rows from values() as UserDataSerializer would render them.
+
+        Args:
+            rows (iterable of dict): Rows with at least the given fields.
+            fields (tuple): The serializer fields, in output order.
+
+        Returns:
+            list of dict: One dict per row, holding only those fields.
+        """
+        return [{field: row[field] for field in fields} for row in rows]
+
+    @action(
+        detail=False,
+        methods=["get"],
+        renderer_classes=[CSVExportRenderer, NDJSONExportRenderer],
+    )
+    def export(self, request):
+        queryset = self.filter_queryset(self.get_queryset())
+        fields = UserDataSerializer.Meta.fields
+        # A server-side cursor keeps memory flat however many rows match
+        rows = queryset.values_list(*fields).iterator(
+            chunk_size=settings.USER_DATA_EXPORT_CHUNK_SIZE
+        )
+
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            renderer.stream(fields, rows),
+            content_type=f"{renderer.media_type}; charset={renderer.charset}",
+        )
+        response["Content-Disposition"] = (
+            f'attachment; filename="users.{renderer.format}"'
+        )
+        return response
+
 
 class FileUploadViewSet(
     mixins.CreateModelMixin,
@@ -123,13 +236,24 @@ class FileUploadViewSet(
         - POST /file-upload/
             Creates a new file upload object and saves the uploaded file.
             Request parameters:
-                - file: the CSV file to be uploaded.
+                - priority: optional high, normal (the default) or low.
+                    Orders the upload's ingestion among uploads of a
+                    similar size; small and large files are ingested
+                    from separate queues.
+                - file: the CSV, XLS or XLSX file to be uploaded. A CSV
+                    may be compressed as .csv.gz or .csv.zst; it is
+                    stored compressed and read as it is decompressed.
             Response:
                 - 201 CREATED: Returns the serialized file
                     upload object on success.
+                - 200 OK: Returns the existing file upload object if
+                    the same content was uploaded before and has not
+                    failed; the file is not processed again.
                 - 400 BAD REQUEST: Returns an error message if the
                     file is not uploaded, or if the uploaded file
-                    is empty or not a CSV file.
+                    is empty or not a CSV, XLS or XLSX file. A CSV
+                    whose header row does not have the expected
+                    columns is refused as soon as the header arrives.
 
         - GET /file-upload/<pk>/
             Retrieves a specific file upload object.
@@ -141,13 +265,47 @@ class FileUploadViewSet(
                 if the specified file upload object does not exist.
 
         - GET /file-upload/
-            Retrieves a list of file upload objects.
+            Retrieves a list of file upload objects. Pass
+            pagination=cursor (and optionally page_size) for keyset
+            pagination; the list is otherwise unpaginated.
             Response:
                 - 200 OK: Returns a paginated list of
                     serialized file upload objects on success.
                 - 404 NOT FOUND: Returns an error message if
                     there are no file upload objects.
 
+        Chunked uploads, for files too large to send in one request:
+
+        - POST /file-upload/chunked/
+            Starts a chunked upload.
+            Request parameters:
+                - filename: name of the file being uploaded.
+                - size: optional total size in bytes.
+                - priority: optional high, normal or low.
+            Response:
+                - 201 CREATED: Returns the upload id and offset 0.
+                - 400 BAD REQUEST: If the file type is not allowed.
+
+        - PUT /file-upload/chunked/<id>/?offset=<n>
+            Appends the raw request body to the upload at byte offset n.
+            Response:
+                - 200 OK: Returns the new offset.
+                - 409 CONFLICT: If n is not the number of bytes received
+                    so far; the response holds the offset to resume from.
+
+        - GET /file-upload/chunked/<id>/
+            Returns the offset to resume an interrupted upload from.
+
+        - POST /file-upload/chunked/<id>/complete/
+            Finishes the upload, creates the file upload object and
+            starts processing it.
+            Response:
+                - 201 CREATED: Returns the serialized file upload object.
+                - 200 OK: Returns the existing file upload object if
+                    the same content was uploaded before.
+                - 400 BAD REQUEST: If no bytes or fewer than the
+                    announced size were received.
+
         Example Requests and Responses:
         -------------------------------
 
@@ -178,7 +336,16 @@ class FileUploadViewSet(
             {
                 "id": 1,
                 "file": "http://localhost:8000/media/example.csv",
-                "status": "PENDING"
+                "sha256": "5b1e4c...",
+                "status": "processed",
+                "rows_read": 2,
+                "rows_inserted": 1,
+                "rows_rejected": 1,
+                "rejected_reasons": {"invalid_birth_date": 1},
+                "duplicates_skipped": 0,
+                "bytes_per_second": 1843.2,
+                "rejected_rows_file":
+                    "http://localhost:8000/media/rejected/1.csv"
             }
 
         GET /v1/file-upload/
@@ -205,10 +372,30 @@ class FileUploadViewSet(
     serializer_class = FileUploadSerializer
     permission_classes = [AllowAny]
     queryset = FileUpload.objects.all()
+    pagination_class = KeysetPagination
+
+    def initialize_request(self, request, *args, **kwargs):
+        drf_request = super().initialize_request(request, *args, **kwargs)
+        if self.action == "create":
+            # Write the upload straight to media/uploads/ instead of a
+            # memory or temporary file that is then copied there
+            self.upload_handler = DirectStorageUploadHandler(
+                request, ALLOWED_UPLOAD_EXTENSIONS
+            )
+            request.upload_handlers.insert(0, self.upload_handler)
+        return drf_request
 
     def create(self, request, *args, **kwargs):
         file_obj = request.FILES.get("file")
-        extension_validator = FileExtensionValidator([".csv",])
+        extension_validator = FileExtensionValidator(ALLOWED_UPLOAD_EXTENSIONS)
+
+        # The upload handler stops reading a body it has rejected
+        upload_handler = getattr(self, "upload_handler", None)
+        if upload_handler is not None and upload_handler.error:
+            return Response(
+                {"error": upload_handler.error},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
 
         # Check if file exists and is not empty
         if not file_obj:
@@ -217,6 +404,7 @@ class FileUploadViewSet(
                 status=status.HTTP_400_BAD_REQUEST,
             )
         elif file_obj.size == 0:
+            self.discard_upload(file_obj)
             return Response(
                 {"error": "File is empty."},
                 status=status.HTTP_400_BAD_REQUEST,
@@ -229,10 +417,42 @@ class FileUploadViewSet(
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
+        priority = request.data.get("priority", FileUpload.PRIORITY_NORMAL)
+        if priority not in dict(FileUpload.PRIORITIES):
+            self.discard_upload(file_obj)
+            return Response(
+                {"error": "Invalid priority. Use one of: high, normal, low."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        if isinstance(file_obj, StoredUploadedFile):
+            # Already in place; the field only needs its name
+            file, sha256 = file_obj.storage_name, file_obj.sha256
+        else:
+            digest = hashlib.sha256()
+            for chunk in file_obj.chunks():
+                digest.update(chunk)
+            file, sha256 = file_obj, digest.hexdigest()
+
+        # Link a re-sent file to the upload that already has its content.
+        # Two identical uploads arriving together may both be ingested,
+        # which only costs time: the second finds every row a duplicate.
+        existing = FileUpload.find_duplicate(sha256)
+        if existing is not None:
+            self.discard_upload(file_obj)
+            return Response(
+                FileUploadSerializer(existing).data,
+                status=status.HTTP_200_OK,
+            )
+
         # Save file upload object
         with transaction.atomic():
             file_upload = FileUpload(
-                file=file_obj, status=FileUpload.FILE_STATUS_PENDING
+                file=file,
+                sha256=sha256,
+                original_filename=file_obj.name,
+                priority=priority,
+                status=FileUpload.FILE_STATUS_PENDING,
             )
             file_upload.save()
 
@@ -241,6 +461,19 @@ class FileUploadViewSet(
             status=status.HTTP_201_CREATED
         )
 
+    @staticmethod
+    def discard_upload(file_obj):
+        """
+        Drops the stored copy of a refused or re-sent file, unless it is
+        the content file other uploads refer to.
+        """
+        if not isinstance(file_obj, StoredUploadedFile):
+            return
+        file_obj.close()
+        name = file_obj.storage_name
+        if not FileUpload.objects.filter(file=name).exists():
+            default_storage.delete(name)
+
     def retrieve(self, request, pk=None, *args, **kwargs):
         try:
             file_upload = self.get_object()
@@ -259,3 +492,262 @@ class FileUploadViewSet(
 
         serializer = FileUploadSerializer(queryset, many=True)
         return Response(serializer.data)
+
+    @action(
+        detail=False,
+        methods=["post"],
+        url_path="chunked",
+        parser_classes=[JSONParser, FormParser],
+    )
+    def initiate_chunked(self, request):
+        serializer = ChunkedUploadSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                serializer.errors, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        extension_validator = FileExtensionValidator(ALLOWED_UPLOAD_EXTENSIONS)
+        if not extension_validator.is_valid_extension(
+            serializer.validated_data["filename"]
+        ):
+            return Response(
+                {"error": f"Invalid file type. Only {', '.join(extension_validator.allowed_extensions)} files are allowed."},# noqa
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        chunked_upload = serializer.save()
+        return Response(
+            ChunkedUploadSerializer(chunked_upload).data,
+            status=status.HTTP_201_CREATED,
+        )
+
+    @action(
+        detail=False,
+        methods=["get", "put"],
+        url_path=r"chunked/(?P<upload_id>[0-9a-f-]+)",
+    )
+    def chunked_part(self, request, upload_id=None):
+        if request.method == "GET":
+            try:
+                chunked_upload = ChunkedUpload.objects.get(pk=upload_id)
+            except ChunkedUpload.DoesNotExist:
+                return Response(status=status.HTTP_404_NOT_FOUND)
+            return Response(ChunkedUploadSerializer(chunked_upload).data)
+
+        try:
+            offset = int(request.query_params["offset"])
+        except (KeyError, ValueError):
+            return Response(
+                {"error": "A numeric offset query parameter is required."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            chunked_upload = ChunkedUpload.objects.get(pk=upload_id)
+        except ChunkedUpload.DoesNotExist:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        conflict = self.check_part_offset(chunked_upload, offset)
+        if conflict is not None:
+            return conflict
+
+        # Receive the body into a file of its own first, so the upload is
+        # not locked for as long as a slow client takes to send it
+        path = default_storage.path(chunked_upload.part_name())
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        received = f"{path}.{uuid.uuid4().hex}"
+        try:
+            with open(received, mode="wb") as part:
+                stream = request.stream
+                while stream is not None:
+                    data = stream.read(CHUNKED_UPLOAD_READ_SIZE)
+                    if not data:
+                        break
+                    part.write(data)
+
+            # Lock the upload so parts of the same file are appended in
+            # turn, and check again that no other part got there first
+            with transaction.atomic():
+                try:
+                    chunked_upload = (
+                        ChunkedUpload.objects.select_for_update().get(
+                            pk=upload_id
+                        )
+                    )
+                except ChunkedUpload.DoesNotExist:
+                    return Response(status=status.HTTP_404_NOT_FOUND)
+                conflict = self.check_part_offset(chunked_upload, offset)
+                if conflict is not None:
+                    return conflict
+
+                with open(path, mode="ab") as part, \
+                        open(received, mode="rb") as data:
+                    # Drop anything an interrupted append left past the
+                    # offset; appends then continue from there
+                    part.truncate(chunked_upload.offset)
+                    part.seek(chunked_upload.offset)
+                    shutil.copyfileobj(data, part, CHUNKED_UPLOAD_READ_SIZE)
+                    chunked_upload.offset = part.tell()
+                chunked_upload.save()
+        finally:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(received)
+
+        return Response(ChunkedUploadSerializer(chunked_upload).data)
+
+    @staticmethod
+    def check_part_offset(chunked_upload, offset):
+        """
+        Refuses a part for an upload that is complete, or that does not
+        start at the bytes received so far.
+
+        Returns:
+            Response: The 409 response to send, or None if the part can
+            be appended.
+        """
+        if chunked_upload.status != ChunkedUpload.STATUS_UPLOADING:
+            return Response(
+                {"error": "Upload is already complete."},
+                status=status.HTTP_409_CONFLICT,
+            )
+        if offset != chunked_upload.offset:
+            return Response(
+                {
+                    "error": "Offset does not match the bytes received.",
+                    "offset": chunked_upload.offset,
+                },
+                status=status.HTTP_409_CONFLICT,
+            )
+        return None
+
+    @action(
+        detail=False,
+        methods=["post"],
+        url_path=r"chunked/(?P<upload_id>[0-9a-f-]+)/complete",
+    )
+    def complete_chunked(self, request, upload_id=None):
+        try:
+            chunked_upload = ChunkedUpload.objects.get(pk=upload_id)
+        except ChunkedUpload.DoesNotExist:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        refused = self.check_complete(chunked_upload)
+        if refused is not None:
+            return refused
+
+        # Hash the assembled parts before locking the upload, since a
+        # large file takes a while; a part appended meanwhile changes the
+        # offset, which is checked again under the lock
+        offset = chunked_upload.offset
+        part_name = chunked_upload.part_name()
+        try:
+            sha256 = FileReader.checksum(
+                default_storage.path(part_name), size=offset
+            )
+        except FileNotFoundError:
+            return self.missing_parts()
+        name = UploadStore.content_name(sha256, chunked_upload.filename)
+
+        with transaction.atomic():
+            try:
+                chunked_upload = ChunkedUpload.objects.select_for_update().get(
+                    pk=upload_id
+                )
+            except ChunkedUpload.DoesNotExist:
+                return Response(status=status.HTTP_404_NOT_FOUND)
+            refused = self.check_complete(chunked_upload)
+            if refused is not None:
+                return refused
+            if chunked_upload.offset != offset:
+                return Response(
+                    {
+                        "error": "A part was added while completing.",
+                        "offset": chunked_upload.offset,
+                    },
+                    status=status.HTTP_409_CONFLICT,
+                )
+            if not default_storage.exists(part_name):
+                return self.missing_parts()
+
+            def store_parts():
+                # Drop anything an interrupted append left past the offset
+                os.truncate(default_storage.path(part_name), offset)
+                UploadStore.commit(part_name, sha256, chunked_upload.filename)
+
+            # The parts are moved to their content name only once the
+            # upload is committed as complete, and before the new file
+            # upload object is dispatched, so a rollback leaves them in
+            # place for another attempt
+            transaction.on_commit(store_parts)
+
+            # Link the upload that already has that content or create the
+            # file upload object, which starts processing
+            file_upload = FileUpload.find_duplicate(sha256)
+            created = file_upload is None
+            if created:
+                file_upload = FileUpload(
+                    file=name,
+                    sha256=sha256,
+                    original_filename=chunked_upload.filename,
+                    priority=chunked_upload.priority,
+                    status=FileUpload.FILE_STATUS_PENDING,
+                )
+                file_upload.save()
+
+            chunked_upload.file_upload = file_upload
+            chunked_upload.complete()
+            chunked_upload.save()
+
+        return Response(
+            FileUploadSerializer(file_upload).data,
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK,
+        )
+
+    @staticmethod
+    def check_complete(chunked_upload):
+        """
+        Refuses to complete an upload that is already complete, empty, or
+        shorter than the size the client announced.
+
+        Returns:
+            Response: The error response to send, or None if the upload
+            can be completed.
+        """
+        if chunked_upload.status != ChunkedUpload.STATUS_UPLOADING:
+            return Response(
+                {"error": "Upload is already complete."},
+                status=status.HTTP_409_CONFLICT,
+            )
+        if chunked_upload.offset == 0:
+            return Response(
+                {"error": "File is empty."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if (
+            chunked_upload.size is not None
+            and chunked_upload.offset != chunked_upload.size
+        ):
+            return Response(
+                {
+                    "error": "Upload is incomplete.",
+                    "offset": chunked_upload.offset,
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return None
+
+    @staticmethod
+    def missing_parts():
+        return Response(
+            {"error": "The parts received are missing; start a new upload."},
+            status=status.HTTP_409_CONFLICT,
+        )
+
+
+def metrics(request):
+    """
+    Serves the Prometheus metrics of the web and worker processes, with
+    the number of uploads by status and the ingestion queue depths.
+    """
+    return HttpResponse(
+        PrometheusMetrics.render(INGESTION_QUEUES),
+        content_type=PrometheusMetrics.CONTENT_TYPE,
+    )